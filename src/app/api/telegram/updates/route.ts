@@ -13,11 +13,23 @@ interface TelegramEvent {
     timestamp: string;
 }
 
+/** Per-event outcome, in request order (lets the bot push events in batches). */
+interface TelegramEventResult {
+    index: number;
+    ok: boolean;
+    error?: string;
+    /** true when the failure was unexpected (e.g. DB error) and a resend may succeed */
+    retryable?: boolean;
+}
+
 /**
  * POST /api/telegram/updates
  *
  * Receives events from the Telegram bot (task completions)
  * and applies them to the database. Protected by API key.
+ *
+ * Response: { processed, total, errors?, results } — `results` has one
+ * entry per event, in request order.
  */
 export async function POST(request: Request) {
     // ── Auth ──
@@ -38,12 +50,22 @@ export async function POST(request: Request) {
 
         let processed = 0;
         const errors: string[] = [];
+        const results: TelegramEventResult[] = [];
+
+        for (const [index, event] of events.entries()) {
+            const succeed = () => {
+                processed++;
+                results.push({ index, ok: true });
+            };
+            const fail = (error: string, retryable = false) => {
+                errors.push(error);
+                results.push({ index, ok: false, error, ...(retryable ? { retryable } : {}) });
+            };
 
-        for (const event of events) {
             try {
                 // A.1: explicitly reject unsupported event types
                 if (event.type !== 'TASK_COMPLETED') {
-                    errors.push(
+                    fail(
                         `Unsupported event type: "${event.type}" — only TASK_COMPLETED is supported`
                     );
                     console.warn(
@@ -62,7 +84,7 @@ export async function POST(request: Request) {
                         event.worker_id.trim().length === 0 ||
                         event.worker_id.length > 256
                     ) {
-                        errors.push('Invalid task_id or worker_id format');
+                        fail('Invalid task_id or worker_id format');
                         continue;
                     }
 
@@ -78,12 +100,12 @@ export async function POST(request: Request) {
                     });
 
                     if (!task) {
-                        errors.push(`Task ${event.task_id} not found`);
+                        fail(`Task ${event.task_id} not found`);
                         continue;
                     }
 
                     if (task.status === 'COMPLETED') {
-                        processed++;
+                        succeed();
                         continue;
                     }
 
@@ -94,7 +116,7 @@ export async function POST(request: Request) {
                     });
 
                     if (!workerInTenant) {
-                        errors.push(
+                        fail(
                             `Worker ${event.worker_id} not found in tenant for task ${event.task_id}`
                         );
                         continue;
@@ -105,7 +127,7 @@ export async function POST(request: Request) {
                     );
 
                     if (!isAssigned) {
-                        errors.push(
+                        fail(
                             `Worker ${event.worker_id} not assigned to task ${event.task_id}`
                         );
                         continue;
@@ -116,7 +138,7 @@ export async function POST(request: Request) {
                         ? new Date(rawTimestamp)
                         : new Date(NaN);
                     if (isNaN(completedAt.getTime())) {
-                        errors.push(
+                        fail(
                             `Invalid timestamp "${rawTimestamp}" (type: ${typeof rawTimestamp}) for event on task ${event.task_id}`
                         );
                         continue;
@@ -149,7 +171,7 @@ export async function POST(request: Request) {
                             (txError as { code: string }).code === 'P2002'
                         ) {
                             // Duplicate completion — treat as already completed
-                            processed++;
+                            succeed();
                             continue;
                         }
                         throw txError;
@@ -167,12 +189,14 @@ export async function POST(request: Request) {
                         revalidatePath(path);
                     }
 
-                    processed++;
+                    succeed();
+                } else {
+                    fail('Missing task_id');
                 }
             } catch (eventError) {
                 const msg =
                     eventError instanceof Error ? eventError.message : String(eventError);
-                errors.push(`Event ${event.type}: ${msg}`);
+                fail(`Event ${event.type}: ${msg}`, true);
             }
         }
 
@@ -180,6 +204,7 @@ export async function POST(request: Request) {
             processed,
             total: events.length,
             errors: errors.length > 0 ? errors : undefined,
+            results,
         });
     } catch (error) {
         console.error('[Telegram Updates API] Error:', error);
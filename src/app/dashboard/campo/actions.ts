@@ -209,6 +209,7 @@ export async function createTaskAction(formData: FormData) {
   }> = [];
   const assignedWorkers: Array<{ id: string; phone: string | null }> = [];
   const lotDisplayById = new Map<string, string>();
+  const lotNamesById = new Map<string, { lotName: string; fieldName?: string }>();
 
   await prisma.$transaction(
     async (tx) => {
@@ -229,6 +230,7 @@ export async function createTaskAction(formData: FormData) {
       for (const lot of lots) {
         const fieldLabel = lot.field?.name ? ` - ${lot.field.name}` : '';
         lotDisplayById.set(lot.id, `${lot.name}${fieldLabel}`);
+        lotNamesById.set(lot.id, { lotName: lot.name, fieldName: lot.field?.name });
       }
 
       const workers = workerIds.length
@@ -327,6 +329,7 @@ export async function createTaskAction(formData: FormData) {
       taskType: task.taskType,
       dueDate: task.dueDate.toISOString().split('T')[0],
       lotDisplay: lotDisplayById.get(task.lotId) ?? task.lotId,
+      ...lotNamesById.get(task.lotId),
       tenantName,
     }));
 
@@ -1,3 +1,4 @@
+import { randomUUID } from 'node:crypto';
 import { mkdir, readFile, rename, writeFile } from 'node:fs/promises';
 import path from 'node:path';
 
@@ -6,6 +7,9 @@ type TaskNotification = {
   taskType: string;
   dueDate: string;
   lotDisplay: string;
+  /** Lot and field names, used by the bot to group digests */
+  lotName?: string;
+  fieldName?: string;
   tenantName?: string;
 };
 
@@ -165,12 +169,55 @@ async function sendTelegramMessage(
   return true;
 }
 
-async function enqueueNotification(payload: {
+type QueuedNotification = {
+  id: string;
   type: 'TASK_ASSIGNED';
   message: string;
   workers: Array<{ id: string; phone?: string | null }>;
+  tasks: TaskNotification[];
   created_at: string;
-}): Promise<void> {
+};
+
+/**
+ * Hand the notification to the bot's intake endpoint
+ * (POST /internal/notifications) when TELEGRAM_NOTIFY_URL is set.
+ * Returns false if not configured or the bot did not accept it.
+ */
+async function pushNotificationToBot(payload: QueuedNotification): Promise<boolean> {
+  const url = process.env.TELEGRAM_NOTIFY_URL;
+  const secret = process.env.TELEGRAM_NOTIFY_SECRET;
+  if (!url || !secret) return false;
+
+  try {
+    const response = await fetch(url, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Authorization: `Bearer ${secret}`,
+      },
+      body: JSON.stringify({ events: [payload] }),
+      signal: AbortSignal.timeout(5000),
+    });
+    if (!response.ok) {
+      console.warn(
+        `[Telegram] Notification intake rejected the event: ${response.status}`
+      );
+      return false;
+    }
+    return true;
+  } catch (error) {
+    console.warn('[Telegram] Notification intake unreachable:', error);
+    return false;
+  }
+}
+
+async function enqueueNotification(
+  notification: Omit<QueuedNotification, 'id'>
+): Promise<void> {
+  const payload: QueuedNotification = { id: randomUUID(), ...notification };
+  if (await pushNotificationToBot(payload)) return;
+
+  // Fallback: the bot watches this file and imports it
   const dir = path.dirname(TELEGRAM_NOTIFICATIONS_PATH);
   await mkdir(dir, { recursive: true });
 
@@ -201,6 +248,18 @@ export async function notifyWorkersNewTasks({
   const message = buildTasksMessage(tasks);
   const createdAt = new Date().toISOString();
 
+  // With the bot's intake configured, it delivers (rate-limited, coalesced into digests)
+  if (process.env.TELEGRAM_NOTIFY_URL) {
+    await enqueueNotification({
+      type: 'TASK_ASSIGNED',
+      message,
+      workers,
+      tasks,
+      created_at: createdAt,
+    });
+    return;
+  }
+
   const token = await loadTelegramBotToken();
   if (!token) {
     console.warn('[Telegram] TELEGRAM_BOT_TOKEN not set. Skipping notifications.');
@@ -208,6 +267,7 @@ export async function notifyWorkersNewTasks({
       type: 'TASK_ASSIGNED',
       message,
       workers,
+      tasks,
       created_at: createdAt,
     });
     return;
@@ -220,6 +280,7 @@ export async function notifyWorkersNewTasks({
       type: 'TASK_ASSIGNED',
       message,
       workers,
+      tasks,
       created_at: createdAt,
     });
     return;
@@ -265,6 +326,7 @@ export async function notifyWorkersNewTasks({
       type: 'TASK_ASSIGNED',
       message,
       workers: pendingWorkers,
+      tasks,
       created_at: createdAt,
     });
   }
@@ -0,0 +1,230 @@
+"""
+api_client.py — Pooled asyncio HTTP client for the Seedor API
+=============================================================
+One aiohttp session per process, shared by every caller: keep-alive
+connections are reused across requests (no TCP+TLS handshake per call),
+connections per host are capped, gzip responses are decoded
+transparently, and calls are native coroutines, so handlers never tie
+up executor threads while waiting on the network.
+
+Each endpoint sits behind a circuit breaker (circuit_breaker.py): while
+the API keeps failing, calls fail fast with CircuitOpenError instead of
+waiting through timeouts and retries.
+
+The session is created lazily inside the running event loop and must be
+closed with `await client.close()` on shutdown.
+
+Usage:
+    api = SeedorApiClient(API_URL, API_KEY)
+    data = await api.get_json("/api/telegram/worker-lookup", params={"phone": p})
+    result = await api.post_json("/api/telegram/updates", {"events": [event]})
+    resp = await api.request("GET", path, headers={"If-None-Match": etag})
+    await api.close()
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, Optional
+
+import aiohttp
+
+from logger import get_logger
+from retry import classify_error, remaining_budget
+from circuit_breaker import CircuitBreakerRegistry, endpoint_key
+
+log = get_logger("api_client")
+
+# Pool sizing (per process)
+API_POOL_LIMIT = int(os.environ.get("SEEDOR_API_POOL_LIMIT", "100"))
+API_POOL_LIMIT_PER_HOST = int(os.environ.get("SEEDOR_API_POOL_LIMIT_PER_HOST", "20"))
+API_KEEPALIVE_SECONDS = float(os.environ.get("SEEDOR_API_KEEPALIVE_SECONDS", "30"))
+
+
+class ApiError(Exception):
+    """Non-success HTTP response from the Seedor API."""
+
+    def __init__(
+        self,
+        status: int,
+        method: str,
+        path: str,
+        body: str = "",
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(f"{method} {path} → HTTP {status}")
+        self.status = status
+        self.method = method
+        self.path = path
+        self.body = body
+        self.retry_after = retry_after
+
+
+class ApiResponse:
+    """Raw response: status, headers and the (decompressed) body."""
+
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers: dict[str, str], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self) -> Any:
+        return json.loads(self.body.decode("utf-8")) if self.body else {}
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After in seconds (only the delta-seconds form is supported)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class SeedorApiClient:
+    """Shared keep-alive client for the Seedor API."""
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        timeout: float = 15.0,
+        limit: int = API_POOL_LIMIT,
+        limit_per_host: int = API_POOL_LIMIT_PER_HOST,
+        keepalive_timeout: float = API_KEEPALIVE_SECONDS,
+    ):
+        self._base_url = base_url.rstrip("/")
+        self._api_key = api_key
+        self._timeout = timeout
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.breakers = CircuitBreakerRegistry()
+
+    def circuit_open(self, path: str) -> bool:
+        """True if calls to this endpoint are currently being short-circuited."""
+        breaker = self.breakers.find(endpoint_key(path))
+        return breaker is not None and breaker.is_open()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._limit,
+                limit_per_host=self._limit_per_host,
+                keepalive_timeout=self._keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={
+                    "Authorization": f"Bearer {self._api_key}",
+                    "Accept-Encoding": "gzip, deflate",
+                },
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+                auto_decompress=True,
+            )
+        return self._session
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: Optional[dict[str, str]] = None,
+        json_body: Optional[dict] = None,
+        headers: Optional[dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> ApiResponse:
+        """Send a request and return the raw response.
+
+        2xx and 304 are returned; any other status raises ApiError.
+        Connection problems raise aiohttp.ClientError / asyncio.TimeoutError.
+        Inside a retry_deadline block the timeout is capped to what is left.
+        Raises CircuitOpenError (without sending) while the endpoint's
+        circuit is open.
+        """
+        budget = remaining_budget()
+        if budget is not None:
+            if budget <= 0:
+                raise asyncio.TimeoutError(f"{method} {path}: retry deadline exceeded")
+            timeout = min(timeout if timeout is not None else self._timeout, budget)
+
+        breaker = self.breakers.get(endpoint_key(path))
+        breaker.before_call()
+        try:
+            resp = await self._send(method, path, params, json_body, headers, timeout)
+        except Exception as e:
+            if classify_error(e)[0]:
+                breaker.record_failure()
+            else:
+                breaker.record_success()  # the API answered (e.g. 404)
+            raise
+        except BaseException:
+            breaker.release()  # cancelled: no verdict on the endpoint
+            raise
+        breaker.record_success()
+        return resp
+
+    async def _send(
+        self,
+        method: str,
+        path: str,
+        params: Optional[dict[str, str]],
+        json_body: Optional[dict],
+        headers: Optional[dict[str, str]],
+        timeout: Optional[float],
+    ) -> ApiResponse:
+        session = self._get_session()
+        kwargs: dict[str, Any] = {}
+        if params:
+            kwargs["params"] = params
+        if json_body is not None:
+            kwargs["json"] = json_body
+        if headers:
+            kwargs["headers"] = headers
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+
+        async with session.request(method, f"{self._base_url}{path}", **kwargs) as resp:
+            body = await resp.read()
+            if resp.status >= 400 or (resp.status >= 300 and resp.status != 304):
+                text = body.decode("utf-8", errors="replace")[:500]
+                log.error(
+                    "API HTTP error",
+                    method=method,
+                    path=path,
+                    status_code=resp.status,
+                    response=text,
+                )
+                raise ApiError(
+                    resp.status,
+                    method,
+                    path,
+                    body=text,
+                    retry_after=_parse_retry_after(resp.headers.get("Retry-After")),
+                )
+            return ApiResponse(resp.status, dict(resp.headers), body)
+
+    async def get_json(
+        self,
+        path: str,
+        params: Optional[dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        resp = await self.request("GET", path, params=params, timeout=timeout)
+        return resp.json()
+
+    async def post_json(
+        self, path: str, body: dict, timeout: Optional[float] = None
+    ) -> Any:
+        resp = await self.request("POST", path, json_body=body, timeout=timeout)
+        return resp.json()
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -2,7 +2,7 @@
 bot.py — Seedor Telegram Bot (Async)
 =====================================
 Reads from data/snapshot.json (NEVER from the production DB).
-Writes worker actions to data/updates_queue.json.
+Writes worker actions the API could not take to data/updates_journal/.
 
 Phase 0 improvements:
   - Structured JSON logging (logger.py)
@@ -18,11 +18,11 @@ import asyncio
 import json
 import os
 import re
-import tempfile
+import time
 from collections import OrderedDict
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Union
 
 # ─── Load .env (minimal, no dependency) ────────────────────
 def _load_dotenv(path: str) -> None:
@@ -41,8 +41,26 @@ _load_dotenv(str(Path(__file__).parent / ".env"))
 
 # ─── Structured logging ──────────────────────────────────
 from logger import get_logger
-from retry import retry_with_backoff, DeadLetterQueue
+from retry import RetryPolicy, retry_deadline
+from dead_letter import DeadLetterQueue
 from bot_registry import BotRegistry
+from metrics import metrics
+from snapshot_cache import SnapshotCache, tenant_snapshot_path
+from snapshot_store import last_refreshed, mark_checked, write_snapshot_file
+from snapshot_index import SnapshotIndex, normalize_phone as _normalize_phone
+from snapshot_binary import BinarySnapshot, BinarySnapshotCache, binary_path, write_binary_snapshot
+from snapshot_model import SnapshotModel
+from single_flight import SingleFlight
+from delta_sync import DeltaSyncClient
+from api_client import SeedorApiClient
+from circuit_breaker import CircuitOpenError
+from event_journal import EventJournal
+from send_scheduler import SendScheduler, PRIORITY_BULK
+from notification_queue import NotificationQueue, FileWatcher, recipient_key, take_legacy_file
+from notification_digest import DigestBatcher
+from update_processor import FairUpdateProcessor
+from refresh_scheduler import RefreshScheduler
+from refresh_lease import RefreshLeases
 
 log = get_logger("bot")
 
@@ -69,34 +87,59 @@ from telegram.ext import (
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 SNAPSHOT_PATH = os.path.join(DATA_DIR, "snapshot.json")  # legacy / fallback
-UPDATES_PATH = os.path.join(DATA_DIR, "updates_queue.json")
+UPDATES_PATH = os.path.join(DATA_DIR, "updates_queue.json")  # legacy, migrated to the journal
+UPDATES_JOURNAL_DIR = Path(DATA_DIR) / "updates_journal"
 SESSIONS_PATH = os.path.join(DATA_DIR, "sessions.json")
 NOTIFICATIONS_PATH = os.path.join(DATA_DIR, "notifications_queue.json")
-DLQ_PATH = Path(DATA_DIR) / "dead_letter.json"
+NOTIFICATIONS_SPOOL_PATH = os.path.join(DATA_DIR, "notifications_spool.jsonl")
+DLQ_PATH = Path(DATA_DIR) / "dead_letter.db"
+LEGACY_DLQ_PATH = Path(DATA_DIR) / "dead_letter.json"  # migrated on startup
+LEASES_DIR = Path(DATA_DIR) / "leases"
 
 
 def _snapshot_path(tenant_id: str = "") -> str:
     """Return the per-tenant snapshot path, or the global fallback."""
     if tenant_id:
-        safe = re.sub(r"[^a-zA-Z0-9_-]", "_", tenant_id)
-        return os.path.join(DATA_DIR, f"snapshot_{safe}.json")
+        return tenant_snapshot_path(DATA_DIR, tenant_id)
     return SNAPSHOT_PATH
 
 # ─── Dead-letter queue ────────────────────────────────────
-dlq = DeadLetterQueue(DLQ_PATH)
+dlq = DeadLetterQueue(DLQ_PATH, legacy_json=LEGACY_DLQ_PATH)
+metrics.register_collector("dead_letter", dlq.stats)
+
+# ─── Updates journal (events waiting for sync_service) ────
+updates_journal = EventJournal(UPDATES_JOURNAL_DIR)
+metrics.register_collector("updates_journal", updates_journal.stats)
 
 # ─── Registry (replaces raw session dicts) ────────────────
 registry = BotRegistry(SESSIONS_PATH)
+metrics.register_collector("sessions", registry.stats)
+
+# ─── Update processing (concurrent, ordered per chat, fair per tenant) ──
+update_processor = FairUpdateProcessor(tenant_of=registry.get_tenant_id)
+metrics.register_collector("update_processor", update_processor.stats)
+
+# ─── Notification intake (HTTP push + legacy file) ─────────
+notification_queue = NotificationQueue(Path(NOTIFICATIONS_SPOOL_PATH))
+metrics.register_collector("notifications", notification_queue.stats)
+notification_digests = DigestBatcher()
+metrics.register_collector("notification_digests", notification_digests.stats)
+# A worker who opens the bot gets their waiting notifications right away
+registry.add_identity_listener(
+    lambda chat_id, worker_id, phone: notification_queue.expedite(worker_id, phone)
+)
+
+# ─── Outbound send scheduler (rate limits + priority lanes) ──
+send_scheduler = SendScheduler()
+metrics.register_collector("send_scheduler", send_scheduler.stats)
 
-# Legacy aliases for code that still uses the old names
+# Legacy read-only aliases; all writes go through registry methods so its
+# worker/phone reverse indexes stay in step.
 _authenticated_workers = registry.workers
 _authenticated_phones = registry.phones
 _selected_tenants = registry.tenants
 _worker_tenants = registry.available
 
-def _save_sessions() -> None:
-    registry.save()
-
 # task_id → new status (local overrides for immediate UX)
 _local_task_overrides: dict[str, str] = {}
 
@@ -115,43 +158,152 @@ def _resolve_api_key() -> tuple[str, str]:
 
 
 API_KEY, API_KEY_SOURCE = _resolve_api_key()
+
+# Shared keep-alive client (session is created lazily in the bot's loop)
+api = SeedorApiClient(API_URL, API_KEY)
+metrics.register_collector("circuit_breakers", api.breakers.stats)
 # SEEDOR_TENANT_ID removed — tenant is resolved per-session from BotRegistry
 SNAPSHOT_TTL_SECONDS = int(os.environ.get("SEEDOR_SNAPSHOT_TTL_SECONDS", "30"))
+# Task listings older than the TTL but within this bound are shown at once and
+# refreshed in the background; only older (or missing) snapshots block a reply.
+SNAPSHOT_MAX_STALENESS_SECONDS = int(os.environ.get("SEEDOR_SNAPSHOT_MAX_STALENESS_SECONDS", "600"))
+# Edit a stale-served listing once the background refresh finds changes
+SNAPSHOT_SWR_EDIT = os.environ.get("SEEDOR_SNAPSHOT_SWR_EDIT", "1") != "0"
 NOTIFICATION_POLL_SECONDS = int(os.environ.get("SEEDOR_NOTIFICATION_POLL_SECONDS", "15"))
+SNAPSHOT_CACHE_MAX_MB = int(os.environ.get("SEEDOR_SNAPSHOT_CACHE_MAX_MB", "256"))
+# After a successful refresh, further refresh requests for the same tenant
+# within this window reuse it instead of hitting the API again.
+SNAPSHOT_REFRESH_QUIET_SECONDS = float(os.environ.get("SEEDOR_SNAPSHOT_REFRESH_QUIET_SECONDS", "5"))
+# Incremental sync (conditional GET + deltas, see delta_sync.py); 0 = always full
+DELTA_SYNC_ENABLED = os.environ.get("SEEDOR_DELTA_SYNC", "1") != "0"
+# Time budget for API calls (retries included) made while a user waits on a reply
+HANDLER_API_BUDGET_SECONDS = float(os.environ.get("SEEDOR_HANDLER_API_BUDGET_SECONDS", "8"))
+# Tenants refreshed in parallel while warming up after a start
+STARTUP_REFRESH_CONCURRENCY = int(os.environ.get("SEEDOR_STARTUP_REFRESH_CONCURRENCY", "8"))
+# "binary": handlers read mmap'd .snap files (snapshot_binary.py) instead of parsed JSON;
+# "compact": snapshot_cache keeps slotted records (snapshot_model.py) instead of dicts
+SNAPSHOT_FORMAT = os.environ.get("SEEDOR_SNAPSHOT_FORMAT", "json").lower()
+
+# ─── Retry policies (transient errors only, full jitter) ──
+api_retry = RetryPolicy(max_retries=3, base_delay=1.0, max_delay=15.0)
+task_complete_retry = RetryPolicy(max_retries=2, base_delay=1.0, max_delay=10.0)
+
+# ─── Parsed snapshot cache (LRU, byte budget) ─────────────
+snapshot_cache = SnapshotCache(
+    max_bytes=SNAPSHOT_CACHE_MAX_MB * 1024 * 1024, compact=SNAPSHOT_FORMAT == "compact"
+)
+metrics.register_collector("snapshot_cache", snapshot_cache.stats)
+binary_snapshots = BinarySnapshotCache()
+metrics.register_collector("binary_snapshots", binary_snapshots.stats)
+
+# What _load_snapshot returns: a parsed dict, a .snap reader in binary mode or
+# a SnapshotModel in compact mode
+Snapshot = Union[dict, BinarySnapshot, SnapshotModel]
+
+# ─── Per-tenant refresh coalescing ────────────────────────
+_snapshot_refreshes = SingleFlight(
+    "snapshot_refresh", quiet_seconds=SNAPSHOT_REFRESH_QUIET_SECONDS
+)
+metrics.register_collector("snapshot_refresh", _snapshot_refreshes.stats)
+
+# ─── Cross-process refresh leases (replicas, sync_service) ─
+refresh_leases = RefreshLeases(LEASES_DIR)
+metrics.register_collector("refresh_leases", refresh_leases.stats)
+
+# chat_id → background refresh of a listing that was served stale
+_task_list_revalidations: dict[int, asyncio.Task] = {}
+
+_delta_sync = DeltaSyncClient()
+metrics.register_collector("delta_sync", _delta_sync.stats)
+
+# ─── Background refresh (adaptive per-tenant schedule) ────
+refresh_scheduler = RefreshScheduler(
+    refresh=lambda tid: _async_refresh_snapshot(tid),
+    tenants=lambda: registry.get_active_tenant_ids(),
+    last_refreshed=lambda tid: _snapshot_mtime(tid),
+)
+metrics.register_collector("refresh_scheduler", refresh_scheduler.stats)
 
 
 # ═══════════════════════════════════════════════════════════
 # HELPERS
 # ═══════════════════════════════════════════════════════════
 
-def _load_snapshot(tenant_id: str = "") -> dict:
+def _load_snapshot(tenant_id: str = "") -> Snapshot:
     """Load and return the snapshot for the given tenant.
 
     A.3: No fallback to global snapshot — only per-tenant snapshots are used.
     Raises FileNotFoundError if the tenant snapshot file is missing.
+
+    The parsed snapshot comes from snapshot_cache and is shared between
+    handlers — do not mutate it. With SEEDOR_SNAPSHOT_FORMAT=binary it is
+    a BinarySnapshot, with =compact a SnapshotModel: .get() for top-level
+    keys, lookups through _snapshot_index().
     """
     if not tenant_id:
         raise FileNotFoundError("tenant_id is required — no global snapshot fallback")
     path = _snapshot_path(tenant_id)
-    if not os.path.exists(path):
-        raise FileNotFoundError(f"No snapshot for tenant {tenant_id}")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    try:
+        if SNAPSHOT_FORMAT == "binary":
+            return binary_snapshots.get(tenant_id, path)
+        return snapshot_cache.get(tenant_id, path)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"No snapshot for tenant {tenant_id}") from None
+
 
+def _write_snapshot(snapshot: dict, tenant_id: str = "") -> tuple[bool, dict]:
+    """Atomically write snapshot to disk for the given tenant.
 
-def _write_snapshot(snapshot: dict, tenant_id: str = "") -> None:
-    """Atomically write snapshot to disk for the given tenant."""
+    Identical content is not rewritten (see snapshot_store.py). A written
+    snapshot is stored in snapshot_cache, so the next read does not parse
+    the file again; an unchanged one only if the cache does not already
+    hold that revision (replacing it would drop its index, or rebuild the
+    compact model). In binary mode the .snap file is written next to it
+    instead. Returns (written, meta sidecar).
+    """
     path = _snapshot_path(tenant_id)
-    os.makedirs(DATA_DIR, exist_ok=True)
-    fd, tmp_path = tempfile.mkstemp(dir=DATA_DIR, suffix=".tmp")
-    try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(snapshot, f, indent=2, ensure_ascii=False)
-        os.replace(tmp_path, path)
-    except Exception:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
-        raise
+    written, meta, stamped = write_snapshot_file(path, snapshot)
+    if not tenant_id:
+        return written, meta
+    if SNAPSHOT_FORMAT == "binary":
+        snap_path = binary_path(path)
+        if written or not os.path.exists(snap_path):
+            write_binary_snapshot(stamped, snap_path, meta.get("content_hash", ""))
+            binary_snapshots.reload(tenant_id, path)
+    else:
+        cached = snapshot_cache.peek(tenant_id)
+        if written or cached is None or cached.get("revision") != meta.get("revision"):
+            snapshot_cache.put(tenant_id, path, stamped, os.path.getsize(path))
+    return written, meta
+
+
+def _touch_snapshot(tenant_id: str) -> dict:
+    """Mark an unchanged snapshot as fresh without rewriting it.
+
+    Only the meta sidecar is updated (its mtime is the freshness used by
+    the TTL check); the snapshot file and its cache entry stay as they are.
+    """
+    return mark_checked(_snapshot_path(tenant_id))
+
+
+def _snapshot_index(snapshot: Snapshot) -> Union[SnapshotIndex, BinarySnapshot, SnapshotModel]:
+    """Return the precomputed lookup index for a loaded snapshot."""
+    if isinstance(snapshot, BinarySnapshot):
+        return snapshot  # the .snap file carries its own index
+    return snapshot_cache.index_for(snapshot)
+
+
+def _snapshot_mtime(tenant_id: str = "") -> Optional[float]:
+    """When the tenant's snapshot was last refreshed (by any process), or None."""
+    if not tenant_id:
+        return None
+    return last_refreshed(_snapshot_path(tenant_id))
+
+
+def _snapshot_age(tenant_id: str = "") -> Optional[float]:
+    """Seconds since the tenant's snapshot was written, or None if it is missing."""
+    mtime = _snapshot_mtime(tenant_id)
+    return None if mtime is None else datetime.now().timestamp() - mtime
 
 
 def _should_refresh_snapshot(tenant_id: str = "") -> bool:
@@ -159,55 +311,50 @@ def _should_refresh_snapshot(tenant_id: str = "") -> bool:
 
     A.3: No global snapshot fallback — only checks per-tenant path.
     """
-    if not tenant_id:
-        return True
-    path = _snapshot_path(tenant_id)
-    if not os.path.exists(path):
-        return True
-    try:
-        age = datetime.now().timestamp() - os.path.getmtime(path)
-    except OSError:
-        return True
-    return age > SNAPSHOT_TTL_SECONDS
+    age = _snapshot_age(tenant_id)
+    return age is None or age > SNAPSHOT_TTL_SECONDS
 
 
-@retry_with_backoff(max_retries=3, base_delay=1.0, max_delay=15.0)
-def _api_get(url: str, timeout: int = 15) -> dict:
+@api_retry
+async def _api_get(path: str, params: Optional[dict[str, str]] = None, timeout: int = 15) -> dict:
     """Make an authenticated GET request to the Seedor API with retry."""
-    import urllib.request
-    req = urllib.request.Request(
-        url,
-        method="GET",
-        headers={"Authorization": f"Bearer {API_KEY}"},
-    )
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+    return await api.get_json(path, params=params, timeout=timeout)
+
 
+@api_retry
+async def _api_get_raw(
+    path: str, params: dict[str, str], headers: dict[str, str], timeout: int = 15
+) -> tuple[int, dict[str, str], bytes]:
+    """Authenticated GET returning (status, headers, body). 304 is not an error."""
+    resp = await api.request("GET", path, params=params, headers=headers, timeout=timeout)
+    return resp.status, resp.headers, resp.body
 
-@retry_with_backoff(max_retries=3, base_delay=1.0, max_delay=15.0)
-def _api_post(url: str, payload: dict, timeout: int = 10) -> dict:
+
+@api_retry
+async def _api_post(path: str, payload: dict, timeout: int = 10) -> dict:
     """Make an authenticated POST request to the Seedor API with retry."""
-    import urllib.request
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        url,
-        data=data,
-        method="POST",
-        headers={
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json",
-        },
-    )
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        return json.loads(resp.read().decode("utf-8"))
+    return await api.post_json(path, payload, timeout=timeout)
 
 
 async def _async_refresh_snapshot(tenant_id: str = "") -> bool:
-    """Non-blocking wrapper — runs the sync HTTP call in a thread pool."""
-    return await asyncio.to_thread(_refresh_snapshot_from_api, tenant_id)
+    """Refresh a tenant snapshot without blocking the event loop.
+
+    Concurrent refreshes of the same tenant are coalesced into one fetch,
+    and a refresh right after a successful one reuses it (quiet window).
+    Across processes (replicas, sync_service) the tenant's refresh lease
+    makes sure only one of them fetches; the others use its snapshot.
+    """
+    if not tenant_id:
+        return await _refresh_snapshot_from_api(tenant_id)
+    return await _snapshot_refreshes.do(
+        tenant_id,
+        lambda: refresh_leases.run(
+            tenant_id, Path(_snapshot_path(tenant_id)), lambda: _refresh_snapshot_from_api(tenant_id)
+        ),
+    )
 
 
-def _refresh_snapshot_from_api(tenant_id: str = "") -> bool:
+async def _refresh_snapshot_from_api(tenant_id: str = "") -> bool:
     """Fetch snapshot from API and update local file. Returns True on success."""
     tid = tenant_id
     if not API_KEY or not tid:
@@ -218,14 +365,39 @@ def _refresh_snapshot_from_api(tenant_id: str = "") -> bool:
         )
         return False
 
-    url = f"{API_URL.rstrip('/')}/api/telegram/snapshot?tenantId={tid}"
+    path = "/api/telegram/snapshot"
 
     try:
-        snapshot = _api_get(url)
-        _write_snapshot(snapshot, tid)
+        if DELTA_SYNC_ENABLED:
+            try:
+                loaded = await asyncio.to_thread(_load_snapshot, tid)
+                # Deltas apply to a dict; convert the binary reader / compact model back
+                local: Optional[dict] = (
+                    loaded if isinstance(loaded, dict) else await asyncio.to_thread(loaded.to_dict)
+                )
+            except (FileNotFoundError, ValueError):
+                local = None
+            snapshot, changed = await _delta_sync.sync_async(
+                tid,
+                local,
+                lambda params, headers: _api_get_raw(path, params, headers),
+            )
+        else:
+            snapshot, changed = await _api_get(path, {"tenantId": tid}), True
+
+        # Serializing a large snapshot is CPU-bound — keep it off the loop
+        # A full fetch may still return identical content: the write is skipped then
+        if changed:
+            changed, meta = await asyncio.to_thread(_write_snapshot, snapshot, tid)
+        else:
+            meta = await asyncio.to_thread(_touch_snapshot, tid)
+        refresh_scheduler.record_change(tid, changed)
+        metrics.incr("snapshot_writes", outcome="written" if changed else "unchanged")
         log.info(
-            "Snapshot refreshed",
+            "Snapshot refreshed" if changed else "Snapshot unchanged",
             tenant_id=tid,
+            revision=meta.get("revision"),
+            unchanged_cycles=meta.get("unchanged_cycles", 0),
             workers=len(snapshot.get("workers", [])),
             tasks=len(snapshot.get("tasks", [])),
         )
@@ -235,7 +407,7 @@ def _refresh_snapshot_from_api(tenant_id: str = "") -> bool:
         return False
 
 
-def _api_lookup_worker_by_phone(phone: str) -> list[dict]:
+async def _api_lookup_worker_by_phone(phone: str) -> list[dict]:
     """Lookup worker by phone across all tenants via API."""
     if not API_KEY:
         log.error(
@@ -244,17 +416,20 @@ def _api_lookup_worker_by_phone(phone: str) -> list[dict]:
         )
         return []
     normalized = _normalize_phone(phone)
-    url = f"{API_URL.rstrip('/')}/api/telegram/worker-lookup?phone={normalized}"
     try:
-        result = _api_get(url)
+        result = await _api_get("/api/telegram/worker-lookup", {"phone": normalized})
         return result.get("workers", [])
     except Exception as e:
         log.error("Worker lookup failed", error=str(e), phone=phone[:6] + "***")
         return []
 
 
-@retry_with_backoff(max_retries=2, base_delay=1.0, max_delay=10.0)
-def _complete_task_via_api(worker_id: str, task_id: str, timestamp: str) -> bool:
+def _task_complete_path(worker_id: str, task_id: str) -> str:
+    return f"/api/telegram/worker/{worker_id}/tasks/{task_id}/complete"
+
+
+@task_complete_retry
+async def _complete_task_via_api(worker_id: str, task_id: str, timestamp: str) -> bool:
     """A.4: Complete a task via the granular endpoint.
 
     POST /api/telegram/worker/:workerId/tasks/:taskId/complete
@@ -264,19 +439,23 @@ def _complete_task_via_api(worker_id: str, task_id: str, timestamp: str) -> bool
         log.warning("Cannot complete task: missing API key env var")
         return False
 
-    url = (
-        f"{API_URL.rstrip('/')}/api/telegram/worker/{worker_id}"
-        f"/tasks/{task_id}/complete"
-    )
+    path = _task_complete_path(worker_id, task_id)
     payload = {"timestamp": timestamp, "source": "telegram"}
 
     try:
-        result = _api_post(url, payload)
+        result = await _api_post(path, payload)
         ok = result.get("ok", False)
         already = result.get("already_completed", False)
         if already:
             log.info("Task already completed (idempotent)", task_id=task_id)
         return ok
+    except CircuitOpenError as e:
+        log.warning(
+            "Granular task complete skipped: circuit open",
+            task_id=task_id,
+            retry_in=round(e.retry_in, 1),
+        )
+        return False
     except Exception as e:
         log.error(
             "Granular task complete failed",
@@ -287,22 +466,28 @@ def _complete_task_via_api(worker_id: str, task_id: str, timestamp: str) -> bool
         return False
 
 
-def _push_event_to_api(event: dict) -> bool:
+async def _push_event_to_api(event: dict) -> bool:
     """Push a single event directly to the Seedor API. Returns True on success."""
     if not API_KEY:
         log.warning("Cannot push event: missing API key env var")
         return False
 
-    url = f"{API_URL.rstrip('/')}/api/telegram/updates"
-
     try:
-        result = _api_post(url, {"events": [event]})
+        result = await _api_post("/api/telegram/updates", {"events": [event]})
         log.info(
             "Event pushed to API",
             event_type=event.get("type"),
             result=result,
         )
         return True
+    except CircuitOpenError as e:
+        # API known to be down: the caller keeps the event in the updates queue
+        log.warning(
+            "Event push skipped: circuit open",
+            event_type=event.get("type"),
+            retry_in=round(e.retry_in, 1),
+        )
+        return False
     except Exception as e:
         log.error(
             "Event push failed after retries",
@@ -323,63 +508,24 @@ def _is_valid_id(value: str) -> bool:
     return bool(value and _CUID_RE.match(value))
 
 
-def _append_event(event: dict) -> None:
-    """Push event to API in real-time, and also save to queue file as backup."""
-    pushed = _push_event_to_api(event)
-
-    os.makedirs(DATA_DIR, exist_ok=True)
-
-    queue = {"events": []}
-    if os.path.exists(UPDATES_PATH):
-        with open(UPDATES_PATH, "r", encoding="utf-8") as f:
-            try:
-                queue = json.load(f)
-            except json.JSONDecodeError:
-                queue = {"events": []}
-
-    # Only add to queue if API push failed
-    if not pushed:
-        queue["events"].append(event)
-
-    with open(UPDATES_PATH, "w", encoding="utf-8") as f:
-        json.dump(queue, f, indent=2, ensure_ascii=False)
-
-
-def _normalize_phone(raw: str) -> str:
-    """Normalize phone numbers for comparison.
-    Strips spaces, dashes, ensures a leading '+',
-    and removes the Argentine mobile '9' prefix (+54 9 → +54).
-    """
-    cleaned = raw.replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
-    if not cleaned.startswith("+"):
-        cleaned = "+" + cleaned
-    if cleaned.startswith("+549") and len(cleaned) > 6:
-        cleaned = "+54" + cleaned[4:]
-    return cleaned
+async def _append_event(event: dict) -> None:
+    """Push event to API in real-time; journal it for sync_service if that fails."""
+    if await _push_event_to_api(event):
+        return
+    await asyncio.to_thread(updates_journal.append, event)
 
 
-def _find_workers_by_phone(snapshot: dict, phone: str) -> list[dict]:
+def _find_workers_by_phone(snapshot: Snapshot, phone: str) -> list[dict]:
     """Return all workers matching the normalized phone."""
-    normalized = _normalize_phone(phone)
-    return [
-        w for w in snapshot.get("workers", [])
-        if w.get("phone") and _normalize_phone(w["phone"]) == normalized
-    ]
+    return _snapshot_index(snapshot).find_workers_by_phone(phone)
 
 
-def _count_active_tasks(snapshot: dict, worker_id: str) -> int:
+def _count_active_tasks(snapshot: Snapshot, worker_id: str) -> int:
     """Count active (non-completed) tasks assigned to a worker."""
-    count = 0
-    for t in snapshot.get("tasks", []):
-        if worker_id not in t.get("assigned_worker_ids", []):
-            continue
-        status = _local_task_overrides.get(t["id"], t.get("status"))
-        if status != "COMPLETED":
-            count += 1
-    return count
+    return _snapshot_index(snapshot).count_active_tasks(worker_id, _local_task_overrides)
 
 
-def _find_worker_by_phone(snapshot: dict, phone: str) -> Optional[dict]:
+def _find_worker_by_phone(snapshot: Snapshot, phone: str) -> Optional[dict]:
     """Search snapshot workers by normalized phone."""
     matches = _find_workers_by_phone(snapshot, phone)
     if not matches:
@@ -394,121 +540,126 @@ def _get_worker_name(worker: dict) -> str:
     return f"{worker['first_name']} {worker['last_name']}"
 
 
-def _get_lot_display(snapshot: dict, lot_id: str) -> str:
+def _get_lot_display(snapshot: Snapshot, lot_id: str) -> str:
     """Return 'LotName (FieldName)' for display."""
-    for field in snapshot.get("fields", []):
-        for lot in field.get("lots", []):
-            if lot["id"] == lot_id:
-                return f"{lot['name']} — {field['name']}"
-    return lot_id
-
-
-def _load_notification_events() -> list[dict]:
-    if not os.path.exists(NOTIFICATIONS_PATH):
-        return []
-    try:
-        with open(NOTIFICATIONS_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        events = data.get("events", [])
-        if isinstance(events, list):
-            return events
-    except (json.JSONDecodeError, OSError, AttributeError):
-        pass
-    return []
-
-
-def _save_notification_events(events: list[dict]) -> None:
-    os.makedirs(DATA_DIR, exist_ok=True)
-    fd, tmp_path = tempfile.mkstemp(dir=DATA_DIR, suffix=".tmp")
-    try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump({"events": events}, f, indent=2, ensure_ascii=False)
-        os.replace(tmp_path, NOTIFICATIONS_PATH)
-    except Exception:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
-        raise
+    return _snapshot_index(snapshot).lot_display(lot_id)
 
 
 def _get_chat_ids_for_worker(worker: dict) -> list[int]:
-    chat_ids: set[int] = set()
-    worker_id = worker.get("id")
-    if worker_id:
-        for chat_id, stored_worker_id in _authenticated_workers.items():
-            if stored_worker_id == worker_id:
-                chat_ids.add(chat_id)
-
-    if not chat_ids:
-        phone = worker.get("phone")
-        if phone:
-            normalized = _normalize_phone(phone)
-            for chat_id, stored_phone in _authenticated_phones.items():
-                if _normalize_phone(stored_phone) == normalized:
-                    chat_ids.add(chat_id)
+    return registry.resolve_chat_ids(worker)
 
-    return list(chat_ids)
 
-
-async def _send_to_chat_ids(bot, chat_ids: list[int], message: str) -> bool:
-    sent = False
-    for chat_id in chat_ids:
-        try:
-            await bot.send_message(chat_id=chat_id, text=message)
-            sent = True
-        except Exception as e:
-            log.warning(
-                "Failed to send notification",
-                chat_id=chat_id,
-                error=str(e),
-            )
-    return sent
+async def _send_notification(bot, chat_id: int, messages: list[str]) -> bool:
+    """Send on the bulk lane; the scheduler paces and parallelises the sends."""
+    try:
+        for text in messages:
+            await bot.send_message(chat_id=chat_id, text=text, rate_limit_args=PRIORITY_BULK)
+        return True
+    except Exception as e:
+        log.warning(
+            "Failed to send notification",
+            chat_id=chat_id,
+            error=str(e),
+        )
+        return False
 
 
-async def _process_notification_queue(app) -> None:
-    events = _load_notification_events()
-    if not events:
+async def _import_legacy_notifications() -> None:
+    """Queue whatever was written to notifications_queue.json (compat input)."""
+    events, claimed = await asyncio.to_thread(take_legacy_file, Path(NOTIFICATIONS_PATH))
+    if claimed is None:
         return
-
-    retry_events: list[dict] = []
-
-    for event in events:
-        if not isinstance(event, dict):
-            continue
+    notification_queue.put(events)
+    await asyncio.to_thread(os.unlink, claimed)
+    log.info("Legacy notifications imported", events=len(events))
+
+
+async def _process_notification_queue(app) -> Optional[float]:
+    """Deliver due notifications, one digest per chat. Returns seconds until the next run is due."""
+    now = time.time()
+    events: dict[str, dict] = {}
+    failed: dict[str, dict[str, str]] = {}  # event id → recipient key → error
+    entries: list[tuple[dict, str, list[int]]] = []
+    unhandled: set[str] = set()
+    for event, workers in notification_queue.due(now):
         if event.get("type") != "TASK_ASSIGNED":
-            retry_events.append(event)
+            # Unknown type: kept (until it expires) for a newer bot version. It is
+            # never attempted, so it must not count as due in next_due_in.
+            unhandled.add(event["id"])
             continue
-
-        message = event.get("message")
-        workers = event.get("workers")
-        if not message or not isinstance(workers, list):
+        if not event.get("message") or not workers:
+            notification_queue.done(event["id"])
             continue
+        events[event["id"]] = event
+        for worker, chat_ids in registry.resolve_recipients(workers):
+            if chat_ids:
+                entries.append((event, recipient_key(worker), chat_ids))
+            else:
+                failed.setdefault(event["id"], {})[recipient_key(worker)] = "no chat"
 
-        pending_workers: list[dict] = []
-        for worker in workers:
-            if not isinstance(worker, dict):
-                continue
-            chat_ids = _get_chat_ids_for_worker(worker)
-            if not chat_ids:
-                pending_workers.append(worker)
-                continue
-            sent = await _send_to_chat_ids(app.bot, chat_ids, message)
-            if not sent:
-                pending_workers.append(worker)
+    ready, digest_wait = notification_digests.plan(entries, now)
+    chats = list(ready)
+    renders = [notification_digests.render([event for event, _ in ready[chat_id]]) for chat_id in chats]
+    sent = await asyncio.gather(
+        *(_send_notification(app.bot, chat_id, messages) for chat_id, messages in zip(chats, renders))
+    )
 
-        if pending_workers:
-            retry_events.append({**event, "workers": pending_workers})
+    # A recipient is delivered if any of their chats got it
+    delivered: dict[str, set[str]] = {}
+    attempted: dict[str, set[str]] = {}
+    for chat_id, messages, ok in zip(chats, renders, sent):
+        notification_digests.record(len({event["id"] for event, _ in ready[chat_id]}), len(messages))
+        for event, key in ready[chat_id]:
+            attempted.setdefault(event["id"], set()).add(key)
+            if ok:
+                delivered.setdefault(event["id"], set()).add(key)
+    for eid, keys in attempted.items():
+        for key in keys - delivered.get(eid, set()):
+            failed.setdefault(eid, {})[key] = "send failed"
+
+    if chats:
+        log.info(
+            "Notifications sent",
+            chats=len(chats),
+            events=len(attempted),
+            sends=sum(len(messages) for messages in renders),
+            sends_saved_total=notification_digests.sends_saved,
+        )
 
-    _save_notification_events(retry_events)
+    # Events with chats still inside their digest window (woken by digest_wait)
+    held = {event["id"] for event, _, chat_ids in entries if any(c not in ready for c in chat_ids)}
+    for eid, event in events.items():
+        if eid in attempted or eid in failed:
+            notification_queue.record(event, delivered.get(eid, ()), failed.get(eid, {}), now)
+    notification_queue.commit()
 
+    next_due = notification_queue.next_due_in(skip=held | unhandled)
+    waits = [w for w in (next_due, digest_wait) if w is not None]
+    return min(waits) if waits else None
 
-async def _notification_poller(app) -> None:
-    log.info("Notification poller started", interval_seconds=NOTIFICATION_POLL_SECONDS)
-    while True:
-        try:
-            await _process_notification_queue(app)
-        except Exception as e:
-            log.error("Notification poller error", error=str(e))
-        await asyncio.sleep(NOTIFICATION_POLL_SECONDS)
+
+async def _notification_dispatcher(app) -> None:
+    """Deliver notifications as soon as they are pushed or the legacy file changes.
+
+    Workers without a chat yet are retried with backoff (or as soon as they
+    open the bot); the loop sleeps until the next retry is due.
+    """
+    watcher = FileWatcher(Path(NOTIFICATIONS_PATH), notification_queue.wake)
+    watcher.start()
+    log.info("Notification dispatcher started", retry_interval_seconds=NOTIFICATION_POLL_SECONDS)
+    try:
+        while True:
+            next_run = None
+            try:
+                await _import_legacy_notifications()
+                next_run = await _process_notification_queue(app)
+            except Exception as e:
+                log.error("Notification dispatcher error", error=str(e))
+            await notification_queue.wait(
+                NOTIFICATION_POLL_SECONDS if next_run is None else min(next_run, NOTIFICATION_POLL_SECONDS)
+            )
+    finally:
+        watcher.stop()
 
 
 def _get_active_tenant_name(chat_id: int) -> str:
@@ -562,10 +713,10 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         # Refresh available tenants from API (user may have been added to a new company)
         phone = _authenticated_phones.get(chat_id)
         if phone:
-            fresh = await asyncio.to_thread(_api_lookup_worker_by_phone, phone)
+            with retry_deadline(HANDLER_API_BUDGET_SECONDS):
+                fresh = await _api_lookup_worker_by_phone(phone)
             if fresh and len(fresh) != len(_worker_tenants.get(chat_id, [])):
-                _worker_tenants[chat_id] = fresh
-                _save_sessions()
+                registry.set_available_tenants(chat_id, fresh)
                 log.info(
                     "Refreshed available tenants",
                     chat_id=chat_id,
@@ -602,8 +753,9 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     phone = contact.phone_number
     chat_id = update.message.chat_id
     log.info("Contact received", chat_id=chat_id, phone=phone[:6] + "***")
-    # Try API lookup first (cross-tenant) — run in thread to avoid blocking the event loop
-    api_workers = await asyncio.to_thread(_api_lookup_worker_by_phone, phone)
+    # Try API lookup first (cross-tenant) — async, does not block the event loop
+    with retry_deadline(HANDLER_API_BUDGET_SECONDS):
+        api_workers = await _api_lookup_worker_by_phone(phone)
 
     if not api_workers:
         # A.3: Fallback only to snapshots for known tenants — never global snapshot
@@ -638,15 +790,16 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return ConversationHandler.END
 
-    _authenticated_phones[chat_id] = _normalize_phone(phone)
-    _worker_tenants[chat_id] = api_workers
-
     if len(api_workers) == 1:
         # Single tenant — auto-select
         w = api_workers[0]
-        _authenticated_workers[chat_id] = w["worker_id"]
-        _selected_tenants[chat_id] = w["tenant_id"]
-        _save_sessions()
+        registry.register(
+            chat_id,
+            w["worker_id"],
+            w["tenant_id"],
+            phone=_normalize_phone(phone),
+            available_tenants=api_workers,
+        )
 
         # Refresh snapshot for this tenant
         await _async_refresh_snapshot(w["tenant_id"])
@@ -671,6 +824,8 @@ async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return ConversationHandler.END
     else:
         # Multiple tenants — show selector
+        registry.set_phone(chat_id, _normalize_phone(phone))
+        registry.set_available_tenants(chat_id, api_workers)
         context.user_data["pending_workers"] = api_workers
         buttons = []
         for w in api_workers:
@@ -714,9 +869,7 @@ async def handle_tenant_selection(update: Update, context: ContextTypes.DEFAULT_
         await query.edit_message_text("⚠️ Selección inválida o expirada. Usá /start.")
         return ConversationHandler.END
 
-    _authenticated_workers[chat_id] = worker_id
-    _selected_tenants[chat_id] = tenant_id
-    _save_sessions()
+    registry.switch_tenant(chat_id, tenant_id, worker_id)
 
     # Refresh snapshot for selected tenant
     await _async_refresh_snapshot(tenant_id)
@@ -800,9 +953,7 @@ async def handle_switch_tenant(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.edit_message_text("⚠️ Selección inválida o expirada. Usá /start.")
         return
 
-    _authenticated_workers[chat_id] = worker_id
-    _selected_tenants[chat_id] = tenant_id
-    _save_sessions()
+    registry.switch_tenant(chat_id, tenant_id, worker_id)
 
     # Refresh snapshot for selected tenant
     await _async_refresh_snapshot(tenant_id)
@@ -902,9 +1053,7 @@ async def handle_tasks_tenant_selection(update: Update, context: ContextTypes.DE
         return
 
     # Update selected tenant so snapshot refresh uses the right one
-    _authenticated_workers[chat_id] = worker_id
-    _selected_tenants[chat_id] = tenant_id
-    _save_sessions()
+    registry.switch_tenant(chat_id, tenant_id, worker_id)
 
     # Find tenant name for the header
     tenant_name = tenant_id
@@ -921,105 +1070,55 @@ async def handle_tasks_tenant_selection(update: Update, context: ContextTypes.DE
     await _show_tasks_for_tenant(query.message, chat_id, worker_id, tenant_id)
 
 
-async def _show_tasks_for_tenant(message, chat_id: int, worker_id: str, tenant_id: str) -> None:
-    """Load and display tasks for a specific tenant. Used by both single and multi-tenant flows."""
-    refreshed = False
-    if _should_refresh_snapshot(tenant_id):
-        refreshed = await _async_refresh_snapshot(tenant_id)
+def _resolve_active_tasks(
+    snapshot: Snapshot, chat_id: int, worker_id: str
+) -> tuple[Optional[dict], str, list[dict]]:
+    """Find the chat's worker in the snapshot and its active tasks.
 
-    def _resolve_active_tasks(snapshot: dict, worker_id: str) -> tuple[Optional[dict], str, list[dict]]:
-        worker = next(
-            (w for w in snapshot.get("workers", []) if w["id"] == worker_id),
-            None,
-        )
-        if worker is None:
-            return None, worker_id, []
-
-        if worker.get("phone"):
-            normalized_phone = _normalize_phone(worker["phone"])
-            if _authenticated_phones.get(chat_id) != normalized_phone:
-                _authenticated_phones[chat_id] = normalized_phone
-                _save_sessions()
-
-        def _active_tasks_for(target_worker_id: str) -> list[dict]:
-            tasks = [
-                t for t in snapshot.get("tasks", [])
-                if target_worker_id in t.get("assigned_worker_ids", [])
-            ]
-            for task in tasks:
-                if task["id"] in _local_task_overrides:
-                    task["status"] = _local_task_overrides[task["id"]]
-            return [t for t in tasks if t["status"] != "COMPLETED"]
-
-        active_tasks = _active_tasks_for(worker_id)
-
-        if not active_tasks:
-            phone = worker.get("phone")
-            if phone:
-                matches = _find_workers_by_phone(snapshot, phone)
-                if len(matches) > 1:
-                    task_counts = {w["id"]: _count_active_tasks(snapshot, w["id"]) for w in matches}
-                    best = max(matches, key=lambda w: task_counts.get(w["id"], 0))
-                    if best["id"] != worker_id and task_counts.get(best["id"], 0) > 0:
-                        worker_id = best["id"]
-                        _authenticated_workers[chat_id] = worker_id
-                        _save_sessions()
-                        active_tasks = _active_tasks_for(worker_id)
-
-        return worker, worker_id, active_tasks
+    Returns (worker or None, worker_id, active tasks). If the worker has no
+    tasks but shares its phone with another worker record that does, the
+    session is switched to that record.
+    """
+    index = _snapshot_index(snapshot)
+    worker = index.workers_by_id.get(worker_id)
+    if worker is None:
+        return None, worker_id, []
 
-    try:
-        snapshot = _load_snapshot(tenant_id)
-    except FileNotFoundError:
-        await message.reply_text("⚠️ Snapshot no disponible.")
-        return
+    if worker.get("phone"):
+        normalized_phone = _normalize_phone(worker["phone"])
+        registry.set_phone(chat_id, normalized_phone)
 
-    worker, worker_id, active_tasks = _resolve_active_tasks(snapshot, worker_id)
-    if worker is None:
-        # Snapshot may have been overwritten by another tenant — force refresh for this user.
-        if tenant_id and await _async_refresh_snapshot(tenant_id):
-            try:
-                snapshot = _load_snapshot(tenant_id)
-                worker, worker_id, active_tasks = _resolve_active_tasks(snapshot, worker_id)
-            except FileNotFoundError:
-                pass
+    def _active_tasks_for(target_worker_id: str) -> list[dict]:
+        # The snapshot is shared via snapshot_cache — local overrides are
+        # applied by the index without mutating its task dicts.
+        return index.active_tasks(target_worker_id, _local_task_overrides)
 
-    if worker is None:
-        _authenticated_workers.pop(chat_id, None)
-        _authenticated_phones.pop(chat_id, None)
-        _save_sessions()
-        await message.reply_text(
-            "⚠️ Tu sesión está desactualizada. Usá /start para identificarte de nuevo.",
-            reply_markup=ReplyKeyboardRemove(),
-        )
-        return
+    active_tasks = _active_tasks_for(worker_id)
 
-    if not active_tasks and not refreshed:
-        if await _async_refresh_snapshot(tenant_id):
-            try:
-                snapshot = _load_snapshot(tenant_id)
-            except FileNotFoundError:
-                snapshot = None
-            if snapshot:
-                worker, worker_id, active_tasks = _resolve_active_tasks(snapshot, worker_id)
-                if worker is None:
-                    _authenticated_workers.pop(chat_id, None)
-                    _authenticated_phones.pop(chat_id, None)
-                    _save_sessions()
-                    await message.reply_text(
-                        "⚠️ Tu sesión está desactualizada. Usá /start para identificarte de nuevo.",
-                        reply_markup=ReplyKeyboardRemove(),
-                    )
-                    return
+    if not active_tasks:
+        phone = worker.get("phone")
+        if phone:
+            matches = _find_workers_by_phone(snapshot, phone)
+            if len(matches) > 1:
+                task_counts = {w["id"]: _count_active_tasks(snapshot, w["id"]) for w in matches}
+                best = max(matches, key=lambda w: task_counts.get(w["id"], 0))
+                if best["id"] != worker_id and task_counts.get(best["id"], 0) > 0:
+                    worker_id = best["id"]
+                    registry.set_worker(chat_id, worker_id)
+                    active_tasks = _active_tasks_for(worker_id)
+
+    return worker, worker_id, active_tasks
 
+
+# (text, [(button label, callback data), ...]) — one entry per message
+TaskListMessage = tuple[str, list[tuple[str, str]]]
+
+
+def _render_task_list(snapshot: Snapshot, active_tasks: list[dict]) -> list[TaskListMessage]:
+    """Render the /tareas listing: a header plus one message per field."""
     if not active_tasks:
-        await message.reply_text(
-            "🎉 ¡No tenés tareas pendientes! Buen trabajo.",
-            reply_markup=_main_menu_keyboard(chat_id),
-        )
-        return
+        return [("🎉 ¡No tenés tareas pendientes! Buen trabajo.", [])]
 
-    # Build message
     status_emoji = {
         "PENDING": "🟡",
         "IN_PROGRESS": "🔵",
@@ -1051,12 +1150,7 @@ async def _show_tasks_for_tenant(message, chat_id: int, worker_id: str, tenant_i
         "LATE": "Atrasada",
     }
 
-    # Build a lookup dict for O(1) lot resolution instead of nested loops per task.
-    lot_lookup: dict[str, tuple[str, str]] = {}
-    for field in snapshot.get("fields", []):
-        for lot in field.get("lots", []):
-            lot_lookup[lot["id"]] = (field["name"], lot["name"])
-
+    lots_by_id = _snapshot_index(snapshot).lots_by_id
     field_groups: dict[str, 'OrderedDict[str, list[dict]]'] = {}
 
     for t in active_tasks:
@@ -1065,24 +1159,17 @@ async def _show_tasks_for_tenant(message, chat_id: int, worker_id: str, tenant_i
             field_groups.setdefault("Sin campo", OrderedDict()).setdefault("Sin lote", []).append(t)
         else:
             for lid in lot_ids:
-                field_name, lot_name = lot_lookup.get(lid, ("Sin campo", lid))
+                found = lots_by_id.get(lid)
+                field_name, lot_name = (
+                    (found[0]["name"], found[1]["name"]) if found else ("Sin campo", lid)
+                )
                 field_groups.setdefault(field_name, OrderedDict()).setdefault(lot_name, []).append(t)
 
     total = len(active_tasks)
     num_fields = len(field_groups)
-
-    log.info(
-        "Tasks listed",
-        worker_id=worker_id,
-        chat_id=chat_id,
-        total_tasks=total,
-    )
-
-    await message.reply_text(
-        f"📋 *Tenés {total} tareas en {num_fields} campo{'s' if num_fields != 1 else ''}:*",
-        parse_mode="Markdown",
-        reply_markup=_main_menu_keyboard(chat_id),
-    )
+    rendered: list[TaskListMessage] = [
+        (f"📋 *Tenés {total} tareas en {num_fields} campo{'s' if num_fields != 1 else ''}:*", [])
+    ]
 
     for field_name, lots in field_groups.items():
         lines = [f"🏡  *{field_name}*\n{'━' * 20}\n"]
@@ -1101,18 +1188,173 @@ async def _show_tasks_for_tenant(message, chat_id: int, worker_id: str, tenant_i
                     f"       Estado: {label}\n"
                     f"       Vence: {_fmt_due(t['due_date'])}\n"
                 )
-                buttons.append(
-                    [InlineKeyboardButton(
-                        f"✅ Completar: {t['description'][:30]}",
-                        callback_data=f"done:{t['id']}",
-                    )]
-                )
+                buttons.append((f"✅ Completar: {t['description'][:30]}", f"done:{t['id']}"))
 
-        await message.reply_text(
-            "\n".join(lines),
+        rendered.append(("\n".join(lines), buttons))
+
+    return rendered
+
+
+def _task_list_markup(buttons: list[tuple[str, str]]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton(label, callback_data=data)] for label, data in buttons]
+    )
+
+
+async def _send_task_list(message, chat_id: int, rendered: list[TaskListMessage]) -> list:
+    """Send a rendered listing; the first message carries the main keyboard."""
+    sent = []
+    for i, (text, buttons) in enumerate(rendered):
+        sent.append(await message.reply_text(
+            text,
             parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(buttons),
+            reply_markup=_task_list_markup(buttons) if i else _main_menu_keyboard(chat_id),
+        ))
+    return sent
+
+
+async def _show_tasks_for_tenant(message, chat_id: int, worker_id: str, tenant_id: str) -> None:
+    """Load and display tasks for a specific tenant. Used by both single and multi-tenant flows.
+
+    Stale-while-revalidate: a snapshot older than SNAPSHOT_TTL_SECONDS but
+    within SNAPSHOT_MAX_STALENESS_SECONDS is shown right away and refreshed
+    in the background (see _revalidate_task_list). Only a missing or
+    hard-stale snapshot makes the user wait for the API.
+    """
+    refresh_scheduler.note_activity(tenant_id)
+    refreshed = False
+    age = _snapshot_age(tenant_id)
+    if age is None or age > SNAPSHOT_MAX_STALENESS_SECONDS:
+        refreshed = await _async_refresh_snapshot(tenant_id)
+    stale = not refreshed and age is not None and age > SNAPSHOT_TTL_SECONDS
+
+    try:
+        snapshot = _load_snapshot(tenant_id)
+    except FileNotFoundError:
+        await message.reply_text("⚠️ Snapshot no disponible.")
+        return
+
+    worker, worker_id, active_tasks = _resolve_active_tasks(snapshot, chat_id, worker_id)
+    if worker is None and not refreshed:
+        # Snapshot may have been overwritten by another tenant — force refresh for this user.
+        # This one blocks: the session is dropped below if the worker is really gone.
+        if tenant_id and await _async_refresh_snapshot(tenant_id):
+            refreshed, stale = True, False
+            try:
+                snapshot = _load_snapshot(tenant_id)
+                worker, worker_id, active_tasks = _resolve_active_tasks(snapshot, chat_id, worker_id)
+            except FileNotFoundError:
+                pass
+
+    if worker is None:
+        registry.forget_worker(chat_id)
+        await message.reply_text(
+            "⚠️ Tu sesión está desactualizada. Usá /start para identificarte de nuevo.",
+            reply_markup=ReplyKeyboardRemove(),
         )
+        return
+
+    if stale:
+        metrics.incr("snapshot_served_stale", tenant=tenant_id)
+
+    log.info(
+        "Tasks listed",
+        worker_id=worker_id,
+        chat_id=chat_id,
+        total_tasks=len(active_tasks),
+        snapshot_age_seconds=round(age, 1) if age is not None and not refreshed else 0,
+    )
+
+    rendered = _render_task_list(snapshot, active_tasks)
+    sent = await _send_task_list(message, chat_id, rendered)
+
+    # An empty list is re-checked too: tasks may have been assigned since the snapshot
+    if stale or (not active_tasks and not refreshed):
+        _start_revalidation(chat_id, _revalidate_task_list(
+            message, chat_id, worker_id, tenant_id, rendered, sent
+        ))
+
+
+def _start_revalidation(chat_id: int, coro) -> None:
+    """Run a listing revalidation in the background; a newer listing supersedes it."""
+    previous = _task_list_revalidations.pop(chat_id, None)
+    if previous is not None and not previous.done():
+        previous.cancel()
+    task = asyncio.get_running_loop().create_task(coro)
+    _task_list_revalidations[chat_id] = task
+
+    def _done(t: asyncio.Task) -> None:
+        if _task_list_revalidations.get(chat_id) is t:
+            del _task_list_revalidations[chat_id]
+
+    task.add_done_callback(_done)
+
+
+async def _revalidate_task_list(
+    message,
+    chat_id: int,
+    worker_id: str,
+    tenant_id: str,
+    shown: list[TaskListMessage],
+    sent: list,
+) -> None:
+    """Refresh the tenant snapshot and update a listing that was served stale.
+
+    Changed messages are edited in place; extra fields are sent as new
+    messages and fields that disappeared are deleted. Nothing is sent when
+    the listing did not change or SEEDOR_SNAPSHOT_SWR_EDIT=0.
+    """
+    if not await _async_refresh_snapshot(tenant_id):
+        metrics.incr("task_list_revalidations", outcome="refresh_failed")
+        return
+    try:
+        snapshot = _load_snapshot(tenant_id)
+    except FileNotFoundError:
+        return
+    worker, worker_id, active_tasks = _resolve_active_tasks(snapshot, chat_id, worker_id)
+    if worker is None:
+        # Handled (session dropped) on the user's next request
+        return
+
+    rendered = _render_task_list(snapshot, active_tasks)
+    if rendered == shown:
+        metrics.incr("task_list_revalidations", outcome="unchanged")
+        return
+    metrics.incr("task_list_revalidations", outcome="changed")
+    if not SNAPSHOT_SWR_EDIT:
+        return
+
+    try:
+        for i, (text, buttons) in enumerate(rendered[:len(sent)]):
+            if (text, buttons) == shown[i]:
+                continue
+            if i == 0:
+                # Reply keyboards cannot be edited — the header keeps its keyboard
+                await sent[i].edit_text(text, parse_mode="Markdown")
+            else:
+                await sent[i].edit_text(
+                    text, parse_mode="Markdown", reply_markup=_task_list_markup(buttons)
+                )
+        for text, buttons in rendered[len(sent):]:
+            await message.reply_text(
+                text, parse_mode="Markdown", reply_markup=_task_list_markup(buttons)
+            )
+        for stale_message in sent[len(rendered):]:
+            await stale_message.delete()
+    except Exception as e:
+        log.warning(
+            "Failed to update task listing",
+            chat_id=chat_id,
+            error=str(e),
+        )
+        return
+
+    log.info(
+        "Task listing updated",
+        worker_id=worker_id,
+        chat_id=chat_id,
+        total_tasks=len(active_tasks),
+    )
 
 
 async def handle_task_done(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1131,6 +1373,7 @@ async def handle_task_done(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     if chat_id not in _selected_tenants:
         await query.edit_message_text("⚠️ Primero seleccioná una empresa. Usá /start para elegir.")
         return
+    refresh_scheduler.note_activity(_selected_tenants[chat_id])
 
     # Parse callback_data: "done:{task_id}"
     data = query.data
@@ -1148,15 +1391,14 @@ async def handle_task_done(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     lot_display = ""
     try:
         snapshot = _load_snapshot(_selected_tenants.get(chat_id, ""))
-        for t in snapshot.get("tasks", []):
-            if t["id"] == task_id:
-                task_name = t.get("description", task_id)
-                lot_ids = t.get("lot_ids", [])
-                if lot_ids:
-                    lot_display = ", ".join(
-                        _get_lot_display(snapshot, lid) for lid in lot_ids
-                    )
-                break
+        t = _snapshot_index(snapshot).tasks_by_id.get(task_id)
+        if t is not None:
+            task_name = t.get("description", task_id)
+            lot_ids = t.get("lot_ids", [])
+            if lot_ids:
+                lot_display = ", ".join(
+                    _get_lot_display(snapshot, lid) for lid in lot_ids
+                )
     except FileNotFoundError:
         pass
 
@@ -1215,9 +1457,12 @@ async def handle_task_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     # A.4: Try granular endpoint first, fall back to legacy _append_event
     timestamp = datetime.now(timezone.utc).isoformat()
-    granular_ok = await asyncio.to_thread(
-        _complete_task_via_api, worker_id, task_id, timestamp
-    )
+    if api.circuit_open(_task_complete_path(worker_id, task_id)):
+        # API is failing: don't make the user wait, go straight to the queue
+        granular_ok = False
+    else:
+        with retry_deadline(HANDLER_API_BUDGET_SECONDS):
+            granular_ok = await _complete_task_via_api(worker_id, task_id, timestamp)
 
     if not granular_ok:
         # Fallback: enqueue via legacy path for retry
@@ -1226,12 +1471,13 @@ async def handle_task_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE
             task_id=task_id,
             worker_id=worker_id,
         )
-        _append_event({
-            "type": "TASK_COMPLETED",
-            "worker_id": worker_id,
-            "task_id": task_id,
-            "timestamp": timestamp,
-        })
+        with retry_deadline(HANDLER_API_BUDGET_SECONDS):
+            await _append_event({
+                "type": "TASK_COMPLETED",
+                "worker_id": worker_id,
+                "task_id": task_id,
+                "timestamp": timestamp,
+            })
 
     log.info(
         "Task completed",
@@ -1304,15 +1550,14 @@ async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     snap_path = _snapshot_path(user_tenant) if user_tenant else ""
     snapshot_exists = bool(snap_path) and os.path.exists(snap_path)
     snapshot_age = "N/A"
-    if snapshot_exists:
-        try:
-            age_secs = int(datetime.now().timestamp() - os.path.getmtime(snap_path))
-            if age_secs < 60:
-                snapshot_age = f"{age_secs}s"
-            else:
-                snapshot_age = f"{age_secs // 60}m {age_secs % 60}s"
-        except OSError:
-            snapshot_age = "error"
+    # Freshness comes from the meta sidecar: unchanged refreshes leave the snapshot file alone
+    age = _snapshot_age(user_tenant) if snapshot_exists else None
+    if age is not None:
+        age_secs = max(0, int(age))
+        if age_secs < 60:
+            snapshot_age = f"{age_secs}s"
+        else:
+            snapshot_age = f"{age_secs // 60}m {age_secs % 60}s"
 
     tenant_name = _get_active_tenant_name(chat_id)
     await update.message.reply_text(
@@ -1333,20 +1578,76 @@ async def cmd_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 # ═══════════════════════════════════════════════════════════
 
 async def _snapshot_refresh_loop() -> None:
-    """Periodically refresh snapshot from API for all active tenants."""
-    SYNC_INTERVAL = int(os.environ.get("SEEDOR_SYNC_INTERVAL_SECONDS", "60"))
-    log.info("Snapshot sync loop started", interval_seconds=SYNC_INTERVAL)
+    """Keep active tenants' snapshots fresh (adaptive per-tenant schedule)."""
+    await refresh_scheduler.run()
+
+
+async def _journal_flush_loop() -> None:
+    """fsync journal appends that no later append has synced.
+
+    EventJournal only checks its fsync interval when appending; without
+    this an idle bot would keep its last events in the page cache.
+    """
     while True:
-        await asyncio.sleep(SYNC_INTERVAL)
+        await asyncio.sleep(updates_journal.fsync_interval)
+        if updates_journal.unsynced:
+            try:
+                await asyncio.to_thread(updates_journal.flush)
+            except OSError as e:
+                log.error("Journal flush failed", error=str(e))
+
+
+async def _warm_tenants() -> None:
+    """Bring tenant snapshots up to date after a start, without blocking it.
+
+    Tenants are handled busiest first (by number of sessions). Phase 1
+    parses the on-disk snapshots into snapshot_cache so the first handlers
+    do not wait; phase 2 refreshes the stale ones from the API,
+    STARTUP_REFRESH_CONCURRENCY at a time.
+    """
+    counts = registry.tenant_session_counts()
+    tenants = sorted(counts, key=lambda tid: -counts[tid])
+    if not tenants:
+        return
+
+    started = time.monotonic()
+    warmed = 0
+    for tid in tenants:
         try:
-            active_tenants = set(_selected_tenants.values())
-            if not active_tenants:
-                log.debug("No active tenants for snapshot refresh, skipping")
-                continue
-            for tid in active_tenants:
-                await _async_refresh_snapshot(tid)
-        except Exception as e:
-            log.error("Snapshot refresh loop error", error=str(e))
+            await asyncio.to_thread(_load_snapshot, tid)
+            warmed += 1
+        except (FileNotFoundError, ValueError):
+            pass
+    log.info(
+        "Startup phase done",
+        phase="warm_from_disk",
+        tenants=len(tenants),
+        warmed=warmed,
+        seconds=round(time.monotonic() - started, 3),
+    )
+
+    started = time.monotonic()
+    stale = [tid for tid in tenants if _should_refresh_snapshot(tid)]
+    slots = asyncio.Semaphore(STARTUP_REFRESH_CONCURRENCY)
+
+    async def _refresh(tid: str) -> bool:
+        async with slots:
+            try:
+                return await _async_refresh_snapshot(tid)
+            except Exception as e:
+                log.warning("Startup refresh failed", tenant_id=tid, error=str(e))
+                return False
+
+    results = await asyncio.gather(*(_refresh(tid) for tid in stale))
+    log.info(
+        "Startup phase done",
+        phase="refresh_from_api",
+        tenants=len(stale),
+        refreshed=sum(results),
+        failed=len(stale) - sum(results),
+        concurrency=STARTUP_REFRESH_CONCURRENCY,
+        seconds=round(time.monotonic() - started, 3),
+    )
 
 
 # ═══════════════════════════════════════════════════════════
@@ -1374,15 +1675,30 @@ def build_app(token: str) -> Application:
     """Build and configure the Telegram Application with all handlers."""
 
     async def _post_init(app: Application) -> None:
-        # Initial snapshot fetch for all tenants with active sessions
-        active_tenants = registry.get_active_tenant_ids()
-        for tid in active_tenants:
-            await _async_refresh_snapshot(tid)
-        app.create_task(_notification_poller(app))
+        # Must return quickly: updates are not handled until it does.
+        # Tenant snapshots are warmed in the background (_warm_tenants).
+        await asyncio.to_thread(updates_journal.migrate_legacy, Path(UPDATES_PATH))
+        app.create_task(_notification_dispatcher(app))
+        app.create_task(_warm_tenants())
         app.create_task(_snapshot_refresh_loop())
+        app.create_task(_journal_flush_loop())
         log.info("Background tasks started")
 
-    app = Application.builder().token(token).post_init(_post_init).build()
+    async def _post_shutdown(app: Application) -> None:
+        await api.close()
+        updates_journal.close()
+        notification_queue.close()
+        registry.flush()
+
+    app = (
+        Application.builder()
+        .token(token)
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        .rate_limiter(send_scheduler)
+        .concurrent_updates(update_processor)
+        .build()
+    )
 
     # ── Auth conversation (ConversationHandler) ──
     auth_conv = ConversationHandler(
@@ -1459,7 +1775,7 @@ def main() -> None:
         import asyncio
         from webhook_handler import run_webhook
         log.info("Starting in WEBHOOK mode", url=webhook_url)
-        asyncio.run(run_webhook(app))
+        asyncio.run(run_webhook(app, notifications=notification_queue))
     else:
         # ── Polling mode (local development) ──
         log.warning(
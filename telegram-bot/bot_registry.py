@@ -3,26 +3,60 @@ bot_registry.py — Central tenant/worker registry for Seedor Bot
 ================================================================
 Single source of truth for which tenants and workers are active.
 Wraps the session dicts and provides a clean API for handlers.
+
+Persistence is write-behind: mutations only mark the registry dirty, and
+a debounced flush (SEEDOR_SESSIONS_FLUSH_SECONDS) writes sessions.json
+atomically off the event loop, coalescing every change made in between.
+Call flush() on shutdown. The file layout is unchanged, so other readers
+(src/lib/telegram.ts) keep working.
+
+Reverse indexes (worker_id → chats, normalized phone → chats) are kept in
+step by every mutation and rebuilt on load, so notification fan-out
+resolves recipients in O(1) per worker. All writes must go through the
+mutation methods; the legacy dict properties are read-only views.
 """
 
+import asyncio
 import json
 import os
-from typing import Optional
+import tempfile
+import threading
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Iterable, Mapping, Optional
 
 from logger import get_logger
+from snapshot_index import normalize_phone
 
 log = get_logger("registry")
 
+SESSIONS_FLUSH_SECONDS = float(os.environ.get("SEEDOR_SESSIONS_FLUSH_SECONDS", "1.0"))
+
 
 class BotRegistry:
     """Manages worker sessions, selected tenants, and available tenants per chat."""
 
-    def __init__(self, sessions_path: str):
+    def __init__(self, sessions_path: str, flush_delay: float = SESSIONS_FLUSH_SECONDS):
         self._sessions_path = sessions_path
         self._workers: dict[int, str] = {}       # chat_id → worker_id
         self._phones: dict[int, str] = {}         # chat_id → normalized phone
         self._tenants: dict[int, str] = {}        # chat_id → selected tenant_id
         self._available: dict[int, list[dict]] = {}  # chat_id → list of {worker_id, tenant_id, ...}
+        self._chats_by_worker: dict[str, set[int]] = {}  # worker_id → chat_ids
+        self._chats_by_phone: dict[str, set[int]] = {}   # normalize_phone(phone) → chat_ids
+        self._identity_listeners: list[Callable[[int, Optional[str], Optional[str]], None]] = []
+
+        # Write-behind state: a generation bumps on every change; a write
+        # records the generation it captured, and stale writes are skipped.
+        self._flush_delay = flush_delay
+        self._generation = 0
+        self._written_generation = 0
+        self._write_lock = threading.Lock()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_in_progress = False
+        self.saves = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
         self._load()
 
     # ─── Persistence ──────────────────────────────────────
@@ -36,14 +70,14 @@ class BotRegistry:
             for key, value in raw.items():
                 chat_id = int(key)
                 if isinstance(value, str):
-                    self._workers[chat_id] = value
+                    self._set_worker(chat_id, value)
                 elif isinstance(value, dict):
                     wid = value.get("worker_id") or value.get("workerId")
                     if wid:
-                        self._workers[chat_id] = wid
+                        self._set_worker(chat_id, wid)
                     phone = value.get("phone")
                     if phone:
-                        self._phones[chat_id] = phone
+                        self._set_phone(chat_id, phone)
                     tid = value.get("tenant_id")
                     if tid:
                         self._tenants[chat_id] = tid
@@ -54,7 +88,77 @@ class BotRegistry:
             log.warning("Failed to load sessions", error=str(e))
 
     def save(self) -> None:
-        os.makedirs(os.path.dirname(self._sessions_path), exist_ok=True)
+        """Mark sessions as changed; a debounced flush writes them.
+
+        Outside a running event loop (scripts, tests) the write is immediate.
+        """
+        self._generation += 1
+        self.saves += 1
+        if self._flush_handle is not None or self._flush_in_progress:
+            return  # already scheduled; this change rides along
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        self._flush_handle = loop.call_later(self._flush_delay, self._start_flush, loop)
+
+    def flush(self) -> None:
+        """Write pending changes now, synchronously (e.g. on shutdown)."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._generation == self._written_generation:
+            return
+        self._write(self._build_payload(), self._generation)
+
+    @property
+    def dirty(self) -> bool:
+        return self._generation != self._written_generation
+
+    def _start_flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._flush_handle = None
+        if not self.dirty:
+            return
+        self._flush_in_progress = True
+        generation = self._generation
+        # Snapshot the dicts on the loop; serialize + write in a thread
+        payload = self._build_payload()
+        future = loop.run_in_executor(None, self._write, payload, generation)
+        future.add_done_callback(lambda f: self._on_flushed(f, loop))
+
+    def _on_flushed(self, future: "asyncio.Future[None]", loop: asyncio.AbstractEventLoop) -> None:
+        self._flush_in_progress = False
+        if not future.cancelled() and future.exception() is not None:
+            log.error("Failed to write sessions", error=str(future.exception()))
+        # Changes made while writing (or a failed write) need another flush
+        if self.dirty and self._flush_handle is None and not loop.is_closed():
+            self._flush_handle = loop.call_later(self._flush_delay, self._start_flush, loop)
+
+    def _write(self, payload: dict[str, dict], generation: int) -> None:
+        """Atomically write a payload captured at `generation`."""
+        with self._write_lock:
+            if generation <= self._written_generation:
+                return  # a newer state is already on disk
+            started = time.monotonic()
+            directory = os.path.dirname(self._sessions_path)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(payload, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self._sessions_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            self._written_generation = generation
+            self.flushes += 1
+            self.last_flush_seconds = time.monotonic() - started
+
+    def _build_payload(self) -> dict[str, dict]:
         payload: dict[str, dict] = {}
         for chat_id, worker_id in self._workers.items():
             entry: dict = {"worker_id": worker_id}
@@ -68,8 +172,17 @@ class BotRegistry:
             if avail:
                 entry["available_tenants"] = avail
             payload[str(chat_id)] = entry
-        with open(self._sessions_path, "w", encoding="utf-8") as f:
-            json.dump(payload, f, indent=2)
+        return payload
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "chats": len(self._workers),
+            "saves": self.saves,
+            "flushes": self.flushes,
+            "coalesced": max(0, self.saves - self.flushes),
+            "dirty": self.dirty,
+            "last_flush_seconds": round(self.last_flush_seconds, 4),
+        }
 
     # ─── Queries ──────────────────────────────────────────
 
@@ -95,6 +208,34 @@ class BotRegistry:
         """Return all tenant IDs with at least one active session."""
         return set(self._tenants.values())
 
+    def tenant_session_counts(self) -> dict[str, int]:
+        """Return tenant_id → number of chats that selected it."""
+        counts: dict[str, int] = {}
+        for tenant_id in self._tenants.values():
+            counts[tenant_id] = counts.get(tenant_id, 0) + 1
+        return counts
+
+    def chats_for_worker(self, worker_id: str) -> set[int]:
+        return self._chats_by_worker.get(worker_id, set())
+
+    def chats_for_phone(self, phone: str) -> set[int]:
+        return self._chats_by_phone.get(normalize_phone(phone), set())
+
+    def resolve_chat_ids(self, worker: dict) -> list[int]:
+        """Chats for a worker {id, phone}: by worker id, else by phone."""
+        chat_ids = self.chats_for_worker(worker.get("id") or "")
+        if not chat_ids and worker.get("phone"):
+            chat_ids = self.chats_for_phone(worker["phone"])
+        return list(chat_ids)
+
+    def resolve_recipients(self, workers: Iterable[dict]) -> list[tuple[dict, list[int]]]:
+        """Bulk resolve_chat_ids for a whole event: [(worker, chat_ids), ...]."""
+        return [
+            (worker, self.resolve_chat_ids(worker))
+            for worker in workers
+            if isinstance(worker, dict)
+        ]
+
     # ─── Mutations ────────────────────────────────────────
 
     def register(
@@ -105,48 +246,115 @@ class BotRegistry:
         phone: str = "",
         available_tenants: Optional[list[dict]] = None,
     ) -> None:
-        self._workers[chat_id] = worker_id
+        self._set_worker(chat_id, worker_id)
         self._tenants[chat_id] = tenant_id
         if phone:
-            self._phones[chat_id] = phone
+            self._set_phone(chat_id, phone)
         if available_tenants is not None:
             self._available[chat_id] = available_tenants
         self.save()
+        self._identity_changed(chat_id)
 
     def switch_tenant(self, chat_id: int, tenant_id: str, worker_id: str) -> None:
-        self._workers[chat_id] = worker_id
+        changed = self._workers.get(chat_id) != worker_id
+        self._set_worker(chat_id, worker_id)
         self._tenants[chat_id] = tenant_id
         self.save()
+        if changed:
+            self._identity_changed(chat_id)
+
+    def set_worker(self, chat_id: int, worker_id: str) -> None:
+        if self._workers.get(chat_id) == worker_id:
+            return
+        self._set_worker(chat_id, worker_id)
+        self.save()
+        self._identity_changed(chat_id)
 
     def set_phone(self, chat_id: int, phone: str) -> None:
-        self._phones[chat_id] = phone
+        if self._phones.get(chat_id) == phone:
+            return
+        self._set_phone(chat_id, phone)
         self.save()
+        self._identity_changed(chat_id)
 
     def set_available_tenants(self, chat_id: int, tenants: list[dict]) -> None:
         self._available[chat_id] = tenants
         self.save()
 
+    def forget_worker(self, chat_id: int) -> None:
+        """Drop the chat's worker identity (worker + phone), keeping tenants."""
+        self._drop_worker(chat_id)
+        self._drop_phone(chat_id)
+        self.save()
+
     def unregister(self, chat_id: int) -> None:
-        self._workers.pop(chat_id, None)
-        self._phones.pop(chat_id, None)
+        self._drop_worker(chat_id)
+        self._drop_phone(chat_id)
         self._tenants.pop(chat_id, None)
         self._available.pop(chat_id, None)
         self.save()
 
+    def add_identity_listener(
+        self, listener: Callable[[int, Optional[str], Optional[str]], None]
+    ) -> None:
+        """Call listener(chat_id, worker_id, phone) when a chat gains an identity."""
+        self._identity_listeners.append(listener)
+
+    def _identity_changed(self, chat_id: int) -> None:
+        worker_id, phone = self._workers.get(chat_id), self._phones.get(chat_id)
+        for listener in self._identity_listeners:
+            try:
+                listener(chat_id, worker_id, phone)
+            except Exception as e:
+                log.error("Identity listener failed", chat_id=chat_id, error=str(e))
+
+    # ─── Index maintenance ────────────────────────────────
+
+    def _set_worker(self, chat_id: int, worker_id: str) -> None:
+        self._drop_worker(chat_id)
+        self._workers[chat_id] = worker_id
+        self._chats_by_worker.setdefault(worker_id, set()).add(chat_id)
+
+    def _drop_worker(self, chat_id: int) -> None:
+        old = self._workers.pop(chat_id, None)
+        if old is not None:
+            _discard(self._chats_by_worker, old, chat_id)
+
+    def _set_phone(self, chat_id: int, phone: str) -> None:
+        self._drop_phone(chat_id)
+        self._phones[chat_id] = phone
+        self._chats_by_phone.setdefault(normalize_phone(phone), set()).add(chat_id)
+
+    def _drop_phone(self, chat_id: int) -> None:
+        old = self._phones.pop(chat_id, None)
+        if old is not None:
+            _discard(self._chats_by_phone, normalize_phone(old), chat_id)
+
     # ─── Legacy compat (dict-like access used by bot.py) ──
 
+    # Read-only views: mutate through the methods above so the reverse
+    # indexes and the write-behind flush stay in step.
+
     @property
-    def workers(self) -> dict[int, str]:
-        return self._workers
+    def workers(self) -> Mapping[int, str]:
+        return MappingProxyType(self._workers)
 
     @property
-    def phones(self) -> dict[int, str]:
-        return self._phones
+    def phones(self) -> Mapping[int, str]:
+        return MappingProxyType(self._phones)
 
     @property
-    def tenants(self) -> dict[int, str]:
-        return self._tenants
+    def tenants(self) -> Mapping[int, str]:
+        return MappingProxyType(self._tenants)
 
     @property
-    def available(self) -> dict[int, list[dict]]:
-        return self._available
+    def available(self) -> Mapping[int, list[dict]]:
+        return MappingProxyType(self._available)
+
+
+def _discard(index: dict[str, set[int]], key: str, chat_id: int) -> None:
+    chats = index.get(key)
+    if chats is not None:
+        chats.discard(chat_id)
+        if not chats:
+            del index[key]
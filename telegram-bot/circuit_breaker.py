@@ -0,0 +1,174 @@
+"""
+circuit_breaker.py — Per-endpoint circuit breakers for Seedor API calls
+=======================================================================
+When the Seedor API is down, every caller would otherwise walk through its
+full retry schedule before giving up. A breaker counts consecutive
+failures per endpoint; after `failure_threshold` of them it opens and
+calls fail immediately with CircuitOpenError for `reset_timeout` seconds.
+Then a single probe call is let through (half-open): success closes the
+circuit, failure opens it for another cool-down.
+
+Only transient failures count (connection errors, timeouts, 5xx, 429, as
+classified by retry.classify_error) — a 404 means the API is up.
+
+Breakers are used from a single event loop (no locking).
+
+Usage:
+    breakers = CircuitBreakerRegistry(failure_threshold=5, reset_timeout=30)
+    breaker = breakers.get("/api/telegram/updates")
+    breaker.before_call()          # raises CircuitOpenError while open
+    ... call ...
+    breaker.record_success()       # or record_failure()
+"""
+
+import os
+import re
+import time
+from typing import Any, Optional
+
+from logger import get_logger
+from metrics import metrics
+
+log = get_logger("circuit_breaker")
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("SEEDOR_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("SEEDOR_CIRCUIT_RESET_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Path segments that are ids (CUIDs, numbers, UUIDs) collapse to ':id'
+_ID_SEGMENT_RE = re.compile(
+    r"^(c[a-z0-9]{20,30}|\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})$"
+)
+
+
+def endpoint_key(path: str) -> str:
+    """Breaker key for a request path: no query string, ids replaced by ':id'."""
+    path = path.split("?", 1)[0]
+    return "/".join(
+        ":id" if _ID_SEGMENT_RE.match(segment) else segment
+        for segment in path.split("/")
+    )
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit is open."""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Circuit open for {endpoint} (retry in {retry_in:.1f}s)")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe."""
+
+    def __init__(
+        self,
+        endpoint: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_SECONDS,
+    ):
+        self.endpoint = endpoint
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    def retry_in(self) -> float:
+        """Seconds until the next probe is allowed (0 when not open)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self._reset_timeout - time.monotonic())
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected (open, or half-open with a probe out)."""
+        if self.state == OPEN:
+            return self.retry_in() > 0
+        return self.state == HALF_OPEN and self._probe_in_flight
+
+    def before_call(self) -> None:
+        """Admit a call or raise CircuitOpenError."""
+        if self.state == OPEN and self.retry_in() <= 0:
+            self._transition(HALF_OPEN)
+        if self.state == CLOSED:
+            return
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        self.short_circuited += 1
+        raise CircuitOpenError(self.endpoint, self.retry_in())
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        if self.state != CLOSED:
+            self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or (
+            self.state == CLOSED and self.consecutive_failures >= self._failure_threshold
+        ):
+            self._opened_at = time.monotonic()
+            self.times_opened += 1
+            self._transition(OPEN)
+
+    def release(self) -> None:
+        """Give back a half-open probe slot without an outcome (e.g. cancelled)."""
+        self._probe_in_flight = False
+
+    def _transition(self, state: str) -> None:
+        previous, self.state = self.state, state
+        metrics.incr("circuit_transitions", endpoint=self.endpoint, to=state)
+        log_fn = log.warning if state == OPEN else log.info
+        log_fn(
+            "Circuit state changed",
+            endpoint=self.endpoint,
+            previous=previous,
+            state=state,
+            consecutive_failures=self.consecutive_failures,
+            reset_timeout_seconds=self._reset_timeout,
+        )
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited,
+            "retry_in_seconds": round(self.retry_in(), 1),
+        }
+
+
+class CircuitBreakerRegistry:
+    """Lazily creates one CircuitBreaker per endpoint key."""
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_SECONDS,
+    ):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def get(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(endpoint, self._failure_threshold, self._reset_timeout)
+            self._breakers[endpoint] = breaker
+        return breaker
+
+    def find(self, endpoint: str) -> Optional[CircuitBreaker]:
+        return self._breakers.get(endpoint)
+
+    def stats(self) -> dict[str, Any]:
+        return {key: breaker.stats() for key, breaker in self._breakers.items()}
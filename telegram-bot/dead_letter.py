@@ -0,0 +1,306 @@
+"""
+dead_letter.py — SQLite-backed dead-letter queue
+================================================
+Events that failed after all retries (or that the API rejected) are kept
+here for inspection and replay. Replaces the dead_letter.json file, which
+was parsed and rewritten in full on every add/size/peek.
+
+Storage is a SQLite database in WAL mode, so the bot and sync_service can
+write concurrently. Appends are a single INSERT; the number of pending
+entries is kept in a counter table by triggers, so size() is O(1). Event
+type and error are indexed for queries.
+
+Each entry records its replay outcome (see sync_service.py --dlq-replay):
+successfully replayed entries are marked 'replayed' (and no longer
+counted), failed replays bump replay_attempts and keep the last error.
+
+Usage:
+    dlq = DeadLetterQueue(Path("data/dead_letter.db"),
+                          legacy_json=Path("data/dead_letter.json"))
+    dlq.add(event, error="timeout after 3 retries")
+    dlq.size()
+    dlq.query(event_type="TASK_COMPLETED", error_like="Task % not found")
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from logger import get_logger
+
+log = get_logger("dead_letter")
+
+PENDING = "pending"
+REPLAYED = "replayed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type      TEXT NOT NULL,
+    event_json      TEXT NOT NULL,
+    error           TEXT NOT NULL,
+    failed_at       TEXT NOT NULL,
+    retry_count     INTEGER NOT NULL DEFAULT 0,
+    status          TEXT NOT NULL DEFAULT 'pending',
+    replay_attempts INTEGER NOT NULL DEFAULT 0,
+    last_replay_at  TEXT,
+    last_replay_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_dead_letters_status_type ON dead_letters(status, event_type);
+CREATE INDEX IF NOT EXISTS idx_dead_letters_status_error ON dead_letters(status, error);
+
+CREATE TABLE IF NOT EXISTS dead_letter_counts (
+    status TEXT PRIMARY KEY,
+    n      INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO dead_letter_counts (status, n) VALUES ('pending', 0), ('replayed', 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_dead_letters_insert AFTER INSERT ON dead_letters
+BEGIN
+    UPDATE dead_letter_counts SET n = n + 1 WHERE status = NEW.status;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_dead_letters_delete AFTER DELETE ON dead_letters
+BEGIN
+    UPDATE dead_letter_counts SET n = n - 1 WHERE status = OLD.status;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_dead_letters_status AFTER UPDATE OF status ON dead_letters
+WHEN OLD.status != NEW.status
+BEGIN
+    UPDATE dead_letter_counts SET n = n - 1 WHERE status = OLD.status;
+    UPDATE dead_letter_counts SET n = n + 1 WHERE status = NEW.status;
+END;
+"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class DeadLetterQueue:
+    """Persistent dead-letter queue for events that failed after all retries.
+
+    Entries are returned as dicts:
+    {
+        "id": 12,
+        "original_event": {...},
+        "error": "description",
+        "failed_at": "2026-03-04T12:00:00Z",
+        "retry_count": 3,
+        "status": "pending",
+        "replay_attempts": 0,
+        "last_replay_at": null,
+        "last_replay_error": null
+    }
+    """
+
+    def __init__(self, path: Path, legacy_json: Optional[Path] = None):
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self._path), timeout=10.0, isolation_level=None, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        if legacy_json is not None:
+            self._migrate_legacy(Path(legacy_json))
+
+    # ─── Writes ───────────────────────────────────────────
+
+    def add(self, event: dict, error: str, retry_count: int = 0) -> None:
+        """Add a failed event to the dead-letter queue."""
+        self.add_many([(event, error)], retry_count=retry_count)
+        log.warning(
+            "Event moved to dead-letter queue",
+            event_type=event.get("type", "unknown"),
+            error=error,
+            dlq_size=self.size(),
+        )
+
+    def add_many(self, failures: Iterable[tuple[dict, str]], retry_count: int = 0) -> int:
+        """Add several (event, error) pairs in one transaction. Returns count."""
+        failed_at = _now()
+        rows = [
+            (
+                event.get("type", "unknown"),
+                json.dumps(event, ensure_ascii=False),
+                error,
+                failed_at,
+                retry_count,
+            )
+            for event, error in failures
+        ]
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT INTO dead_letters (event_type, event_json, error, failed_at, retry_count)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def mark_replayed(self, ids: list[int]) -> None:
+        """Record a successful replay (entries stop counting as pending)."""
+        if not ids:
+            return
+        now = _now()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "UPDATE dead_letters SET status = ?, replay_attempts = replay_attempts + 1,"
+                " last_replay_at = ?, last_replay_error = NULL WHERE id = ?",
+                [(REPLAYED, now, entry_id) for entry_id in ids],
+            )
+
+    def mark_replay_failed(self, failures: list[tuple[int, str]]) -> None:
+        """Record failed replays as (id, error); entries stay pending."""
+        if not failures:
+            return
+        now = _now()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "UPDATE dead_letters SET replay_attempts = replay_attempts + 1,"
+                " last_replay_at = ?, last_replay_error = ? WHERE id = ?",
+                [(now, error, entry_id) for entry_id, error in failures],
+            )
+
+    def pop(self, count: int = 1) -> list[dict]:
+        """Remove and return the oldest pending events."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute(
+                "SELECT * FROM dead_letters WHERE status = ? ORDER BY id LIMIT ?",
+                (PENDING, count),
+            ).fetchall()
+            self._conn.executemany(
+                "DELETE FROM dead_letters WHERE id = ?", [(row["id"],) for row in rows]
+            )
+        return [self._entry(row) for row in rows]
+
+    def clear(self) -> int:
+        """Clear all pending events. Returns count of cleared events."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            return self._conn.execute(
+                "DELETE FROM dead_letters WHERE status = ?", (PENDING,)
+            ).rowcount
+
+    # ─── Reads ────────────────────────────────────────────
+
+    def size(self, status: str = PENDING) -> int:
+        """Number of entries with this status (O(1), trigger-maintained)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT n FROM dead_letter_counts WHERE status = ?", (status,)
+            ).fetchone()
+        return row["n"] if row else 0
+
+    def peek(self, limit: int = 10) -> list[dict]:
+        """View the oldest pending events without removing them."""
+        return self.query(limit=limit)
+
+    def query(
+        self,
+        event_type: Optional[str] = None,
+        error_like: Optional[str] = None,
+        status: str = PENDING,
+        after_id: int = 0,
+        limit: int = 100,
+    ) -> list[dict]:
+        """Entries filtered by type and/or error (SQL LIKE pattern), oldest first."""
+        sql = "SELECT * FROM dead_letters WHERE status = ? AND id > ?"
+        params: list[Any] = [status, after_id]
+        if event_type:
+            sql += " AND event_type = ?"
+            params.append(event_type)
+        if error_like:
+            sql += " AND error LIKE ?"
+            params.append(error_like)
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def counts_by_type(self, status: str = PENDING) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT event_type, COUNT(*) AS n FROM dead_letters WHERE status = ?"
+                " GROUP BY event_type ORDER BY n DESC",
+                (status,),
+            ).fetchall()
+        return {row["event_type"]: row["n"] for row in rows}
+
+    def top_errors(self, limit: int = 10, status: str = PENDING) -> list[tuple[str, int]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT error, COUNT(*) AS n FROM dead_letters WHERE status = ?"
+                " GROUP BY error ORDER BY n DESC LIMIT ?",
+                (status, limit),
+            ).fetchall()
+        return [(row["error"], row["n"]) for row in rows]
+
+    def stats(self) -> dict[str, Any]:
+        return {"pending": self.size(PENDING), "replayed": self.size(REPLAYED)}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> dict:
+        return {
+            "id": row["id"],
+            "original_event": json.loads(row["event_json"]),
+            "error": row["error"],
+            "failed_at": row["failed_at"],
+            "retry_count": row["retry_count"],
+            "status": row["status"],
+            "replay_attempts": row["replay_attempts"],
+            "last_replay_at": row["last_replay_at"],
+            "last_replay_error": row["last_replay_error"],
+        }
+
+    # ─── Migration ────────────────────────────────────────
+
+    def _migrate_legacy(self, path: Path) -> None:
+        """Import a legacy dead_letter.json once, then rename it to *.migrated."""
+        if not path.exists():
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entries = json.load(f).get("events", [])
+        except (json.JSONDecodeError, OSError, AttributeError) as e:
+            log.error("Legacy dead-letter file unreadable, leaving it in place", path=str(path), error=str(e))
+            return
+        rows = [
+            (
+                entry.get("original_event", {}).get("type", "unknown"),
+                json.dumps(entry.get("original_event", {}), ensure_ascii=False),
+                entry.get("error", ""),
+                entry.get("failed_at") or _now(),
+                entry.get("retry_count", 0),
+            )
+            for entry in entries
+        ]
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            # Another process may have migrated it while we waited for the lock
+            if not path.exists():
+                return
+            self._conn.executemany(
+                "INSERT INTO dead_letters (event_type, event_json, error, failed_at, retry_count)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            os.replace(path, path.with_name(path.name + ".migrated"))
+        log.info("Legacy dead-letter file migrated", events=len(rows), path=str(path))
@@ -0,0 +1,511 @@
+"""
+delta_sync.py — Incremental snapshot sync (version cursors + conditional GETs)
+==============================================================================
+Instead of downloading the whole tenant snapshot every cycle, the client
+sends what it already has and the server answers with the smallest thing
+that brings it up to date.
+
+Protocol (GET /api/telegram/snapshot?tenantId=<id>&since=<version>):
+    Request headers:
+        If-None-Match: <etag of the last response>
+    Responses:
+        304              — nothing changed since the ETag/version
+        200 full         — a regular snapshot (plus "version"/"checksum" keys
+                           when the server supports delta sync)
+        200 delta        — {"delta": true, "base_version", "version",
+                            "generated_at", "tenant", "checksum",
+                            "upserts": {"workers", "fields", "lots", "tasks"},
+                            "deletes": {"workers", "fields", "lots", "tasks"}}
+    Delta lots carry their "field_id"; delta fields carry no "lots".
+
+The checksum is an order-independent multiset hash (sum of per-entity
+SHA-256 digests mod 2^256), so the client can verify a delta by updating
+the base checksum with just the changed entities. A delta whose base
+version differs from the local one (gap) or whose checksum does not match
+is rejected, and the client falls back to a full fetch.
+
+Servers that do not know the protocol ignore `since`/If-None-Match and
+return a full snapshot, which is handled as a regular full fetch.
+
+This module also contains a local stand-in for the endpoint, so the mode
+can be exercised offline and its savings measured:
+
+    python delta_sync.py --serve [--port 3001]   # stand-in API with changing data
+    python delta_sync.py --bench                 # full vs delta bytes/CPU
+"""
+
+import asyncio
+import hashlib
+import json
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from logger import get_logger
+from snapshot_cache import snapshot_version
+
+log = get_logger("delta_sync")
+
+ENTITY_KINDS = ("workers", "fields", "lots", "tasks")
+_CHECKSUM_MOD = 1 << 256
+
+# Same ordering the API uses, so a patched snapshot renders like a full one
+_SORT_KEYS: dict[str, Callable[[dict], Any]] = {
+    "workers": lambda w: w.get("last_name") or "",
+    "fields": lambda f: f.get("name") or "",
+    "lots": lambda l: l.get("name") or "",
+    "tasks": lambda t: t.get("due_date") or "",
+}
+
+# (status, headers, body) as returned by a transport
+RawResponse = tuple[int, dict[str, str], bytes]
+
+
+class DeltaError(Exception):
+    """A delta cannot be applied — the caller should do a full fetch."""
+
+
+class DeltaGapError(DeltaError):
+    """The delta's base version is not the local version."""
+
+
+class DeltaChecksumError(DeltaError):
+    """The patched snapshot does not match the server checksum."""
+
+
+# ─── Checksums ────────────────────────────────────────────
+
+def _entity_digest(kind: str, entity: dict) -> int:
+    payload = kind + "\x00" + json.dumps(
+        entity, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return int.from_bytes(hashlib.sha256(payload.encode("utf-8")).digest(), "big")
+
+
+def _field_meta(field: dict) -> dict:
+    return {k: v for k, v in field.items() if k != "lots"}
+
+
+def _flat_lots(snapshot: dict) -> dict[str, dict]:
+    """lot_id → lot record including its field_id."""
+    return {
+        lot["id"]: {**lot, "field_id": field["id"]}
+        for field in snapshot.get("fields", [])
+        for lot in field.get("lots", [])
+    }
+
+
+def _entities(snapshot: dict, kind: str) -> dict[str, dict]:
+    if kind == "lots":
+        return _flat_lots(snapshot)
+    if kind == "fields":
+        return {f["id"]: _field_meta(f) for f in snapshot.get("fields", [])}
+    return {e["id"]: e for e in snapshot.get(kind, [])}
+
+
+def _checksum_int(snapshot: dict) -> int:
+    total = 0
+    for kind in ENTITY_KINDS:
+        for entity in _entities(snapshot, kind).values():
+            total += _entity_digest(kind, entity)
+    return total % _CHECKSUM_MOD
+
+
+def snapshot_checksum(snapshot: dict) -> str:
+    """Order-independent content checksum of a snapshot (64 hex chars)."""
+    return f"{_checksum_int(snapshot):064x}"
+
+
+# ─── Delta computation / application ──────────────────────
+
+def compute_delta(base: dict, target: dict) -> dict:
+    """Return the delta that turns `base` into `target`."""
+    upserts: dict[str, list[dict]] = {}
+    deletes: dict[str, list[str]] = {}
+    for kind in ENTITY_KINDS:
+        old = _entities(base, kind)
+        new = _entities(target, kind)
+        upserts[kind] = [e for eid, e in new.items() if old.get(eid) != e]
+        deletes[kind] = [eid for eid in old if eid not in new]
+    return {
+        "delta": True,
+        "base_version": snapshot_version(base),
+        "version": snapshot_version(target),
+        "generated_at": target.get("generated_at"),
+        "tenant": target.get("tenant"),
+        "checksum": target.get("checksum") or snapshot_checksum(target),
+        "upserts": upserts,
+        "deletes": deletes,
+    }
+
+
+def _patch(
+    kind: str,
+    current: dict[str, dict],
+    upserts: list[dict],
+    deletes: list[str],
+    total: int,
+) -> int:
+    """Apply upserts/deletes to `current` in place, updating the checksum."""
+    for eid in deletes:
+        old = current.pop(eid, None)
+        if old is not None:
+            total -= _entity_digest(kind, old)
+    for entity in upserts:
+        old = current.get(entity["id"])
+        if old is not None:
+            total -= _entity_digest(kind, old)
+        current[entity["id"]] = entity
+        total += _entity_digest(kind, entity)
+    return total
+
+
+def apply_delta(base: dict, delta: dict) -> dict:
+    """Return a new snapshot = base + delta. `base` is not modified.
+
+    Raises DeltaGapError / DeltaChecksumError when the delta does not fit.
+    """
+    local_version = snapshot_version(base)
+    if delta.get("base_version") != local_version:
+        raise DeltaGapError(
+            f"delta base {delta.get('base_version')!r} != local {local_version!r}"
+        )
+
+    base_checksum = base.get("checksum")
+    try:
+        total = int(base_checksum, 16) if base_checksum else _checksum_int(base)
+    except (TypeError, ValueError):
+        total = _checksum_int(base)
+
+    upserts = delta.get("upserts", {})
+    deletes = delta.get("deletes", {})
+    patched: dict[str, dict[str, dict]] = {}
+    for kind in ENTITY_KINDS:
+        current = _entities(base, kind)
+        if upserts.get(kind) or deletes.get(kind):
+            total = _patch(kind, current, upserts.get(kind, []), deletes.get(kind, []), total)
+        patched[kind] = current
+
+    # Lots of deleted fields go with them
+    for lot_id, lot in list(patched["lots"].items()):
+        if lot["field_id"] not in patched["fields"]:
+            total -= _entity_digest("lots", lot)
+            del patched["lots"][lot_id]
+
+    checksum = f"{total % _CHECKSUM_MOD:064x}"
+    if delta.get("checksum") and delta["checksum"] != checksum:
+        raise DeltaChecksumError("checksum mismatch after applying delta")
+
+    lots_by_field: dict[str, list[dict]] = {}
+    for lot in patched["lots"].values():
+        record = {k: v for k, v in lot.items() if k != "field_id"}
+        lots_by_field.setdefault(lot["field_id"], []).append(record)
+
+    fields = []
+    for field_id, meta in patched["fields"].items():
+        lots = sorted(lots_by_field.get(field_id, []), key=_SORT_KEYS["lots"])
+        fields.append({**meta, "lots": lots})
+
+    return {
+        **{k: v for k, v in base.items() if k not in ENTITY_KINDS},
+        "generated_at": delta.get("generated_at", base.get("generated_at")),
+        "tenant": delta.get("tenant") or base.get("tenant"),
+        "version": delta.get("version"),
+        "checksum": checksum,
+        "workers": sorted(patched["workers"].values(), key=_SORT_KEYS["workers"]),
+        "fields": sorted(fields, key=_SORT_KEYS["fields"]),
+        "tasks": sorted(patched["tasks"].values(), key=_SORT_KEYS["tasks"]),
+    }
+
+
+# ─── Client ───────────────────────────────────────────────
+
+class DeltaSyncClient:
+    """Client side of the incremental sync protocol, transport-agnostic.
+
+    The caller supplies `fetch(params, headers) -> (status, headers, body)`
+    for GET /api/telegram/snapshot; the client adds the cursor params and
+    conditional headers, applies deltas, and falls back to a full fetch.
+    Use sync() with a blocking fetch and sync_async() with a coroutine one.
+    """
+
+    def __init__(self) -> None:
+        self._etags: dict[str, str] = {}
+        self.requests = 0
+        self.not_modified = 0
+        self.deltas = 0
+        self.full = 0
+        self.fallbacks = 0
+        self.bytes_received = 0
+        self.cpu_seconds = 0.0
+
+    def sync(
+        self,
+        tenant_id: str,
+        local: Optional[dict],
+        fetch: Callable[[dict[str, str], dict[str, str]], RawResponse],
+    ) -> tuple[dict, bool]:
+        """Bring `local` up to date. Returns (snapshot, changed).
+
+        `local` may be None (no snapshot yet) and is never modified.
+        """
+        params, headers = self.conditional_request(tenant_id, local)
+        response = fetch(params, headers)
+        try:
+            return self.handle_response(tenant_id, local, response)
+        except DeltaError as e:
+            self.fallbacks += 1
+            log.warning("Delta rejected, doing full fetch", tenant_id=tenant_id, error=str(e))
+            return self.handle_response(tenant_id, None, fetch({"tenantId": tenant_id}, {}))
+
+    async def sync_async(
+        self,
+        tenant_id: str,
+        local: Optional[dict],
+        fetch: Callable[[dict[str, str], dict[str, str]], Awaitable[RawResponse]],
+    ) -> tuple[dict, bool]:
+        """Async variant of sync(). Parsing and patching run in a worker
+        thread so large snapshots do not stall the event loop."""
+        params, headers = self.conditional_request(tenant_id, local)
+        response = await fetch(params, headers)
+        try:
+            return await asyncio.to_thread(self.handle_response, tenant_id, local, response)
+        except DeltaError as e:
+            self.fallbacks += 1
+            log.warning("Delta rejected, doing full fetch", tenant_id=tenant_id, error=str(e))
+            response = await fetch({"tenantId": tenant_id}, {})
+            return await asyncio.to_thread(self.handle_response, tenant_id, None, response)
+
+    def conditional_request(
+        self, tenant_id: str, local: Optional[dict]
+    ) -> tuple[dict[str, str], dict[str, str]]:
+        """Query params and headers for a conditional snapshot GET."""
+        params = {"tenantId": tenant_id}
+        headers: dict[str, str] = {}
+        if local is not None:
+            version = snapshot_version(local)
+            if version:
+                params["since"] = version
+            etag = self._etags.get(tenant_id)
+            if etag:
+                headers["If-None-Match"] = etag
+        return params, headers
+
+    def handle_response(
+        self, tenant_id: str, local: Optional[dict], response: RawResponse
+    ) -> tuple[dict, bool]:
+        status, headers, body = response
+        self.requests += 1
+        self.bytes_received += len(body)
+        cpu_start = time.process_time()
+        try:
+            if status == 304:
+                if local is None:
+                    raise DeltaGapError("304 without a local snapshot")
+                self.not_modified += 1
+                return local, False
+
+            payload = json.loads(body.decode("utf-8"))
+            etag = _header(headers, "ETag")
+            if payload.get("delta"):
+                if local is None:
+                    raise DeltaGapError("delta without a local snapshot")
+                snapshot = apply_delta(local, payload)
+                self.deltas += 1
+            else:
+                snapshot = payload
+                self.full += 1
+            if etag:
+                self._etags[tenant_id] = etag
+            else:
+                self._etags.pop(tenant_id, None)
+            return snapshot, True
+        finally:
+            self.cpu_seconds += time.process_time() - cpu_start
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "not_modified": self.not_modified,
+            "deltas": self.deltas,
+            "full": self.full,
+            "fallbacks": self.fallbacks,
+            "bytes_received": self.bytes_received,
+            "cpu_seconds": round(self.cpu_seconds, 4),
+        }
+
+
+def _header(headers: dict[str, str], name: str) -> str:
+    lowered = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lowered:
+            return value
+    return ""
+
+
+# ─── Local stand-in endpoint ──────────────────────────────
+
+class StandInSnapshotEndpoint:
+    """In-memory implementation of the server side of the protocol.
+
+    publish() stamps each new tenant snapshot with a monotonic version and
+    checksum; handle() answers GETs with 304, a delta against any version
+    still in history, or the full snapshot.
+    """
+
+    def __init__(self, max_history: int = 20):
+        self._max_history = max_history
+        self._history: dict[str, "OrderedDict[str, dict]"] = {}
+        self._counters: dict[str, int] = {}
+
+    def publish(self, tenant_id: str, snapshot: dict) -> str:
+        history = self._history.setdefault(tenant_id, OrderedDict())
+        self._counters[tenant_id] = self._counters.get(tenant_id, 0) + 1
+        version = str(self._counters[tenant_id])
+        stamped = {**snapshot, "version": version, "checksum": snapshot_checksum(snapshot)}
+        history[version] = stamped
+        while len(history) > self._max_history:
+            history.popitem(last=False)
+        return version
+
+    def current(self, tenant_id: str) -> Optional[dict]:
+        history = self._history.get(tenant_id)
+        if not history:
+            return None
+        return next(reversed(history.values()))
+
+    def handle(self, tenant_id: str, since: str = "", if_none_match: str = "") -> RawResponse:
+        current = self.current(tenant_id)
+        if current is None:
+            body = json.dumps({"error": "Tenant not found"}).encode("utf-8")
+            return 404, {"Content-Type": "application/json"}, body
+
+        etag = f'"{current["version"]}"'
+        headers = {"Content-Type": "application/json", "ETag": etag}
+        if if_none_match == etag or since == current["version"]:
+            return 304, headers, b""
+
+        base = self._history[tenant_id].get(since) if since else None
+        payload = compute_delta(base, current) if base is not None else current
+        return 200, headers, json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def make_stand_in_app(endpoint: StandInSnapshotEndpoint, api_key: str = ""):
+    """aiohttp app serving GET /api/telegram/snapshot from `endpoint`."""
+    from aiohttp import web
+
+    async def snapshot_handler(request: web.Request) -> web.Response:
+        if api_key and request.headers.get("Authorization", "") != f"Bearer {api_key}":
+            return web.json_response({"error": "Unauthorized"}, status=401)
+        status, headers, body = endpoint.handle(
+            request.query.get("tenantId", ""),
+            since=request.query.get("since", ""),
+            if_none_match=request.headers.get("If-None-Match", ""),
+        )
+        return web.Response(status=status, body=body or None, headers=headers)
+
+    webapp = web.Application()
+    webapp.router.add_get("/api/telegram/snapshot", snapshot_handler)
+    return webapp
+
+
+def _mutate(snapshot: dict, rng, changes: int) -> dict:
+    """Return a copy of `snapshot` with `changes` tasks updated/replaced."""
+    tasks = list(snapshot["tasks"])
+    for _ in range(changes):
+        i = rng.randrange(len(tasks))
+        task = dict(tasks[i])
+        if rng.random() < 0.5:
+            task["status"] = rng.choice(["PENDING", "IN_PROGRESS", "LATE"])
+        else:
+            task["id"] = task["id"][:-6] + f"{rng.randrange(16**6):06x}"
+        tasks[i] = task
+    return {**snapshot, "tasks": tasks}
+
+
+def _bench(cycles: int = 10, changes: int = 50) -> None:
+    """Compare full fetches against delta sync on a large synthetic tenant."""
+    import random
+    from mock_data import build_large_snapshot
+
+    rng = random.Random(1)
+    endpoint = StandInSnapshotEndpoint()
+    snapshot = build_large_snapshot()
+    tenant_id = snapshot["tenant"]["id"]
+    endpoint.publish(tenant_id, snapshot)
+
+    full_client, delta_client = DeltaSyncClient(), DeltaSyncClient()
+    full_local: Optional[dict] = None
+    delta_local: Optional[dict] = None
+
+    def fetch_full(params, headers):
+        return endpoint.handle(tenant_id)
+
+    def fetch_delta(params, headers):
+        return endpoint.handle(
+            tenant_id,
+            since=params.get("since", ""),
+            if_none_match=headers.get("If-None-Match", ""),
+        )
+
+    for cycle in range(cycles):
+        full_local, _ = full_client.sync(tenant_id, full_local, fetch_full)
+        delta_local, _ = delta_client.sync(tenant_id, delta_local, fetch_delta)
+        # Every other cycle nothing changes (304 path)
+        if cycle % 2 == 0:
+            snapshot = _mutate(snapshot, rng, changes)
+            endpoint.publish(tenant_id, snapshot)
+
+    assert delta_local is not None and full_local is not None
+    assert snapshot_checksum(delta_local) == snapshot_checksum(full_local)
+    print(json.dumps({
+        "cycles": cycles,
+        "changes_per_update": changes,
+        "tasks": len(snapshot["tasks"]),
+        "full": full_client.stats(),
+        "delta": delta_client.stats(),
+    }, indent=2))
+
+
+def _serve(port: int) -> None:
+    """Serve the stand-in endpoint with a mock tenant that changes every 30s."""
+    import asyncio
+    import os
+    import random
+
+    from aiohttp import web
+    from mock_data import build_large_snapshot
+
+    endpoint = StandInSnapshotEndpoint()
+    snapshot = build_large_snapshot(workers=200, tasks=2000, fields=5, lots_per_field=6)
+    tenant_id = os.environ.get("STAND_IN_TENANT_ID", snapshot["tenant"]["id"])
+    snapshot["tenant"]["id"] = tenant_id
+    endpoint.publish(tenant_id, snapshot)
+    api_key = os.environ.get("SEEDOR_API_KEY", "")
+
+    async def main() -> None:
+        nonlocal snapshot
+        rng = random.Random()
+        runner = web.AppRunner(make_stand_in_app(endpoint, api_key))
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        log.info("Stand-in snapshot API listening", port=port, tenant_id=tenant_id)
+        while True:
+            await asyncio.sleep(30)
+            snapshot = _mutate(snapshot, rng, 5)
+            log.info("Stand-in tenant changed", version=endpoint.publish(tenant_id, snapshot))
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        _bench()
+    elif "--serve" in sys.argv:
+        port = 3001
+        if "--port" in sys.argv:
+            port = int(sys.argv[sys.argv.index("--port") + 1])
+        _serve(port)
+    else:
+        print(__doc__)
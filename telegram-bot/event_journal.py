@@ -0,0 +1,398 @@
+"""
+event_journal.py — Append-only JSONL journal for queued worker events
+=====================================================================
+Replaces the read-modify-write updates_queue.json. Producers (the bot)
+append one JSON line per event; consumers (sync_service) read from their
+own committed offset and ack what they processed. Nothing is ever
+rewritten, so an event appended while a consumer is pushing can't be lost.
+
+Layout (data/updates_journal/):
+    segment-000000000001.jsonl   one event per line, rolled at max size
+    offsets/<consumer>.json      {"segment": n, "offset": bytes}
+    offsets/<consumer>.lock      held while a consumer reads/acks
+    journal.lock                 held (briefly) by appends, rolls, compaction
+
+Appends are O(1): one write under an exclusive flock on journal.lock, so
+several producer processes can share the journal. Writes go to the page
+cache immediately (they survive a process crash); fsync is batched —
+after `fsync_every` appends or `fsync_interval` seconds, on append_many()
+and on flush(). The interval check only runs on append, so producers call
+flush() every `fsync_interval` (bot.py's _journal_flush_loop); together
+that bounds what a power loss can take.
+
+Segments that every registered consumer has moved past are deleted by
+compact() (called after each ack).
+
+Usage:
+    journal = EventJournal(Path("data/updates_journal"))
+    journal.append(event)
+
+    with journal.consumer("sync_service") as c:   # exclusive per name
+        records = c.read(max_events=1000)
+        ...
+        c.ack(records[-1].position)
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Iterator, NamedTuple, Optional
+
+from logger import get_logger
+
+log = get_logger("event_journal")
+
+JOURNAL_SEGMENT_MAX_BYTES = int(os.environ.get("SEEDOR_JOURNAL_SEGMENT_MAX_BYTES", str(8 * 1024 * 1024)))
+JOURNAL_FSYNC_EVERY = int(os.environ.get("SEEDOR_JOURNAL_FSYNC_EVERY", "64"))
+JOURNAL_FSYNC_INTERVAL = float(os.environ.get("SEEDOR_JOURNAL_FSYNC_INTERVAL_SECONDS", "0.2"))
+
+_SEGMENT_PREFIX = "segment-"
+_SEGMENT_SUFFIX = ".jsonl"
+
+
+class Position(NamedTuple):
+    """A point in the journal: byte offset inside a segment."""
+
+    segment: int
+    offset: int
+
+
+class JournalRecord(NamedTuple):
+    event: dict
+    position: Position  # position right after this record (ack up to here)
+
+
+class JournalBusyError(Exception):
+    """Another process currently holds this consumer."""
+
+
+def _segment_name(seq: int) -> str:
+    return f"{_SEGMENT_PREFIX}{seq:012d}{_SEGMENT_SUFFIX}"
+
+
+@contextlib.contextmanager
+def _flock(path: Path, blocking: bool = True) -> Iterator[None]:
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            raise JournalBusyError(str(path)) from None
+        yield
+    finally:
+        os.close(fd)  # releases the lock
+
+
+class EventJournal:
+    """Segmented append-only journal with per-consumer offsets."""
+
+    def __init__(
+        self,
+        directory: Path,
+        segment_max_bytes: int = JOURNAL_SEGMENT_MAX_BYTES,
+        fsync_every: int = JOURNAL_FSYNC_EVERY,
+        fsync_interval: float = JOURNAL_FSYNC_INTERVAL,
+    ):
+        self._dir = Path(directory)
+        self._offsets_dir = self._dir / "offsets"
+        self._offsets_dir.mkdir(parents=True, exist_ok=True)
+        self._lock_path = self._dir / "journal.lock"
+        self._segment_max_bytes = segment_max_bytes
+        self._fsync_every = fsync_every
+        self._fsync_interval = fsync_interval
+
+        # Producer state (this process)
+        self._fd: Optional[int] = None
+        self._seq = 0
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+
+        self.appended = 0
+        self.fsyncs = 0
+        self.segments_rolled = 0
+        self.segments_compacted = 0
+
+    # ─── Producer ─────────────────────────────────────────
+
+    def append(self, event: dict) -> None:
+        """Append one event (O(1)); fsync is batched."""
+        line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+        with _flock(self._lock_path):
+            fd = self._writable_fd(len(line))
+            os.write(fd, line)
+            self.appended += 1
+            self._unsynced += 1
+            if (
+                self._unsynced >= self._fsync_every
+                or time.monotonic() - self._last_fsync >= self._fsync_interval
+            ):
+                self._fsync(fd)
+
+    def append_many(self, events: list[dict]) -> None:
+        """Append several events with one write and one fsync (group commit)."""
+        if not events:
+            return
+        data = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in events).encode("utf-8")
+        with _flock(self._lock_path):
+            fd = self._writable_fd(len(data))
+            os.write(fd, data)
+            self.appended += len(events)
+            self._fsync(fd)
+
+    @property
+    def fsync_interval(self) -> float:
+        return self._fsync_interval
+
+    @property
+    def unsynced(self) -> int:
+        """Appends by this process not yet fsynced."""
+        return self._unsynced
+
+    def flush(self) -> None:
+        """fsync any appends that are still only in the page cache."""
+        if self._fd is not None and self._unsynced:
+            with _flock(self._lock_path):
+                if self._fd is not None:
+                    self._fsync(self._fd)
+
+    def close(self) -> None:
+        self.flush()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _fsync(self, fd: int) -> None:
+        os.fsync(fd)
+        self.fsyncs += 1
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+
+    def _writable_fd(self, incoming: int) -> int:
+        """Return an fd for the active segment (journal lock held)."""
+        if self._fd is None:
+            self._reopen(self._latest_segment() or 1)
+        elif (
+            os.fstat(self._fd).st_nlink == 0
+            or (self._dir / _segment_name(self._seq + 1)).exists()
+        ):
+            # Another process rolled (or our segment was removed)
+            self._reopen(self._latest_segment() or self._seq + 1)
+        size = os.fstat(self._fd).st_size  # type: ignore[arg-type]
+        if size > 0 and size + incoming > self._segment_max_bytes:
+            self._roll()
+        return self._fd  # type: ignore[return-value]
+
+    def _reopen(self, seq: int) -> None:
+        if self._fd is not None:
+            if self._unsynced:
+                self._fsync(self._fd)
+            os.close(self._fd)
+        path = self._dir / _segment_name(seq)
+        created = not path.exists()
+        self._fd = os.open(str(path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._seq = seq
+        if created:
+            self._fsync_dir()
+
+    def _roll(self) -> None:
+        self._reopen(self._seq + 1)
+        self.segments_rolled += 1
+        log.info("Journal segment rolled", segment=self._seq)
+
+    def _fsync_dir(self) -> None:
+        dir_fd = os.open(str(self._dir), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    # ─── Segments ─────────────────────────────────────────
+
+    def _segments(self) -> list[int]:
+        seqs = []
+        for name in os.listdir(self._dir):
+            if name.startswith(_SEGMENT_PREFIX) and name.endswith(_SEGMENT_SUFFIX):
+                try:
+                    seqs.append(int(name[len(_SEGMENT_PREFIX):-len(_SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(seqs)
+
+    def _latest_segment(self) -> int:
+        segments = self._segments()
+        return segments[-1] if segments else 0
+
+    # ─── Consumers ────────────────────────────────────────
+
+    @contextlib.contextmanager
+    def consumer(self, name: str, blocking: bool = False) -> Iterator["JournalConsumer"]:
+        """Hold consumer `name` exclusively (raises JournalBusyError if taken)."""
+        with _flock(self._offsets_dir / f"{name}.lock", blocking=blocking):
+            yield JournalConsumer(self, name)
+
+    def _offset_path(self, name: str) -> Path:
+        return self._offsets_dir / f"{name}.json"
+
+    def committed(self, name: str) -> Position:
+        """Committed position of a consumer (start of the journal if new)."""
+        try:
+            with open(self._offset_path(name), "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return Position(int(data["segment"]), int(data["offset"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            segments = self._segments()
+            return Position(segments[0] if segments else 1, 0)
+
+    def _commit(self, name: str, position: Position) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=str(self._offsets_dir), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"segment": position.segment, "offset": position.offset}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, str(self._offset_path(name)))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _consumer_names(self) -> list[str]:
+        return [p.stem for p in self._offsets_dir.glob("*.json")]
+
+    def _read(self, start: Position, max_events: int) -> list[JournalRecord]:
+        records: list[JournalRecord] = []
+        segments = [s for s in self._segments() if s >= start.segment]
+        for i, seq in enumerate(segments):
+            offset = start.offset if seq == start.segment else 0
+            # A segment is sealed once its successor exists; check before reading
+            sealed = i + 1 < len(segments)
+            path = self._dir / _segment_name(seq)
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with f:
+                f.seek(offset)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break  # partial line still being written
+                    offset += len(raw)
+                    try:
+                        event = json.loads(raw)
+                    except json.JSONDecodeError:
+                        log.error("Skipping corrupt journal line", segment=seq, offset=offset - len(raw))
+                        continue
+                    records.append(JournalRecord(event, Position(seq, offset)))
+                    if len(records) >= max_events:
+                        return records
+            if not sealed:
+                break
+        return records
+
+    # ─── Compaction ───────────────────────────────────────
+
+    def compact(self) -> int:
+        """Delete segments every consumer has fully consumed. Returns count."""
+        names = self._consumer_names()
+        if not names:
+            return 0
+        low = min(self.committed(name).segment for name in names)
+        removed = 0
+        with _flock(self._lock_path):
+            segments = self._segments()
+            for seq in segments[:-1]:  # never the active segment
+                if seq >= low:
+                    break
+                os.unlink(self._dir / _segment_name(seq))
+                removed += 1
+        if removed:
+            self.segments_compacted += removed
+            log.info("Journal compacted", segments_removed=removed, oldest_kept=low)
+        return removed
+
+    # ─── Migration ────────────────────────────────────────
+
+    def migrate_legacy(self, path: Path) -> int:
+        """Import events from a legacy {"events": [...]} queue file, once.
+
+        The file is renamed to *.migrated afterwards. Returns events imported.
+        """
+        path = Path(path)
+        with _flock(self._dir / "migrate.lock"):
+            if not path.exists():
+                return 0
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    events = json.load(f).get("events", [])
+            except (OSError, json.JSONDecodeError, AttributeError) as e:
+                log.error("Legacy updates queue unreadable, leaving it in place", path=str(path), error=str(e))
+                return 0
+            self.append_many(events)
+            os.replace(path, path.with_name(path.name + ".migrated"))
+        log.info("Legacy updates queue migrated to journal", events=len(events), path=str(path))
+        return len(events)
+
+    # ─── Monitoring ───────────────────────────────────────
+
+    def pending_bytes(self, name: str) -> int:
+        """Bytes not yet acked by consumer `name`."""
+        start = self.committed(name)
+        total = 0
+        for seq in self._segments():
+            if seq < start.segment:
+                continue
+            try:
+                size = (self._dir / _segment_name(seq)).stat().st_size
+            except FileNotFoundError:
+                continue
+            total += size - (start.offset if seq == start.segment else 0)
+        return max(0, total)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "appended": self.appended,
+            "fsyncs": self.fsyncs,
+            "unsynced": self._unsynced,
+            "segments": len(self._segments()),
+            "segments_rolled": self.segments_rolled,
+            "segments_compacted": self.segments_compacted,
+            "pending_bytes": {name: self.pending_bytes(name) for name in self._consumer_names()},
+        }
+
+
+class JournalConsumer:
+    """Reads from, and acks to, one consumer's committed offset."""
+
+    def __init__(self, journal: EventJournal, name: str):
+        self._journal = journal
+        self.name = name
+        self._position = journal.committed(name)
+        self._cursor = self._position  # end of the last read
+
+    @property
+    def position(self) -> Position:
+        return self._position
+
+    def read(self, max_events: int = 1000) -> list[JournalRecord]:
+        """Next unacked events (at most max_events), continuing after the last read."""
+        records = self._journal._read(self._cursor, max_events)
+        if records:
+            self._cursor = records[-1].position
+        return records
+
+    def ack(self, position: Position) -> None:
+        """Commit everything up to `position` (inclusive) and compact."""
+        if position <= self._position:
+            return
+        self._journal._commit(self.name, position)
+        self._position = position
+        self._journal.compact()
+
+    def rewind(self) -> None:
+        """Forget unacked reads: the next read() starts at the committed offset."""
+        self._cursor = self._position
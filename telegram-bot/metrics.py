@@ -0,0 +1,96 @@
+"""
+metrics.py — In-process counters for Seedor Bot
+================================================
+A tiny, dependency-free metrics registry shared by the bot and the sync
+service. Components record counters/observations here and register
+collectors for their own stats; everything is exposed as one JSON-able
+dict (GET /metrics in webhook mode, or logged periodically).
+
+Usage:
+    from metrics import metrics
+    metrics.incr("snapshot_refresh_fetches", tenant_id="abc")
+    metrics.observe("api_latency_seconds", 0.124, endpoint="snapshot")
+    metrics.register_collector("snapshot_cache", cache.stats)
+"""
+
+import threading
+from typing import Any, Callable
+
+
+def _label_key(labels: dict[str, Any]) -> str:
+    """Render labels as a stable 'k=v,k2=v2' key ('' when unlabelled)."""
+    if not labels:
+        return ""
+    return ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges, observations and pluggable collectors."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[str, float]] = {}
+        self._gauges: dict[str, dict[str, float]] = {}
+        self._observations: dict[str, dict[str, dict[str, float]]] = {}
+        self._collectors: dict[str, Callable[[], dict]] = {}
+
+    def incr(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Increment a counter."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """Set a gauge to an absolute value."""
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record one observation (count / sum / max / last)."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._observations.setdefault(name, {})
+            obs = series.get(key)
+            if obs is None:
+                series[key] = {"count": 1, "sum": value, "max": value, "last": value}
+            else:
+                obs["count"] += 1
+                obs["sum"] += value
+                obs["max"] = max(obs["max"], value)
+                obs["last"] = value
+
+    def register_collector(self, name: str, fn: Callable[[], dict]) -> None:
+        """Register a callable whose dict result is included in snapshot()."""
+        with self._lock:
+            self._collectors[name] = fn
+
+    def counter(self, name: str, **labels: Any) -> float:
+        """Return the current value of a counter (0 if never incremented)."""
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return all metrics as a JSON-serializable dict."""
+        with self._lock:
+            result: dict[str, Any] = {
+                "counters": {n: dict(s) for n, s in self._counters.items()},
+                "gauges": {n: dict(s) for n, s in self._gauges.items()},
+                "observations": {
+                    n: {k: dict(v) for k, v in s.items()}
+                    for n, s in self._observations.items()
+                },
+            }
+            collectors = list(self._collectors.items())
+        # Collectors run outside the lock — they may take their own locks.
+        for name, fn in collectors:
+            try:
+                result[name] = fn()
+            except Exception as e:
+                result[name] = {"error": str(e)}
+        return result
+
+
+# Process-wide registry
+metrics = MetricsRegistry()
@@ -8,7 +8,9 @@ This module is the "Source of Truth" for the sync service.
 It is NEVER imported by the bot.
 """
 
-from datetime import date, timedelta
+import random
+import string
+from datetime import date, datetime, timedelta, timezone
 
 # ─── Today helper ──────────────────────────────────────────
 _today = date.today()
@@ -253,3 +255,84 @@ def get_all_fields() -> list[dict]:
 def get_all_tasks() -> list[dict]:
     """Return all active tasks with their assignments."""
     return [t for t in TASKS if t["status"] != "COMPLETED"]
+
+
+# ═══════════════════════════════════════════════════════════
+# Synthetic large tenant (load tests / benchmarks)
+# ═══════════════════════════════════════════════════════════
+
+_TASK_TYPES = ["Cosecha", "Poda", "Fumigación", "Riego", "Labranza", "Mantenimiento", "Empaque"]
+_STATUSES = ["PENDING", "IN_PROGRESS", "LATE"]
+_FIRST_NAMES = ["Juan", "Carlos", "María", "Roberto", "Ana", "Miguel", "Lucía", "Jorge", "Sofía", "Pedro"]
+_LAST_NAMES = ["Pérez", "Gómez", "López", "Fernández", "Martínez", "Sánchez", "Díaz", "Romero", "Torres", "Ruiz"]
+
+
+def _cuid(rng: random.Random) -> str:
+    return "c" + "".join(rng.choices(string.ascii_lowercase + string.digits, k=24))
+
+
+def build_large_snapshot(
+    workers: int = 5000,
+    tasks: int = 100_000,
+    fields: int = 50,
+    lots_per_field: int = 20,
+    seed: int = 0,
+) -> dict:
+    """Build a synthetic snapshot in the /api/telegram/snapshot schema.
+
+    Deterministic for a given seed. Each task is assigned to 1–3 workers
+    and linked to 1–2 lots.
+    """
+    rng = random.Random(seed)
+    worker_list = [
+        {
+            "id": _cuid(rng),
+            "first_name": rng.choice(_FIRST_NAMES),
+            "last_name": rng.choice(_LAST_NAMES),
+            "phone": f"+54938160{i:05d}",
+            "function_type": rng.choice(["Cosechador", "Tractorista", "Podador", None]),
+            "active": True,
+        }
+        for i in range(workers)
+    ]
+    worker_list.sort(key=lambda w: w["last_name"])
+    field_list = [
+        {
+            "id": _cuid(rng),
+            "name": f"Finca {f + 1:03d}",
+            "location": None,
+            "lots": [
+                {
+                    "id": _cuid(rng),
+                    "name": f"Lote {f + 1:03d}-{l + 1:02d}",
+                    "area_hectares": round(rng.uniform(2, 40), 1),
+                    "production_type": rng.choice(["Limón", "Naranja", "Mandarina", "Pomelo"]),
+                }
+                for l in range(lots_per_field)
+            ],
+        }
+        for f in range(fields)
+    ]
+    lot_ids = [lot["id"] for field in field_list for lot in field["lots"]]
+    worker_ids = [w["id"] for w in worker_list]
+    task_list = []
+    for i in range(tasks):
+        start = _today + timedelta(days=rng.randint(-10, 10))
+        task_list.append({
+            "id": _cuid(rng),
+            "description": f"{rng.choice(_TASK_TYPES)} sector {i % 97}",
+            "task_type": rng.choice(_TASK_TYPES),
+            "status": rng.choice(_STATUSES),
+            "start_date": start.isoformat(),
+            "due_date": (start + timedelta(days=rng.randint(0, 14))).isoformat(),
+            "assigned_worker_ids": rng.sample(worker_ids, k=min(len(worker_ids), rng.randint(1, 3))),
+            "lot_ids": rng.sample(lot_ids, k=min(len(lot_ids), rng.randint(1, 2))),
+        })
+    task_list.sort(key=lambda t: t["due_date"])
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "tenant": {"id": "synthetic-tenant", "name": "Seedor Synthetic"},
+        "workers": worker_list,
+        "fields": field_list,
+        "tasks": task_list,
+    }
@@ -0,0 +1,148 @@
+"""
+notification_digest.py — Coalesce TASK_ASSIGNED notifications per chat
+=======================================================================
+Assigning 40 tasks in the dashboard produces 40 TASK_ASSIGNED events; sent
+one by one, every worker chat gets 40 messages and the bot spends 40 sends
+of its rate budget per chat.
+
+The dispatcher hands the due (event, recipient, chat_ids) entries of a
+cycle to a DigestBatcher. A chat becomes ready once its oldest event has
+waited SEEDOR_NOTIFICATION_DIGEST_SECONDS since it was accepted; then all
+its due events go out as one digest, grouped by company, field and lot
+like the /tareas listing (events sent without structured "tasks" are
+appended as their pre-rendered message). Events are still acked per
+recipient by the caller. 0 disables coalescing.
+
+Usage:
+    batcher = DigestBatcher(window=10)
+    ready, wait = batcher.plan(entries, now)   # {chat_id: [(event, key), ...]}, seconds
+    for chat_id, items in ready.items():
+        for text in batcher.render([event for event, _ in items]): ...
+"""
+
+import os
+from collections import OrderedDict
+from typing import Any, Optional
+
+from metrics import metrics
+
+DIGEST_WINDOW_SECONDS = float(os.environ.get("SEEDOR_NOTIFICATION_DIGEST_SECONDS", "10"))
+
+# Telegram rejects messages over 4096 characters
+_MAX_MESSAGE_CHARS = 4000
+
+
+class DigestBatcher:
+    """Groups due notification entries per chat and renders digests."""
+
+    def __init__(self, window: float = DIGEST_WINDOW_SECONDS):
+        self._window = window
+        self.digests = 0
+        self.events_merged = 0
+        self.sends_saved = 0
+
+    def plan(
+        self, entries: list[tuple[dict, str, list[int]]], now: float
+    ) -> tuple[dict[int, list[tuple[dict, str]]], Optional[float]]:
+        """Split entries into chats ready to send and the wait for the rest.
+
+        entries are (event, recipient_key, chat_ids). Returns
+        ({chat_id: [(event, recipient_key), ...]}, seconds until the next
+        held chat is ready, or None if nothing is held).
+        """
+        by_chat: dict[int, list[tuple[dict, str]]] = OrderedDict()
+        for event, key, chat_ids in entries:
+            for chat_id in chat_ids:
+                by_chat.setdefault(chat_id, []).append((event, key))
+
+        ready: dict[int, list[tuple[dict, str]]] = {}
+        wait: Optional[float] = None
+        for chat_id, items in by_chat.items():
+            oldest = min(event.get("accepted_at", now) for event, _ in items)
+            remaining = oldest + self._window - now
+            if remaining <= 0:
+                ready[chat_id] = items
+            else:
+                wait = remaining if wait is None else min(wait, remaining)
+        return ready, wait
+
+    def render(self, events: list[dict]) -> list[str]:
+        """Digest text for a chat's events (split to fit Telegram's limit)."""
+        events = list(OrderedDict((e["id"], e) for e in events).values())
+        if len(events) == 1:
+            return [events[0]["message"]]
+
+        structured = [e for e in events if isinstance(e.get("tasks"), list) and e["tasks"]]
+        plain = [e for e in events if not (isinstance(e.get("tasks"), list) and e["tasks"])]
+
+        # company → field → lot → task lines
+        groups: dict[str, dict[str, dict[str, list[str]]]] = OrderedDict()
+        total = 0
+        for event in structured:
+            for task in event["tasks"]:
+                if not isinstance(task, dict):
+                    continue
+                total += 1
+                tenant = task.get("tenantName") or ""
+                field = task.get("fieldName") or "Sin campo"
+                lot = task.get("lotName") or task.get("lotDisplay") or "Sin lote"
+                groups.setdefault(tenant, OrderedDict()).setdefault(field, OrderedDict()).setdefault(
+                    lot, []
+                ).append(
+                    f"    - 📌 {task.get('description', '')}\n"
+                    f"      Tipo: {task.get('taskType', '')} · 📅 Vence: {task.get('dueDate', '')}"
+                )
+        total += len(plain)
+
+        blocks = [f"Nuevas tareas asignadas ({total})"]
+        for tenant, fields in groups.items():
+            if tenant:
+                blocks.append(f"🏢 Empresa: {tenant}")
+            for field, lots in fields.items():
+                lines = [f"🏡 {field}"]
+                for lot, task_lines in lots.items():
+                    lines.append(f"  🌱 {lot}")
+                    lines.extend(task_lines)
+                blocks.append("\n".join(lines))
+        blocks.extend(e["message"] for e in plain)
+        return _split_blocks(blocks)
+
+    def record(self, events: int, messages: int) -> None:
+        """Account one chat's digest: `events` merged into `messages` sends."""
+        if events <= 1:
+            return
+        self.digests += 1
+        self.events_merged += events
+        saved = max(0, events - messages)
+        self.sends_saved += saved
+        metrics.incr("notification_sends_saved", saved)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "window_seconds": self._window,
+            "digests": self.digests,
+            "events_merged": self.events_merged,
+            "sends_saved": self.sends_saved,
+        }
+
+
+def _split_blocks(blocks: list[str]) -> list[str]:
+    """Join blocks with blank lines into as few messages as fit the limit."""
+    messages: list[str] = []
+    current = ""
+    for block in blocks:
+        while len(block) > _MAX_MESSAGE_CHARS:
+            if current:
+                messages.append(current)
+                current = ""
+            messages.append(block[:_MAX_MESSAGE_CHARS])
+            block = block[_MAX_MESSAGE_CHARS:]
+        candidate = f"{current}\n\n{block}" if current else block
+        if len(candidate) > _MAX_MESSAGE_CHARS:
+            messages.append(current)
+            current = block
+        else:
+            current = candidate
+    if current:
+        messages.append(current)
+    return messages
@@ -0,0 +1,611 @@
+"""
+notification_queue.py — Push-based notification intake for Seedor Bot
+=====================================================================
+Task-assignment notifications used to reach the bot only through
+data/notifications_queue.json, which the bot re-read and rewrote every
+SEEDOR_NOTIFICATION_POLL_SECONDS while src/lib/telegram.ts did its own
+read-modify-write on the same file: notifications were late and could be
+lost in the race.
+
+Now events are pushed:
+
+  - POST /internal/notifications on the webhook server (webhook_handler.py)
+    calls NotificationQueue.put() and the dispatcher wakes immediately;
+  - the legacy JSON file is still accepted as an input: a FileWatcher
+    (inotify, or a cheap stat() loop where inotify is unavailable) wakes
+    the dispatcher when it changes, and take_legacy_file() claims it with
+    an atomic rename before reading, so the writer never races the reader.
+
+Pending events live in memory and are spooled to an append-only JSON-lines
+file (data/notifications_spool.jsonl), so accepted notifications survive
+a restart. Each line is one operation — {"op": "put", "event": ...},
+{"op": "update", "event": ...} or {"op": "done", "id": ...} — and the
+spool is compacted (rewritten with only the pending events) once it is
+mostly dead lines.
+
+Events are keyed by "id" (telegram.ts sends a UUID; legacy events without
+one get a content hash), so an event that is delivered twice — e.g. the
+legacy file re-imported after a crash — is only queued once.
+
+Delivery state is kept per recipient (event["delivery"][recipient_key]):
+a worker who cannot be reached yet (no chat) is retried with exponential
+backoff instead of on every cycle, and is archived once it has failed
+SEEDOR_NOTIFICATION_MAX_ATTEMPTS times or the event is older than
+SEEDOR_NOTIFICATION_MAX_AGE_HOURS. The archive (notifications_archive.jsonl)
+keeps the last SEEDOR_NOTIFICATION_ARCHIVE_MAX entries. When a worker opens
+the bot, expedite() makes their backlog due immediately.
+
+The queue is used from a single event loop (no locking).
+
+Usage:
+    queue = NotificationQueue(Path("data/notifications_spool.jsonl"))
+    queue.put([event])                  # from the HTTP endpoint
+    for event in queue.pending(): ...   # dispatcher
+    for event, workers in queue.due(): ...   # recipients whose retry is due
+    queue.record(event, delivered_keys, {key: "no chat"})
+    queue.commit()
+    await queue.wait(timeout=15)
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+
+from logger import get_logger
+from metrics import metrics
+from snapshot_index import normalize_phone
+
+log = get_logger("notification_queue")
+
+NOTIFY_RETRY_BASE_SECONDS = float(os.environ.get("SEEDOR_NOTIFICATION_RETRY_BASE_SECONDS", "30"))
+NOTIFY_RETRY_MAX_SECONDS = float(os.environ.get("SEEDOR_NOTIFICATION_RETRY_MAX_SECONDS", "3600"))
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("SEEDOR_NOTIFICATION_MAX_ATTEMPTS", "30"))
+NOTIFY_MAX_AGE_SECONDS = float(os.environ.get("SEEDOR_NOTIFICATION_MAX_AGE_HOURS", "72")) * 3600
+NOTIFY_ARCHIVE_MAX = int(os.environ.get("SEEDOR_NOTIFICATION_ARCHIVE_MAX", "1000"))
+
+# Rewrite the spool once it holds this many more lines than pending events
+_COMPACT_SLACK = 256
+# Ids of recently completed events, to drop late duplicates
+_RECENT_DONE_MAX = 2048
+
+
+def event_id(event: dict) -> str:
+    """The event's id, or a stable content hash for events sent without one."""
+    eid = event.get("id")
+    if isinstance(eid, str) and eid:
+        return eid
+    digest = hashlib.sha1(
+        json.dumps(event, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return f"sha1:{digest}"
+
+
+def recipient_key(worker: dict) -> str:
+    """Delivery-state key for a worker entry: its id, else its phone."""
+    if worker.get("id"):
+        return str(worker["id"])
+    return "phone:" + normalize_phone(worker.get("phone") or "")
+
+
+def _lookup_keys(worker: dict) -> list[str]:
+    """Keys under which expedite() finds this worker (id and phone)."""
+    keys = []
+    if worker.get("id"):
+        keys.append(str(worker["id"]))
+    if worker.get("phone"):
+        keys.append("phone:" + normalize_phone(worker["phone"]))
+    return keys
+
+
+def _workers(event: dict) -> list[dict]:
+    workers = event.get("workers")
+    return [w for w in workers if isinstance(w, dict)] if isinstance(workers, list) else []
+
+
+class NotificationQueue:
+    """In-memory pending notifications backed by an append-only spool."""
+
+    def __init__(
+        self,
+        spool_path: Path,
+        archive_path: Optional[Path] = None,
+        retry_base: float = NOTIFY_RETRY_BASE_SECONDS,
+        retry_max: float = NOTIFY_RETRY_MAX_SECONDS,
+        max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+        max_age: float = NOTIFY_MAX_AGE_SECONDS,
+        archive_max: int = NOTIFY_ARCHIVE_MAX,
+    ):
+        self._path = Path(spool_path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._retry_base = retry_base
+        self._retry_max = retry_max
+        self._max_attempts = max_attempts
+        self._max_age = max_age
+        self._archive = _Archive(
+            Path(archive_path) if archive_path else self._path.with_name("notifications_archive.jsonl"),
+            archive_max,
+        )
+        self._pending: OrderedDict[str, dict] = OrderedDict()
+        # lookup key (worker id / "phone:+54...") → ids of events waiting on it
+        self._by_recipient: dict[str, set[str]] = {}
+        self._recent_done: OrderedDict[str, None] = OrderedDict()
+        self._spool_lines = 0
+        self._dirty = False
+        self._wakeup = asyncio.Event()
+        self.accepted = 0
+        self.duplicates = 0
+        self.delivered = 0
+        self.compactions = 0
+        torn = self._load()
+        self._file = open(self._path, "a", encoding="utf-8")
+        if torn:
+            self._file.write("\n")  # don't glue the next line onto a torn one
+
+    # ─── Intake ───────────────────────────────────────────
+
+    def put(self, events: Iterable[dict]) -> int:
+        """Queue events durably and wake the dispatcher. Returns count accepted."""
+        lines = []
+        for event in events:
+            if not isinstance(event, dict):
+                continue
+            eid = event_id(event)
+            if eid in self._pending or eid in self._recent_done:
+                self.duplicates += 1
+                continue
+            event = {**event, "id": eid, "accepted_at": event.get("accepted_at") or time.time()}
+            self._pending[eid] = event
+            self._index(event)
+            lines.append({"op": "put", "event": event})
+        if lines:
+            self._append(lines, sync=True)
+            self.accepted += len(lines)
+            metrics.incr("notifications_accepted", len(lines))
+            self.wake()
+        return len(lines)
+
+    def wake(self) -> None:
+        """Wake the dispatcher (e.g. when the legacy file changed)."""
+        self._wakeup.set()
+
+    async def wait(self, timeout: float) -> None:
+        """Sleep until put()/wake() or `timeout` seconds, whichever comes first."""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    # ─── Dispatch ─────────────────────────────────────────
+
+    def pending(self) -> list[dict]:
+        return list(self._pending.values())
+
+    def due(self, now: Optional[float] = None) -> list[tuple[dict, list[dict]]]:
+        """Events with at least one recipient due, as (event, due_workers).
+
+        Events past the max age are archived here. Events without a workers
+        list are returned with an empty list.
+        """
+        now = time.time() if now is None else now
+        result = []
+        for event in list(self._pending.values()):
+            if now - event.get("accepted_at", now) >= self._max_age:
+                self._expire(event, _workers(event), "expired", now)
+                continue
+            workers = _workers(event)
+            if not workers:
+                result.append((event, []))
+                continue
+            delivery = event.get("delivery", {})
+            due = [
+                w for w in workers
+                if delivery.get(recipient_key(w), {}).get("next_attempt_at", 0) <= now
+            ]
+            if due:
+                result.append((event, due))
+        return result
+
+    def next_due_in(
+        self, now: Optional[float] = None, skip: Iterable[str] = ()
+    ) -> Optional[float]:
+        """Seconds until the earliest recipient retry (None if nothing is pending).
+
+        Events in `skip` (e.g. held for a digest) are not considered.
+        """
+        now = time.time() if now is None else now
+        skip = set(skip)
+        earliest = None
+        for event in self._pending.values():
+            if event["id"] in skip:
+                continue
+            delivery = event.get("delivery", {})
+            for worker in _workers(event):
+                at = delivery.get(recipient_key(worker), {}).get("next_attempt_at", 0)
+                earliest = at if earliest is None else min(earliest, at)
+        return None if earliest is None else max(0.0, earliest - now)
+
+    def record(
+        self,
+        event: dict,
+        delivered: Iterable[str],
+        failed: dict[str, str],
+        now: Optional[float] = None,
+    ) -> None:
+        """Apply one delivery attempt: recipient keys delivered, and key → error.
+
+        Failed recipients back off exponentially; those out of attempts are
+        archived. The event is done once no recipients remain.
+        """
+        now = time.time() if now is None else now
+        delivered = set(delivered)
+        self.delivered += len(delivered)
+        delivery = dict(event.get("delivery", {}))
+        remaining, expired = [], []
+        for worker in _workers(event):
+            key = recipient_key(worker)
+            if key in delivered:
+                delivery.pop(key, None)
+                continue
+            if key in failed:
+                attempts = delivery.get(key, {}).get("attempts", 0) + 1
+                if attempts >= self._max_attempts:
+                    expired.append(worker)
+                    delivery.pop(key, None)
+                    continue
+                delay = min(self._retry_max, self._retry_base * 2 ** (attempts - 1))
+                delivery[key] = {
+                    "attempts": attempts,
+                    "next_attempt_at": now + delay,
+                    "last_error": failed[key],
+                }
+            remaining.append(worker)
+        if expired:
+            self._archive.add(event, expired, "max_attempts", now)
+            metrics.incr("notifications_archived", len(expired), reason="max_attempts")
+        if remaining:
+            self.update({**event, "workers": remaining, "delivery": delivery})
+        else:
+            self.done(event["id"])
+
+    def expedite(self, worker_id: Optional[str], phone: Optional[str]) -> int:
+        """Make a worker's pending notifications due now (e.g. they just opened the bot)."""
+        keys = []
+        if worker_id:
+            keys.append(str(worker_id))
+        if phone:
+            keys.append("phone:" + normalize_phone(phone))
+        count = 0
+        for key in keys:
+            for eid in self._by_recipient.get(key, ()):
+                event = self._pending[eid]
+                delivery = event.get("delivery", {})
+                for worker in _workers(event):
+                    if key in _lookup_keys(worker):
+                        state = delivery.get(recipient_key(worker))
+                        if state:
+                            state["next_attempt_at"] = 0
+                        count += 1
+        if count:
+            self.wake()
+        return count
+
+    def update(self, event: dict) -> None:
+        """Replace a pending event (e.g. with only the workers still to notify)."""
+        eid = event["id"]
+        previous = self._pending.get(eid)
+        if previous is None:
+            return
+        self._unindex(previous)
+        self._pending[eid] = event
+        self._index(event)
+        self._append([{"op": "update", "event": event}])
+
+    def done(self, eid: str) -> None:
+        event = self._pending.pop(eid, None)
+        if event is None:
+            return
+        self._unindex(event)
+        self._recent_done[eid] = None
+        if len(self._recent_done) > _RECENT_DONE_MAX:
+            self._recent_done.popitem(last=False)
+        self._append([{"op": "done", "id": eid}])
+
+    def commit(self) -> None:
+        """Flush dispatch results to disk, compacting the spool when worthwhile."""
+        if not self._dirty:
+            return
+        if self._spool_lines > len(self._pending) + _COMPACT_SLACK:
+            self._compact()
+        else:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._dirty = False
+
+    def close(self) -> None:
+        self.commit()
+        self._file.close()
+
+    def _expire(self, event: dict, workers: list[dict], reason: str, now: float) -> None:
+        self._archive.add(event, workers, reason, now)
+        metrics.incr("notifications_archived", max(1, len(workers)), reason=reason)
+        self.done(event["id"])
+
+    def _index(self, event: dict) -> None:
+        for worker in _workers(event):
+            for key in _lookup_keys(worker):
+                self._by_recipient.setdefault(key, set()).add(event["id"])
+
+    def _unindex(self, event: dict) -> None:
+        for worker in _workers(event):
+            for key in _lookup_keys(worker):
+                eids = self._by_recipient.get(key)
+                if eids is not None:
+                    eids.discard(event["id"])
+                    if not eids:
+                        del self._by_recipient[key]
+
+    # ─── Spool ────────────────────────────────────────────
+
+    def _append(self, ops: list[dict], sync: bool = False) -> None:
+        self._file.write("".join(json.dumps(op, ensure_ascii=False) + "\n" for op in ops))
+        self._spool_lines += len(ops)
+        if sync:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        else:
+            self._dirty = True
+
+    def _load(self) -> bool:
+        """Replay the spool. Returns True if it ends in a torn (partial) line."""
+        if not self._path.exists():
+            return False
+        line = ""
+        with open(self._path, "r", encoding="utf-8") as f:
+            for line in f:
+                self._spool_lines += 1
+                try:
+                    op = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line after a crash
+                kind = op.get("op")
+                if kind in ("put", "update"):
+                    event = op.get("event") or {}
+                    if "id" in event:
+                        self._pending[event["id"]] = event
+                elif kind == "done":
+                    self._pending.pop(op.get("id"), None)
+        for event in self._pending.values():
+            self._index(event)
+        if self._pending:
+            log.info("Pending notifications restored", events=len(self._pending))
+        return bool(line) and not line.endswith("\n")
+
+    def _compact(self) -> None:
+        self._file.close()
+        fd, tmp_path = tempfile.mkstemp(dir=str(self._path.parent), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for event in self._pending.values():
+                    f.write(json.dumps({"op": "put", "event": event}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        finally:
+            self._file = open(self._path, "a", encoding="utf-8")
+        self._spool_lines = len(self._pending)
+        self.compactions += 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "recipients_waiting": sum(len(_workers(e)) for e in self._pending.values()),
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "delivered": self.delivered,
+            "archived": self._archive.added,
+            "spool_lines": self._spool_lines,
+            "compactions": self.compactions,
+        }
+
+
+class _Archive:
+    """Append-only archive of undeliverable recipients, trimmed to `max_entries`."""
+
+    def __init__(self, path: Path, max_entries: int):
+        self._path = path
+        self._max = max_entries
+        self.added = 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._lines = sum(1 for _ in f)
+        except FileNotFoundError:
+            self._lines = 0
+
+    def add(self, event: dict, workers: list[dict], reason: str, now: float) -> None:
+        entry = {
+            "id": event.get("id"),
+            "type": event.get("type"),
+            "message": event.get("message"),
+            "workers": workers,
+            "delivery": event.get("delivery", {}),
+            "accepted_at": event.get("accepted_at"),
+            "archived_at": now,
+            "reason": reason,
+        }
+        with open(self._path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._lines += 1
+        self.added += 1
+        log.warning("Notification archived", event_id=entry["id"], workers=len(workers), reason=reason)
+        if self._lines > 2 * self._max:
+            self._trim()
+
+    def _trim(self) -> None:
+        with open(self._path, "r", encoding="utf-8") as f:
+            keep = f.readlines()[-self._max:]
+        fd, tmp_path = tempfile.mkstemp(dir=str(self._path.parent), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.writelines(keep)
+            os.replace(tmp_path, self._path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self._lines = len(keep)
+
+
+# ─── Legacy notifications_queue.json ──────────────────────
+
+def take_legacy_file(path: Path) -> tuple[list[dict], Optional[Path]]:
+    """Claim the legacy queue file and return (events, claimed_path).
+
+    The file is renamed before it is read, so a concurrent writer creates a
+    fresh file instead of overwriting what we are importing. Delete
+    claimed_path once the events are safely queued; a claim left over by a
+    crash is picked up again on the next call. Unreadable files are moved
+    to <file>.corrupt-<ms> so they do not block later imports.
+    """
+    path = Path(path)
+    claimed = path.with_name(path.name + ".claimed")
+    if claimed.exists():
+        events = _read_legacy_events(claimed)
+        if events is not None:
+            return events, claimed
+        # A bad claim would block every later import: set it aside and go on
+        _set_aside(path, claimed)
+    try:
+        os.replace(path, claimed)
+    except FileNotFoundError:
+        return [], None
+    events = _read_legacy_events(claimed)
+    if events is None:
+        _set_aside(path, claimed)
+        return [], None
+    return events, claimed
+
+
+def _set_aside(path: Path, claimed: Path) -> None:
+    corrupt = path.with_name(f"{path.name}.corrupt-{int(time.time() * 1000)}")
+    os.replace(claimed, corrupt)
+    log.error("Unreadable legacy notifications file moved aside", path=str(corrupt))
+
+
+def _read_legacy_events(claimed: Path) -> Optional[list[dict]]:
+    """The events of a claimed legacy file, or None if it is unreadable."""
+    try:
+        with open(claimed, "r", encoding="utf-8") as f:
+            events = json.load(f).get("events", [])
+    except (json.JSONDecodeError, OSError, AttributeError) as e:
+        log.error("Legacy notifications file unreadable", path=str(claimed), error=str(e))
+        return None
+    return [e for e in events if isinstance(e, dict)] if isinstance(events, list) else []
+
+
+# ─── File watch ───────────────────────────────────────────
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class FileWatcher:
+    """Calls `on_change()` when `path` is written or replaced.
+
+    Uses inotify (via ctypes) on Linux; elsewhere, or if inotify cannot be
+    set up, falls back to comparing stat() every `poll_interval` seconds —
+    no file reads either way.
+    """
+
+    def __init__(self, path: Path, on_change: Callable[[], None], poll_interval: float = 0.5):
+        self._path = Path(path)
+        self._on_change = on_change
+        self._poll_interval = poll_interval
+        self._fd: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self.mode = "stopped"
+
+    def start(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        if self._start_inotify(loop):
+            self.mode = "inotify"
+        else:
+            self._task = loop.create_task(self._poll_stat())
+            self.mode = "stat"
+        log.info("Watching file", path=str(self._path), mode=self.mode)
+
+    def stop(self) -> None:
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.mode = "stopped"
+
+    def _start_inotify(self, loop: asyncio.AbstractEventLoop) -> bool:
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return False
+            mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+            if libc.inotify_add_watch(fd, str(self._path.parent).encode(), mask) < 0:
+                os.close(fd)
+                return False
+        except (OSError, AttributeError):
+            return False
+        self._fd = fd
+        loop.add_reader(fd, self._on_inotify)
+        return True
+
+    def _on_inotify(self) -> None:
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        target = self._path.name.encode()
+        offset = 0
+        changed = False
+        while offset + _INOTIFY_EVENT.size <= len(data):
+            _, _, _, name_len = _INOTIFY_EVENT.unpack_from(data, offset)
+            start = offset + _INOTIFY_EVENT.size
+            name = data[start:start + name_len].rstrip(b"\0")
+            offset = start + name_len
+            if name == target:
+                changed = True
+        if changed:
+            self._on_change()
+
+    async def _poll_stat(self) -> None:
+        last = None
+        while True:
+            try:
+                st = os.stat(self._path)
+                current = (st.st_ino, st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                current = None
+            if current is not None and current != last:
+                self._on_change()
+            last = current
+            await asyncio.sleep(self._poll_interval)
@@ -0,0 +1,204 @@
+"""
+refresh_lease.py — Cross-process refresh leases for tenant snapshots
+====================================================================
+The bot (scheduled and inline refreshes), every bot replica sharing the
+data directory and sync_service all refresh the same snapshot_<tenant>.json
+files. SingleFlight only coalesces inside one process; RefreshLeases makes
+sure only one process fetches a tenant at a time:
+
+  - a lease is a small JSON file, data/leases/<tenant>.lease, holding the
+    holder (host:pid), a random token and an expiry. It is created,
+    checked and stolen under an exclusive flock on <tenant>.lock, so two
+    processes can never both take it;
+  - a process that finds the lease held waits for the holder to release
+    it, then reads the snapshot the holder wrote instead of fetching;
+  - after taking the lease, a process skips the fetch if the snapshot file
+    was refreshed (snapshot_store.last_refreshed) in the last SEEDOR_REFRESH_SHARED_FRESH_SECONDS,
+    i.e. it queued behind a holder that just finished. (Scheduled
+    refreshes also skip tenants another process refreshed within their
+    interval, see RefreshScheduler's last_refreshed, so N processes cost
+    one fetch per interval, not N);
+  - stale leases are stolen: expired ones (SEEDOR_REFRESH_LEASE_SECONDS,
+    longer than any refresh timeout) and ones whose holder process on the
+    same host is gone.
+
+Metrics: refresh_leases{outcome} — acquired, shared (waited for another
+process), fresh_skip, stolen — and stats().
+
+Usage:
+    leases = RefreshLeases(Path("data/leases"))
+    ok = await leases.run(tenant_id, snapshot_path, lambda: fetch(tenant_id))
+"""
+
+import asyncio
+import contextlib
+import fcntl
+import json
+import os
+import re
+import secrets
+import socket
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+from logger import get_logger
+from metrics import metrics
+from snapshot_store import last_refreshed
+
+log = get_logger("refresh_lease")
+
+REFRESH_LEASE_SECONDS = float(os.environ.get("SEEDOR_REFRESH_LEASE_SECONDS", "120"))
+REFRESH_SHARED_FRESH_SECONDS = float(os.environ.get("SEEDOR_REFRESH_SHARED_FRESH_SECONDS", "5"))
+
+# How often a waiting process checks whether the holder is done
+_POLL_SECONDS = 0.2
+
+HOLDER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+@contextlib.contextmanager
+def _flock(path: Path) -> Iterator[None]:
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # releases the lock
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RefreshLeases:
+    """Per-tenant leases shared by every process using the same directory."""
+
+    def __init__(
+        self,
+        lease_dir: Path,
+        lease_seconds: float = REFRESH_LEASE_SECONDS,
+        fresh_seconds: float = REFRESH_SHARED_FRESH_SECONDS,
+    ):
+        self._dir = lease_dir
+        self._lease_seconds = lease_seconds
+        self._fresh_seconds = fresh_seconds
+        self._counts = {"acquired": 0, "shared": 0, "fresh_skip": 0, "stolen": 0}
+
+    def _paths(self, tenant_id: str) -> tuple[Path, Path]:
+        safe = re.sub(r"[^a-zA-Z0-9_-]", "_", tenant_id)
+        return self._dir / f"{safe}.lease", self._dir / f"{safe}.lock"
+
+    def _count(self, outcome: str) -> None:
+        self._counts[outcome] += 1
+        metrics.incr("refresh_leases", outcome=outcome)
+
+    # ─── Lease file (called in a thread; flock blocks) ────
+
+    def _try_acquire(self, tenant_id: str) -> Optional[str]:
+        """Take the lease if it is free or stale. Returns our token, or None."""
+        lease_path, lock_path = self._paths(tenant_id)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        with _flock(lock_path):
+            current = self._read(lease_path)
+            if current is not None:
+                if not self._is_stale(current):
+                    return None
+                self._count("stolen")
+                log.warning(
+                    "Stealing stale refresh lease",
+                    tenant_id=tenant_id,
+                    holder=current.get("holder"),
+                    expired_seconds_ago=round(time.time() - current.get("expires_at", 0), 1),
+                )
+            token = secrets.token_hex(8)
+            lease = {
+                "holder": HOLDER,
+                "host": socket.gethostname(),
+                "pid": os.getpid(),
+                "token": token,
+                "expires_at": time.time() + self._lease_seconds,
+            }
+            tmp_path = lease_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(lease), encoding="utf-8")
+            os.replace(tmp_path, lease_path)
+            return token
+
+    def _release(self, tenant_id: str, token: str) -> None:
+        lease_path, lock_path = self._paths(tenant_id)
+        with _flock(lock_path):
+            current = self._read(lease_path)
+            # Only our own lease: it may have been stolen after expiring
+            if current is not None and current.get("token") == token:
+                lease_path.unlink()
+
+    @staticmethod
+    def _read(lease_path: Path) -> Optional[dict]:
+        try:
+            return json.loads(lease_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            return {}  # unreadable: treated as stale
+
+    @staticmethod
+    def _is_stale(lease: dict) -> bool:
+        if lease.get("expires_at", 0) <= time.time():
+            return True
+        if lease.get("host") == socket.gethostname() and isinstance(lease.get("pid"), int):
+            return not _pid_alive(lease["pid"])
+        return False
+
+    def _held(self, tenant_id: str) -> bool:
+        lease = self._read(self._paths(tenant_id)[0])
+        return lease is not None and not self._is_stale(lease)
+
+    # ─── Refresh ──────────────────────────────────────────
+
+    async def run(
+        self,
+        tenant_id: str,
+        snapshot_path: Path,
+        fetch: Callable[[], Awaitable[bool]],
+    ) -> bool:
+        """Refresh the tenant once across processes. Returns True on success.
+
+        Either runs fetch() under the lease, or waits for the process that
+        holds it and reports whether it refreshed snapshot_path meanwhile.
+        """
+        started = time.time()
+        while True:
+            token = await asyncio.to_thread(self._try_acquire, tenant_id)
+            if token is not None:
+                break
+            # Someone else is fetching: wait for them, then use their result
+            deadline = time.monotonic() + self._lease_seconds
+            while await asyncio.to_thread(self._held, tenant_id):
+                if time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(_POLL_SECONDS)
+            else:
+                mtime = last_refreshed(str(snapshot_path))
+                self._count("shared")
+                # No recent snapshot after the release: the holder's fetch failed
+                return mtime is not None and mtime >= started - self._fresh_seconds
+            # The holder is stuck past its lease: take over
+
+        try:
+            mtime = last_refreshed(str(snapshot_path))
+            if mtime is not None and time.time() - mtime < self._fresh_seconds:
+                self._count("fresh_skip")
+                return True
+            self._count("acquired")
+            return await fetch()
+        finally:
+            await asyncio.to_thread(self._release, tenant_id, token)
+
+    def stats(self) -> dict[str, Any]:
+        return dict(self._counts)
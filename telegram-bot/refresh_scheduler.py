@@ -0,0 +1,300 @@
+"""
+refresh_scheduler.py — Adaptive, concurrent per-tenant snapshot refresh
+=======================================================================
+Replaces the fixed "sleep SEEDOR_SYNC_INTERVAL_SECONDS, then refresh every
+tenant in turn" loop. Each tenant has its own next-due time:
+
+  - the interval starts at SEEDOR_SYNC_INTERVAL_SECONDS and adapts to
+      · recent user activity (note_activity): tenants used in the last
+        few minutes refresh twice as often, tenants without activity in
+        the last hour four times less often;
+      · the observed change rate (record_change, an EWMA of "did the last
+        refresh change the snapshot"): data that keeps changing refreshes
+        up to twice as often, data that never changes up to half as often;
+      · failures: the interval doubles per consecutive failure;
+    and is clamped to [SEEDOR_SYNC_MIN_INTERVAL_SECONDS,
+    SEEDOR_SYNC_MAX_INTERVAL_SECONDS];
+  - every due time gets ±SEEDOR_SYNC_JITTER of jitter, and new tenants
+    start at a random point of their first interval, so refreshes spread
+    out instead of spiking together;
+  - at most SEEDOR_SYNC_MAX_CONCURRENCY refreshes run at once, most
+    overdue first, each bounded by SEEDOR_SYNC_TIMEOUT_SECONDS — a slow
+    tenant only delays itself;
+  - a refresh done elsewhere also counts: record_change (a handler in
+    this process) pushes the tenant's next due time out, and with
+    last_refreshed (e.g. the snapshot file's mtime) a tenant refreshed by
+    another process within its interval is skipped and rescheduled.
+
+Metrics: snapshot_refresh_lag_seconds{tenant} (how late a refresh started
+versus its due time), snapshot_refresh_duration_seconds{tenant},
+snapshot_refresh_timeouts{tenant} and stats() (registered as a collector).
+
+Usage:
+    scheduler = RefreshScheduler(refresh=fetch_tenant, tenants=registry.get_active_tenant_ids)
+    asyncio.create_task(scheduler.run())
+    scheduler.note_activity(tenant_id)          # from handlers
+    scheduler.schedule_now(tenant_id)           # e.g. a tenant without a snapshot
+    scheduler.record_change(tenant_id, changed)  # after every successful refresh
+"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from logger import get_logger
+from metrics import metrics
+
+log = get_logger("refresh_scheduler")
+
+SYNC_INTERVAL_SECONDS = float(os.environ.get("SEEDOR_SYNC_INTERVAL_SECONDS", "60"))
+SYNC_MIN_INTERVAL_SECONDS = float(os.environ.get("SEEDOR_SYNC_MIN_INTERVAL_SECONDS", "15"))
+SYNC_MAX_INTERVAL_SECONDS = float(os.environ.get("SEEDOR_SYNC_MAX_INTERVAL_SECONDS", "900"))
+SYNC_JITTER = float(os.environ.get("SEEDOR_SYNC_JITTER", "0.1"))
+SYNC_MAX_CONCURRENCY = int(os.environ.get("SEEDOR_SYNC_MAX_CONCURRENCY", "4"))
+SYNC_TIMEOUT_SECONDS = float(os.environ.get("SEEDOR_SYNC_TIMEOUT_SECONDS", "60"))
+
+# Activity windows: "active" tenants refresh faster, "idle" ones slower
+_ACTIVE_SECONDS = 600
+_IDLE_SECONDS = 3600
+# Weight of the latest refresh in the change-rate average
+_CHANGE_ALPHA = 0.3
+# The tenant set is re-read at least this often
+_MAX_SLEEP_SECONDS = 5.0
+
+
+class _TenantState:
+    __slots__ = (
+        "next_due", "interval", "change_rate", "last_activity",
+        "last_refresh", "failures", "running",
+    )
+
+    def __init__(self, next_due: float, interval: float):
+        self.next_due = next_due
+        self.interval = interval
+        self.change_rate = 0.5  # no history yet: neither fast nor slow
+        self.last_activity: Optional[float] = None
+        self.last_refresh: Optional[float] = None
+        self.failures = 0
+        self.running = False
+
+
+class RefreshScheduler:
+    """Per-tenant refresh timers with adaptive intervals and bounded parallelism."""
+
+    def __init__(
+        self,
+        refresh: Callable[[str], Awaitable[bool]],
+        tenants: Callable[[], Iterable[str]],
+        base_interval: float = SYNC_INTERVAL_SECONDS,
+        min_interval: float = SYNC_MIN_INTERVAL_SECONDS,
+        max_interval: float = SYNC_MAX_INTERVAL_SECONDS,
+        jitter: float = SYNC_JITTER,
+        max_concurrency: int = SYNC_MAX_CONCURRENCY,
+        timeout: float = SYNC_TIMEOUT_SECONDS,
+        activity_aware: bool = True,
+        last_refreshed: Optional[Callable[[str], Optional[float]]] = None,
+    ):
+        self._refresh = refresh
+        self._tenants = tenants
+        self._base = base_interval
+        self._min = min_interval
+        self._max = max_interval
+        self._jitter = jitter
+        self._max_concurrency = max_concurrency
+        self._timeout = timeout
+        # Without activity signals (e.g. the sync sidecar) intervals ignore activity
+        self._activity_aware = activity_aware
+        # tenant_id → wall-clock time of its last refresh by any process
+        self._last_refreshed = last_refreshed
+        self._states: dict[str, _TenantState] = {}
+        self._running: set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self.refreshes = 0
+        self.skipped_fresh = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    # ─── Signals from the bot ─────────────────────────────
+
+    def note_activity(self, tenant_id: str) -> None:
+        """A user of the tenant did something: refresh it sooner if it was idle."""
+        now = time.monotonic()
+        state = self._state(tenant_id, now)
+        state.last_activity = now
+        if state.running:
+            return
+        interval = self._interval(state, now)
+        since = state.last_refresh if state.last_refresh is not None else now
+        next_due = since + self._jittered(interval)
+        if next_due < state.next_due:
+            state.interval = interval
+            state.next_due = next_due
+            self._wake()
+
+    def schedule_now(self, tenant_id: str) -> None:
+        """Make the tenant due immediately (e.g. it has no snapshot yet)."""
+        state = self._state(tenant_id, time.monotonic())
+        if not state.running:
+            state.next_due = time.monotonic()
+            self._wake()
+
+    def record_change(self, tenant_id: str, changed: bool) -> None:
+        """A refresh of the tenant succeeded; `changed` = the snapshot differed."""
+        now = time.monotonic()
+        state = self._state(tenant_id, now)
+        state.change_rate += _CHANGE_ALPHA * ((1.0 if changed else 0.0) - state.change_rate)
+        state.last_refresh = now
+        state.failures = 0
+        if not state.running:
+            # Refreshed by a handler: no need to refresh again before a full interval
+            self._schedule(state, now)
+
+    # ─── Scheduling ───────────────────────────────────────
+
+    def _state(self, tenant_id: str, now: float) -> _TenantState:
+        state = self._states.get(tenant_id)
+        if state is None:
+            # Start at a random point of the first interval to spread load
+            state = _TenantState(now + random.uniform(0, self._base), self._base)
+            self._states[tenant_id] = state
+        return state
+
+    def _interval(self, state: _TenantState, now: float) -> float:
+        interval = self._base
+        if not self._activity_aware:
+            pass
+        elif state.last_activity is not None and now - state.last_activity < _ACTIVE_SECONDS:
+            interval *= 0.5
+        elif state.last_activity is None or now - state.last_activity > _IDLE_SECONDS:
+            interval *= 4
+        # change_rate 1 → ×0.5, 0.5 → ×1, 0 → ×2
+        interval *= 2 ** (1 - 2 * state.change_rate)
+        interval *= 2 ** min(state.failures, 10)
+        return min(self._max, max(self._min, interval))
+
+    def _jittered(self, interval: float) -> float:
+        return interval * (1 + random.uniform(-self._jitter, self._jitter))
+
+    def _schedule(self, state: _TenantState, now: float) -> None:
+        state.interval = self._interval(state, now)
+        state.next_due = now + self._jittered(state.interval)
+
+    def _sync_tenants(self, now: float) -> None:
+        current = set(self._tenants())
+        for tenant_id in current:
+            self._state(tenant_id, now)
+        for tenant_id in [t for t, s in self._states.items() if t not in current and not s.running]:
+            del self._states[tenant_id]
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self) -> None:
+        """Refresh tenants as they come due (runs until cancelled)."""
+        self._wakeup = asyncio.Event()
+        log.info(
+            "Refresh scheduler started",
+            base_interval_seconds=self._base,
+            max_concurrency=self._max_concurrency,
+        )
+        try:
+            while True:
+                now = time.monotonic()
+                try:
+                    self._sync_tenants(now)
+                except Exception as e:
+                    log.error("Refresh scheduler could not list tenants", error=str(e))
+                due = sorted(
+                    (s.next_due, t) for t, s in self._states.items()
+                    if not s.running and s.next_due <= now
+                )
+                for _, tenant_id in due:
+                    if len(self._running) >= self._max_concurrency:
+                        break
+                    if not self._refreshed_elsewhere(tenant_id, now):
+                        self._start(tenant_id, now)
+
+                waiting = [s.next_due for s in self._states.values() if not s.running]
+                sleep = _MAX_SLEEP_SECONDS
+                if waiting and len(self._running) < self._max_concurrency:
+                    sleep = min(sleep, max(0.0, min(waiting) - now))
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=sleep)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in list(self._running):
+                task.cancel()
+
+    def _refreshed_elsewhere(self, tenant_id: str, now: float) -> bool:
+        """Reschedule (and skip) a due tenant that was refreshed recently anyway."""
+        if self._last_refreshed is None:
+            return False
+        try:
+            refreshed_at = self._last_refreshed(tenant_id)
+        except Exception:
+            return False
+        if refreshed_at is None:
+            return False
+        state = self._states[tenant_id]
+        state.interval = self._interval(state, now)
+        age = time.time() - refreshed_at
+        if age >= state.interval * (1 - self._jitter):
+            return False
+        self.skipped_fresh += 1
+        state.next_due = now + self._jittered(state.interval) - age
+        return True
+
+    def _start(self, tenant_id: str, now: float) -> None:
+        state = self._states[tenant_id]
+        state.running = True
+        metrics.observe("snapshot_refresh_lag_seconds", now - state.next_due, tenant=tenant_id)
+        task = asyncio.get_running_loop().create_task(self._run_one(tenant_id, state))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run_one(self, tenant_id: str, state: _TenantState) -> None:
+        started = time.monotonic()
+        ok = False
+        try:
+            # The refresh keeps running for other callers if it is shared
+            # (single-flight); a timeout only stops this scheduler's wait.
+            ok = await asyncio.wait_for(self._refresh(tenant_id), timeout=self._timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            metrics.incr("snapshot_refresh_timeouts", tenant=tenant_id)
+            log.warning("Snapshot refresh timed out", tenant_id=tenant_id, timeout_seconds=self._timeout)
+        except Exception as e:
+            log.error("Snapshot refresh error", tenant_id=tenant_id, error=str(e))
+        finally:
+            now = time.monotonic()
+            metrics.observe("snapshot_refresh_duration_seconds", now - started, tenant=tenant_id)
+            self.refreshes += 1
+            if not ok:
+                self.failures += 1
+                state.failures += 1
+            state.running = False
+            self._schedule(state, now)
+            self._wake()
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        intervals = sorted(s.interval for s in self._states.values())
+        return {
+            "tenants": len(self._states),
+            "running": len(self._running),
+            "overdue": sum(1 for s in self._states.values() if not s.running and s.next_due <= now),
+            "interval_seconds": {
+                "min": round(intervals[0], 1),
+                "median": round(intervals[len(intervals) // 2], 1),
+                "max": round(intervals[-1], 1),
+            } if intervals else {},
+            "refreshes": self.refreshes,
+            "skipped_fresh": self.skipped_fresh,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+        }
@@ -1,35 +1,278 @@
 """
-retry.py — Retry with Exponential Backoff + Dead-Letter Queue
-==============================================================
-Provides a decorator for retrying failed operations and a dead-letter
-queue for events that fail after all retries.
+retry.py — Retry policy
+=======================
+Provides a retry policy for failed operations. The dead-letter queue for
+events that fail after all retries lives in dead_letter.py (re-exported
+here for compatibility).
+
+Only transient failures are retried: connection errors, timeouts, HTTP 5xx,
+408/425 and 429. Anything else (401, 403, 404, bad JSON, ...) is raised
+immediately. Delays use exponential backoff with full jitter, and a
+server-provided Retry-After is honoured. An optional deadline (set with
+`retry_deadline`) caps the total time spent across attempts and sleeps, so
+a handler-level time budget also bounds its retries.
+
+Attempts, give-ups and seconds slept are exported through metrics.py
+(retry_attempts, retry_giveups, retry_sleep_seconds).
 
 Usage:
-    from retry import retry_with_backoff, DeadLetterQueue
+    from retry import RetryPolicy, retry_deadline, DeadLetterQueue
+
+    api_retry = RetryPolicy(max_retries=3, base_delay=1.0, max_delay=15.0)
+
+    @api_retry
+    async def call_api_async():
+        ...
+
+    with retry_deadline(8.0):
+        await call_api_async()   # gives up once 8s are spent
 
+    # Legacy decorators (thin wrappers around RetryPolicy)
     @retry_with_backoff(max_retries=3, base_delay=1.0)
     def call_api():
         ...
 
-    dlq = DeadLetterQueue(Path("data/dead_letter.json"))
+    dlq = DeadLetterQueue(Path("data/dead_letter.db"))
     dlq.add(event, error="timeout after 3 retries")
 """
 
-import json
-import os
-import tempfile
+import asyncio
+import contextlib
+import contextvars
+import inspect
+import random
 import time
 import functools
-from datetime import datetime, timezone
-from pathlib import Path
-from typing import Any, Callable, Optional, TypeVar
+from datetime import timedelta
+from typing import Any, Callable, Iterator, Optional, TypeVar
 
+import aiohttp
+
+from dead_letter import DeadLetterQueue  # noqa: F401  (re-export)
 from logger import get_logger
+from metrics import metrics
 
 log = get_logger("retry")
 
 T = TypeVar("T")
 
+# HTTP statuses worth retrying (besides any 5xx)
+TRANSIENT_HTTP_STATUSES = frozenset({408, 425, 429})
+
+# Connection-level failures. urllib's URLError and socket errors are OSErrors;
+# HTTP errors (which are URLErrors too) are classified by status first.
+TRANSIENT_EXCEPTIONS: tuple[type[BaseException], ...] = (
+    OSError,
+    asyncio.TimeoutError,
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+)
+
+
+# ─── Error classification ─────────────────────────────────
+
+def _http_status(exc: BaseException) -> Optional[int]:
+    """HTTP status of an API error (ApiError / aiohttp / urllib), if any."""
+    for attr in ("status", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int) and 100 <= value <= 599:
+            return value
+    return None
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Server-requested wait in seconds (ApiError, Telegram RetryAfter, urllib)."""
+    value = getattr(exc, "retry_after", None)
+    if value is None:
+        headers = getattr(exc, "headers", None)
+        value = headers.get("Retry-After") if headers is not None else None
+    if isinstance(value, timedelta):
+        return max(0.0, value.total_seconds())
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(exc: BaseException) -> tuple[bool, Optional[float]]:
+    """Return (retryable, retry_after_seconds) for an exception."""
+    status = _http_status(exc)
+    if status is not None:
+        transient = status >= 500 or status in TRANSIENT_HTTP_STATUSES
+        return transient, _retry_after(exc) if transient else None
+    retry_after = _retry_after(exc)
+    if retry_after is not None:
+        return True, retry_after  # e.g. telegram.error.RetryAfter
+    return isinstance(exc, TRANSIENT_EXCEPTIONS), None
+
+
+# ─── Deadline budget ──────────────────────────────────────
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "retry_deadline", default=None
+)
+
+
+@contextlib.contextmanager
+def retry_deadline(seconds: float) -> Iterator[None]:
+    """Cap the total time retries may take inside this block.
+
+    Nested budgets never extend an outer one. The budget lives in a
+    contextvar, so it follows the current asyncio task.
+    """
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """Seconds left in the current retry deadline (None if unbounded)."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+# ─── Retry policy ─────────────────────────────────────────
+
+class RetryPolicy:
+    """Retries transient failures with full-jitter exponential backoff.
+
+    Works as a decorator for both plain and coroutine functions, or
+    directly via call() / call_async().
+
+    Args:
+        max_retries: Maximum number of retry attempts (0 = no retries)
+        base_delay: Backoff base in seconds (cap of the first sleep)
+        max_delay: Maximum backoff cap in seconds
+        backoff_factor: Multiplier for each subsequent cap
+        max_retry_after: Longest server-requested wait we accept; a longer
+            Retry-After gives up instead of sleeping
+        classify: (exc) → (retryable, retry_after); defaults to classify_error
+        name: Label used in logs/metrics (defaults to the function name)
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        backoff_factor: float = 2.0,
+        max_retry_after: float = 60.0,
+        classify: Callable[[BaseException], tuple[bool, Optional[float]]] = classify_error,
+        name: str = "",
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.backoff_factor = backoff_factor
+        self.max_retry_after = max_retry_after
+        self.classify = classify
+        self.name = name
+
+    def __call__(self, func: Callable[..., Any]) -> Callable[..., Any]:
+        name = self.name or func.__name__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                return await self._call_async(name, func, args, kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return self._call(name, func, args, kwargs)
+        return wrapper
+
+    def call(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return self._call(self.name or func.__name__, func, args, kwargs)
+
+    async def call_async(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await self._call_async(self.name or func.__name__, func, args, kwargs)
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max_delay, base * factor^attempt)]."""
+        cap = min(self.max_delay, self.base_delay * self.backoff_factor ** attempt)
+        return random.uniform(0, cap)
+
+    def _call(self, name: str, func: Callable[..., T], args: tuple, kwargs: dict) -> T:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(name, attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    async def _call_async(
+        self, name: str, func: Callable[..., Any], args: tuple, kwargs: dict
+    ) -> Any:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                delay = self._next_delay(name, attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+    def _next_delay(self, name: str, attempt: int, exc: Exception) -> Optional[float]:
+        """Seconds to sleep before the next attempt, or None to give up."""
+        retryable, retry_after = self.classify(exc)
+        if not retryable:
+            metrics.incr("retry_giveups", function=name, reason="permanent")
+            return None
+        if attempt >= self.max_retries:
+            return self._give_up(name, attempt, exc, "exhausted")
+        if retry_after is not None and retry_after > self.max_retry_after:
+            return self._give_up(name, attempt, exc, "retry_after_too_long")
+
+        delay = self.backoff(attempt)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        budget = remaining_budget()
+        if budget is not None and delay >= budget:
+            return self._give_up(name, attempt, exc, "deadline")
+
+        metrics.incr("retry_attempts", function=name)
+        metrics.incr("retry_sleep_seconds", delay, function=name)
+        log.warning(
+            "Retrying after failure",
+            function=name,
+            attempt=attempt + 1,
+            max_retries=self.max_retries,
+            delay_seconds=round(delay, 3),
+            retry_after=retry_after,
+            error=str(exc),
+        )
+        return delay
+
+    def _give_up(self, name: str, attempt: int, exc: Exception, reason: str) -> None:
+        metrics.incr("retry_giveups", function=name, reason=reason)
+        log.error(
+            "All retries exhausted" if reason == "exhausted" else "Giving up retries",
+            function=name,
+            attempt=attempt + 1,
+            max_retries=self.max_retries,
+            reason=reason,
+            error=str(exc),
+        )
+        return None
+
+
+def _legacy_classifier(
+    retryable_exceptions: tuple,
+) -> Callable[[BaseException], tuple[bool, Optional[float]]]:
+    def classify(exc: BaseException) -> tuple[bool, Optional[float]]:
+        if not isinstance(exc, retryable_exceptions):
+            return False, None
+        return classify_error(exc)
+    return classify
+
 
 def retry_with_backoff(
     max_retries: int = 3,
@@ -40,12 +283,9 @@ def retry_with_backoff(
 ) -> Callable:
     """Decorator that retries a function with exponential backoff.
 
-    Args:
-        max_retries: Maximum number of retry attempts (0 = no retries)
-        base_delay: Initial delay in seconds before first retry
-        max_delay: Maximum delay cap in seconds
-        backoff_factor: Multiplier for each subsequent delay
-        retryable_exceptions: Tuple of exception types to retry on
+    Kept for compatibility: equivalent to a RetryPolicy restricted to
+    `retryable_exceptions` (which are still classified, so permanent
+    errors such as HTTP 4xx are not retried).
 
     Example:
         @retry_with_backoff(max_retries=3, base_delay=1.0)
@@ -53,133 +293,10 @@ def retry_with_backoff(
             response = urllib.request.urlopen(url)
             return response.read()
     """
-    def decorator(func: Callable[..., T]) -> Callable[..., T]:
-        @functools.wraps(func)
-        def wrapper(*args: Any, **kwargs: Any) -> T:
-            last_exception: Optional[Exception] = None
-            delay = base_delay
-
-            for attempt in range(max_retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except retryable_exceptions as e:
-                    last_exception = e
-
-                    if attempt == max_retries:
-                        log.error(
-                            "All retries exhausted",
-                            function=func.__name__,
-                            attempt=attempt + 1,
-                            max_retries=max_retries,
-                            error=str(e),
-                        )
-                        raise
-
-                    log.warning(
-                        "Retrying after failure",
-                        function=func.__name__,
-                        attempt=attempt + 1,
-                        max_retries=max_retries,
-                        delay_seconds=delay,
-                        error=str(e),
-                    )
-
-                    time.sleep(delay)
-                    delay = min(delay * backoff_factor, max_delay)
-
-            # Should not reach here, but satisfy type checker
-            raise last_exception  # type: ignore[misc]
-
-        return wrapper
-    return decorator
-
-
-class DeadLetterQueue:
-    """Persistent dead-letter queue for events that failed after all retries.
-
-    Events are stored in a JSON file and can be manually inspected,
-    retried, or purged.
-
-    File format:
-    {
-        "events": [
-            {
-                "original_event": {...},
-                "error": "description",
-                "failed_at": "2026-03-04T12:00:00Z",
-                "retry_count": 3
-            }
-        ]
-    }
-    """
-
-    def __init__(self, path: Path):
-        self._path = path
-        self._path.parent.mkdir(parents=True, exist_ok=True)
-
-    def add(self, event: dict, error: str, retry_count: int = 0) -> None:
-        """Add a failed event to the dead-letter queue."""
-        events = self._load()
-        events.append({
-            "original_event": event,
-            "error": error,
-            "failed_at": datetime.now(timezone.utc).isoformat(),
-            "retry_count": retry_count,
-        })
-        self._save(events)
-        log.warning(
-            "Event moved to dead-letter queue",
-            event_type=event.get("type", "unknown"),
-            error=error,
-            dlq_size=len(events),
-        )
-
-    def peek(self, limit: int = 10) -> list[dict]:
-        """View events in the queue without removing them."""
-        events = self._load()
-        return events[:limit]
-
-    def size(self) -> int:
-        """Return the number of events in the queue."""
-        return len(self._load())
-
-    def pop(self, count: int = 1) -> list[dict]:
-        """Remove and return events from the front of the queue."""
-        events = self._load()
-        popped = events[:count]
-        remaining = events[count:]
-        self._save(remaining)
-        return popped
-
-    def clear(self) -> int:
-        """Clear all events. Returns count of cleared events."""
-        events = self._load()
-        count = len(events)
-        self._save([])
-        return count
-
-    def _load(self) -> list[dict]:
-        if not self._path.exists():
-            return []
-        try:
-            with open(self._path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return data.get("events", [])
-        except (json.JSONDecodeError, OSError):
-            return []
-
-    def _save(self, events: list[dict]) -> None:
-        """Atomically write events to disk."""
-        fd, tmp_path = tempfile.mkstemp(
-            dir=str(self._path.parent), suffix=".tmp"
-        )
-        try:
-            with os.fdopen(fd, "w", encoding="utf-8") as f:
-                json.dump(
-                    {"events": events}, f, indent=2, ensure_ascii=False
-                )
-            os.replace(tmp_path, str(self._path))
-        except Exception:
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
-            raise
+    return RetryPolicy(
+        max_retries=max_retries,
+        base_delay=base_delay,
+        max_delay=max_delay,
+        backoff_factor=backoff_factor,
+        classify=_legacy_classifier(retryable_exceptions),
+    )
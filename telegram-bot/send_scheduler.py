@@ -0,0 +1,281 @@
+"""
+send_scheduler.py — Outbound Telegram send scheduler
+====================================================
+Every Bot API call made through the Application's bot passes through one
+SendScheduler (a python-telegram-bot BaseRateLimiter), which keeps the bot
+inside Telegram's flood limits instead of finding them via 429s:
+
+  - a global token bucket (~30 requests/s by default),
+  - per-chat pacing (about 1 message/s per private chat, 20/min per group,
+    with a small burst so a handler can answer with two messages),
+  - RetryAfter handling: the whole scheduler pauses for the advertised
+    time and the request is retried (up to SEEDOR_SEND_MAX_RETRIES),
+  - bounded concurrency (SEEDOR_SEND_MAX_CONCURRENCY requests in flight),
+  - two lanes: interactive handler replies (the default) always go before
+    bulk sends such as notification fan-out.
+
+The lane is chosen with PTB's rate_limit_args:
+
+    await bot.send_message(chat_id, text, rate_limit_args=PRIORITY_BULK)
+
+Metrics: queue depth per lane and in-flight count (stats(), registered as
+a collector), send_latency_seconds{endpoint,lane} (queueing included),
+send_queue_wait_seconds{lane}, telegram_rate_limited{endpoint} (429s) and
+telegram_send_giveups{endpoint}.
+
+Usage:
+    scheduler = SendScheduler()
+    app = Application.builder().token(token).rate_limiter(scheduler).build()
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Optional
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from logger import get_logger
+from metrics import metrics
+
+log = get_logger("send_scheduler")
+
+SEND_GLOBAL_RATE = float(os.environ.get("SEEDOR_SEND_GLOBAL_RATE", "30"))
+SEND_CHAT_RATE = float(os.environ.get("SEEDOR_SEND_CHAT_RATE", "1"))
+SEND_GROUP_RATE = float(os.environ.get("SEEDOR_SEND_GROUP_RATE", str(20 / 60)))
+SEND_CHAT_BURST = float(os.environ.get("SEEDOR_SEND_CHAT_BURST", "3"))
+SEND_MAX_CONCURRENCY = int(os.environ.get("SEEDOR_SEND_MAX_CONCURRENCY", "8"))
+SEND_MAX_RETRIES = int(os.environ.get("SEEDOR_SEND_MAX_RETRIES", "3"))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+_LANES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+# Idle per-chat buckets are dropped once there are more than this many
+_CHAT_BUCKETS_MAX = 10_000
+
+
+class TokenBucket:
+    """Reservation-style token bucket: reserve() returns how long to wait.
+
+    Tokens may go negative, so concurrent callers queue up behind each
+    other without polling.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def delay(self, seconds: float) -> None:
+        """Push the bucket back so the next token is at least `seconds` away."""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+def _retry_after_seconds(exc: RetryAfter) -> float:
+    value = exc.retry_after
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class SendScheduler(BaseRateLimiter[int]):
+    """Rate limiter with a global bucket, per-chat pacing and priority lanes."""
+
+    def __init__(
+        self,
+        global_rate: float = SEND_GLOBAL_RATE,
+        chat_rate: float = SEND_CHAT_RATE,
+        group_rate: float = SEND_GROUP_RATE,
+        chat_burst: float = SEND_CHAT_BURST,
+        max_concurrency: int = SEND_MAX_CONCURRENCY,
+        max_retries: int = SEND_MAX_RETRIES,
+    ):
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._chat_rate = chat_rate
+        self._group_rate = group_rate
+        self._chat_burst = chat_burst
+        self._max_concurrency = max_concurrency
+        self._max_retries = max_retries
+        self._chats: dict[int | str, TokenBucket] = {}
+        # (priority, seq, future) — the dispatcher grants in this order
+        self._heap: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._paused_until = 0.0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._queued = {lane: 0 for lane in _LANES.values()}
+        self._in_flight = 0
+        self.rate_limited = 0
+
+    async def initialize(self) -> None:
+        self._ensure_dispatcher()
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        for _, _, future in self._heap:
+            future.cancel()
+        self._heap.clear()
+
+    def _ensure_dispatcher(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self._max_concurrency)
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    # ─── Request path ─────────────────────────────────────
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Any:
+        self._ensure_dispatcher()
+        priority = PRIORITY_BULK if rate_limit_args == PRIORITY_BULK else PRIORITY_INTERACTIVE
+        lane = _LANES[priority]
+        chat_id = data.get("chat_id")
+        started = time.monotonic()
+
+        attempt = 0
+        while True:
+            if chat_id is not None:
+                wait = self._chat_bucket(chat_id).reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            await self._acquire(priority, lane)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                retry_after = _retry_after_seconds(e)
+                self._on_rate_limited(endpoint, chat_id, retry_after)
+                if attempt >= self._max_retries:
+                    metrics.incr("telegram_send_giveups", endpoint=endpoint)
+                    raise
+                attempt += 1
+                continue
+            finally:
+                self._in_flight -= 1
+                self._slots.release()
+            metrics.observe("send_latency_seconds", time.monotonic() - started, endpoint=endpoint, lane=lane)
+            return result
+
+    async def _acquire(self, priority: int, lane: str) -> None:
+        """Wait for the dispatcher to grant a global token and a concurrency slot."""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), future))
+        self._queued[lane] += 1
+        self._wakeup.set()
+        enqueued = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Granted just before we were cancelled: give the slot back
+            if future.done() and not future.cancelled():
+                self._in_flight -= 1
+                self._slots.release()
+            raise
+        finally:
+            self._queued[lane] -= 1
+        metrics.observe("send_queue_wait_seconds", time.monotonic() - enqueued, lane=lane)
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _CHAT_BUCKETS_MAX:
+                self._prune_chats()
+            # Negative ids and @usernames are groups/channels (20 messages/min)
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self._group_rate if is_group else self._chat_rate
+            bucket = TokenBucket(rate, self._chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune_chats(self) -> None:
+        for chat_id in [c for c, b in self._chats.items() if b.idle()]:
+            del self._chats[chat_id]
+
+    def _on_rate_limited(self, endpoint: str, chat_id: Any, retry_after: float) -> None:
+        self.rate_limited += 1
+        metrics.incr("telegram_rate_limited", endpoint=endpoint)
+        # Telegram's flood control is not only per chat: hold everything
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        if chat_id is not None:
+            self._chat_bucket(chat_id).delay(retry_after)
+        log.warning(
+            "Telegram rate limit hit, pausing sends",
+            endpoint=endpoint,
+            chat_id=chat_id,
+            retry_after_seconds=retry_after,
+        )
+
+    # ─── Dispatcher ───────────────────────────────────────
+
+    async def _dispatch(self) -> None:
+        """Grant queued requests in priority order, one global token at a time."""
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            await self._slots.acquire()
+            wait = self._global.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if self._paused_until > time.monotonic():
+                self._slots.release()  # a 429 arrived meanwhile
+                continue
+            # Pick the best waiter now (a higher-priority one may have arrived)
+            while self._heap and self._heap[0][2].done():
+                heapq.heappop(self._heap)  # cancelled while queued
+            if not self._heap:
+                self._slots.release()
+                continue
+            _, _, future = heapq.heappop(self._heap)
+            self._in_flight += 1
+            future.set_result(None)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queued": dict(self._queued),
+            "in_flight": self._in_flight,
+            "rate_limited": self.rate_limited,
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            "chats_tracked": len(self._chats),
+        }
@@ -0,0 +1,87 @@
+"""
+single_flight.py — Per-key coalescing of concurrent async operations
+====================================================================
+The first caller for a key starts the operation; callers that arrive
+while it is running await the same result instead of starting their own.
+After a successful run, an optional quiet window answers further calls
+for that key with the last result without running the operation again.
+
+The operation runs in its own task, so a cancelled caller (e.g. a handler
+that timed out) does not cancel the fetch for everyone else.
+
+Usage:
+    refreshes = SingleFlight("snapshot_refresh", quiet_seconds=5)
+    ok = await refreshes.do(tenant_id, lambda: fetch(tenant_id))
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+
+class SingleFlight:
+    """Coalesces concurrent async calls per key.
+
+    A run counts as successful when its result is truthy; only successful
+    runs open the quiet window. Exceptions are propagated to every waiter.
+    """
+
+    def __init__(self, name: str, quiet_seconds: float = 0.0):
+        self.name = name
+        self._quiet_seconds = quiet_seconds
+        self._inflight: dict[str, "asyncio.Task[Any]"] = {}
+        self._last_success: dict[str, tuple[float, Any]] = {}  # key → (monotonic, result)
+        self.runs = 0
+        self.coalesced = 0
+        self.quiet_skips = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() for key, or join the run already in flight."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        recent = self._recent_result(key)
+        if recent is not None:
+            self.quiet_skips += 1
+            return recent[1]
+
+        self.runs += 1
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._on_done(key, t))
+        return await asyncio.shield(task)
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._inflight
+
+    def forget(self, key: str) -> None:
+        """Close the quiet window for key (next call runs again)."""
+        self._last_success.pop(key, None)
+
+    def _recent_result(self, key: str) -> Optional[tuple[float, Any]]:
+        if self._quiet_seconds <= 0:
+            return None
+        recent = self._last_success.get(key)
+        if recent is None or time.monotonic() - recent[0] >= self._quiet_seconds:
+            return None
+        return recent
+
+    def _on_done(self, key: str, task: "asyncio.Task[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if result:
+            self._last_success[key] = (time.monotonic(), result)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "coalesced": self.coalesced,
+            "quiet_skips": self.quiet_skips,
+            "saved": self.coalesced + self.quiet_skips,
+            "in_flight": len(self._inflight),
+        }
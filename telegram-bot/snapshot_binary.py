@@ -0,0 +1,630 @@
+"""
+snapshot_binary.py — Compact, memory-mapped snapshot format with lazy decoding
+==============================================================================
+A handler usually needs one worker and its tasks, but a JSON snapshot has
+to be parsed whole — for a 100k-task tenant that is seconds of CPU and
+hundreds of MB of dicts per tenant. The .snap format stores the same data
+so that a reader can mmap the file and decode single records on demand.
+
+Layout (native byte order, recorded in the header):
+
+    b"SEEDSNP1" | u32 header length | header JSON | pad to 8
+    sections, each 8-byte aligned, located by header["sections"]:
+
+      workers.off / workers.rec     u64 offsets (n+1) + compact-JSON records
+      tasks.off / tasks.rec         same for tasks
+      fields.off / fields.rec       same for fields (lots embedded)
+      <key table>.off/.keys/.val    sorted UTF-8 keys + u32 values, for
+                                    worker ids, task ids, lot ids (→ field)
+                                    and normalized phones (→ posting list)
+      phones.post_off / .post       u32 worker indices per phone
+      active.post_off / .post       u32 active task indices per worker,
+                                    in snapshot order (COMPLETED excluded)
+
+The header also carries the top-level scalar keys of the snapshot
+(tenant, generated_at, version, revision, …) and its content hash.
+
+BinarySnapshot exposes the SnapshotIndex interface (workers_by_id,
+tasks_by_id and lots_by_id as lazy mappings, find_workers_by_phone,
+active_tasks, count_active_tasks, lot_display) plus get() for top-level
+keys, so bot.py helpers use it in place of a parsed snapshot + index.
+Decoded records are fresh dicts: callers may keep them.
+
+Usage:
+    write_binary_snapshot(snapshot, "data/snapshot_t1.snap")
+    snap = BinarySnapshot("data/snapshot_t1.snap")
+    tasks = snap.active_tasks(worker_id)
+
+    cache = BinarySnapshotCache()
+    snap = cache.get(tenant_id, "data/snapshot_t1.json")  # converts if needed
+
+    python snapshot_binary.py convert data/snapshot_t1.json [out.snap]
+    python snapshot_binary.py --bench [--tasks 100000]
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from collections.abc import Mapping
+from typing import Any, Callable, Iterator, Optional
+
+from snapshot_index import normalize_phone
+from snapshot_store import meta_path, read_meta
+
+MAGIC = b"SEEDSNP1"
+FORMAT_VERSION = 1
+
+# Top-level keys stored as records; everything else goes to the header
+_RECORD_KINDS = ("workers", "tasks", "fields")
+
+
+def binary_path(json_path: str) -> str:
+    """snapshot_<tenant>.json → snapshot_<tenant>.snap"""
+    base, _ = os.path.splitext(str(json_path))
+    return f"{base}.snap"
+
+
+def _dumps(record: Any) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# ─── Writer ───────────────────────────────────────────────
+
+class _Builder:
+    def __init__(self) -> None:
+        self.sections: dict[str, bytes] = {}
+
+    def records(self, name: str, items: list) -> None:
+        offsets = array("Q", [0])
+        blob = bytearray()
+        for item in items:
+            blob += _dumps(item)
+            offsets.append(len(blob))
+        self.sections[f"{name}.off"] = offsets.tobytes()
+        self.sections[f"{name}.rec"] = bytes(blob)
+
+    def keys(self, name: str, mapping: dict[str, int]) -> None:
+        """Sorted key table: binary search over UTF-8 keys → u32 value."""
+        encoded = sorted((key.encode("utf-8"), value) for key, value in mapping.items())
+        offsets = array("Q", [0])
+        values = array("I")
+        blob = bytearray()
+        for key, value in encoded:
+            blob += key
+            offsets.append(len(blob))
+            values.append(value)
+        self.sections[f"{name}.off"] = offsets.tobytes()
+        self.sections[f"{name}.keys"] = bytes(blob)
+        self.sections[f"{name}.val"] = values.tobytes()
+
+    def postings(self, name: str, lists: list[list[int]]) -> None:
+        offsets = array("I", [0])
+        flat = array("I")
+        for items in lists:
+            flat.extend(items)
+            offsets.append(len(flat))
+        self.sections[f"{name}.post_off"] = offsets.tobytes()
+        self.sections[f"{name}.post"] = flat.tobytes()
+
+
+def encode_snapshot(snapshot: dict, content_hash: str = "") -> bytes:
+    """Encode a snapshot dict into the .snap layout."""
+    workers = snapshot.get("workers", [])
+    tasks = snapshot.get("tasks", [])
+    fields = snapshot.get("fields", [])
+
+    b = _Builder()
+    for kind, items in (("workers", workers), ("tasks", tasks), ("fields", fields)):
+        b.records(kind, items)
+
+    worker_index = {w["id"]: i for i, w in enumerate(workers)}
+    b.keys("worker_ids", worker_index)
+    b.keys("task_ids", {t["id"]: i for i, t in enumerate(tasks)})
+    b.keys("lot_ids", {
+        lot["id"]: f for f, field in enumerate(fields) for lot in field.get("lots", [])
+    })
+
+    by_phone: dict[str, list[int]] = {}
+    for i, worker in enumerate(workers):
+        if worker.get("phone"):
+            by_phone.setdefault(normalize_phone(worker["phone"]), []).append(i)
+    phones = sorted(by_phone)
+    b.keys("phone_keys", {phone: n for n, phone in enumerate(phones)})
+    b.postings("phones", [by_phone[phone] for phone in phones])
+
+    # Same rules as SnapshotIndex: COMPLETED skipped, a worker listed twice gets the task once
+    active: list[list[int]] = [[] for _ in workers]
+    for t, task in enumerate(tasks):
+        if task.get("status") == "COMPLETED":
+            continue
+        for worker_id in dict.fromkeys(task.get("assigned_worker_ids", [])):
+            w = worker_index.get(worker_id)
+            if w is not None:
+                active[w].append(t)
+    b.postings("active", active)
+
+    # Lay out: header first, then 8-byte aligned sections
+    meta = {k: v for k, v in snapshot.items() if k not in _RECORD_KINDS}
+    counts = {"workers": len(workers), "tasks": len(tasks), "fields": len(fields)}
+
+    def _header(sections: dict[str, list[int]]) -> bytes:
+        return json.dumps({
+            "format": FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "content_hash": content_hash,
+            "meta": meta,
+            "counts": counts,
+            "sections": sections,
+        }, ensure_ascii=False).encode("utf-8")
+
+    # Section offsets depend on the header length and vice versa: fixed point
+    placements: dict[str, list[int]] = {name: [0, len(data)] for name, data in b.sections.items()}
+    while True:
+        header = _header(placements)
+        position = _align(len(MAGIC) + 4 + len(header))
+        moved = False
+        for name, data in b.sections.items():
+            if placements[name][0] != position:
+                placements[name] = [position, len(data)]
+                moved = True
+            position = _align(position + len(data))
+        if not moved:
+            break
+
+    out = bytearray(MAGIC + struct.pack("<I", len(header)) + header)
+    for name, data in b.sections.items():
+        out += b"\0" * (placements[name][0] - len(out))
+        out += data
+    return bytes(out)
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def write_binary_snapshot(snapshot: dict, path: str, content_hash: str = "") -> int:
+    """Atomically write the .snap encoding of a snapshot. Returns its size."""
+    data = encode_snapshot(snapshot, content_hash)
+    directory = os.path.dirname(str(path)) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, str(path))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return len(data)
+
+
+def convert_json_file(json_path: str, snap_path: Optional[str] = None, content_hash: str = "") -> str:
+    """Convert an existing JSON snapshot file. Returns the .snap path."""
+    snap_path = snap_path or binary_path(json_path)
+    with open(json_path, "r", encoding="utf-8") as f:
+        snapshot = json.load(f)
+    write_binary_snapshot(snapshot, snap_path, content_hash)
+    return snap_path
+
+
+# ─── Reader ───────────────────────────────────────────────
+
+class BinarySnapshotError(ValueError):
+    """The file is not a readable .snap snapshot."""
+
+
+class _KeyTable:
+    __slots__ = ("_off", "_keys", "_val")
+
+    def __init__(self, off: memoryview, keys: memoryview, val: memoryview):
+        self._off = off
+        self._keys = keys
+        self._val = val
+
+    def __len__(self) -> int:
+        return len(self._val)
+
+    def key(self, i: int) -> bytes:
+        return bytes(self._keys[self._off[i]:self._off[i + 1]])
+
+    def find(self, key: str) -> Optional[int]:
+        target = key.encode("utf-8")
+        lo, hi = 0, len(self._val)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._val) and self.key(lo) == target:
+            return self._val[lo]
+        return None
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self._val)):
+            yield self.key(i).decode("utf-8")
+
+
+class _LazyMap(Mapping):
+    """Read-only mapping that decodes values on access."""
+
+    def __init__(self, table: _KeyTable, load: Callable[[int], Any]):
+        self._table = table
+        self._load = load
+
+    def __getitem__(self, key: str) -> Any:
+        i = self._table.find(key) if isinstance(key, str) else None
+        if i is None:
+            raise KeyError(key)
+        return self._load(i)
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self._table.find(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._table)
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+
+class BinarySnapshot:
+    """Memory-mapped .snap reader with the SnapshotIndex interface."""
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        with open(self.path, "rb") as f:
+            self.identity = (os.fstat(f.fileno()).st_ino, os.fstat(f.fileno()).st_size)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._open()
+        except Exception:
+            self._mm.close()
+            raise
+
+    def _open(self) -> None:
+        mm = self._mm
+        if mm[:len(MAGIC)] != MAGIC:
+            raise BinarySnapshotError(f"{self.path}: not a .snap file")
+        (header_len,) = struct.unpack_from("<I", mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(mm[start:start + header_len].decode("utf-8"))
+        if header.get("format") != FORMAT_VERSION or header.get("byteorder") != sys.byteorder:
+            raise BinarySnapshotError(f"{self.path}: unsupported format or byte order")
+        self.meta: dict[str, Any] = header["meta"]
+        self.content_hash: str = header.get("content_hash", "")
+        self.counts: dict[str, int] = header["counts"]
+        view = memoryview(mm)
+        self._view = view
+        sections = header["sections"]
+
+        def section(name: str, fmt: Optional[str] = None) -> memoryview:
+            offset, length = sections[name]
+            part = view[offset:offset + length]
+            return part.cast(fmt) if fmt else part
+
+        self._records = {
+            kind: (section(f"{kind}.off", "Q"), section(f"{kind}.rec")) for kind in _RECORD_KINDS
+        }
+        tables = {
+            name: _KeyTable(section(f"{name}.off", "Q"), section(f"{name}.keys"), section(f"{name}.val", "I"))
+            for name in ("worker_ids", "task_ids", "lot_ids", "phone_keys")
+        }
+        self._worker_ids = tables["worker_ids"]
+        self._task_ids = tables["task_ids"]
+        self._lot_ids = tables["lot_ids"]
+        self._phone_keys = tables["phone_keys"]
+        self._phone_post = (section("phones.post_off", "I"), section("phones.post", "I"))
+        self._active = (section("active.post_off", "I"), section("active.post", "I"))
+
+        self.workers_by_id: Mapping[str, dict] = _LazyMap(self._worker_ids, self.worker_at)
+        self.tasks_by_id: Mapping[str, dict] = _LazyMap(self._task_ids, self.task_at)
+        self.lots_by_id: Mapping[str, tuple[dict, dict]] = _LotMap(self)
+
+    def close(self) -> None:
+        # Views must be released before the map can close
+        self._records.clear()
+        self._worker_ids = self._task_ids = self._lot_ids = self._phone_keys = None
+        self._phone_post = self._active = None
+        self.workers_by_id = self.tasks_by_id = self.lots_by_id = None
+        self._view.release()
+        self._mm.close()
+
+    # ─── Records ──────────────────────────────────────────
+
+    def _record(self, kind: str, i: int) -> dict:
+        offsets, blob = self._records[kind]
+        return json.loads(bytes(blob[offsets[i]:offsets[i + 1]]))
+
+    def worker_at(self, i: int) -> dict:
+        return self._record("workers", i)
+
+    def task_at(self, i: int) -> dict:
+        return self._record("tasks", i)
+
+    def field_at(self, i: int) -> dict:
+        return self._record("fields", i)
+
+    def iter_records(self, kind: str) -> Iterator[dict]:
+        for i in range(self.counts[kind]):
+            yield self._record(kind, i)
+
+    # ─── SnapshotIndex interface ──────────────────────────
+
+    def find_workers_by_phone(self, phone: str) -> list[dict]:
+        n = self._phone_keys.find(normalize_phone(phone))
+        if n is None:
+            return []
+        offsets, post = self._phone_post
+        return [self.worker_at(w) for w in post[offsets[n]:offsets[n + 1]]]
+
+    def _active_task_indices(self, worker_id: str) -> memoryview:
+        w = self._worker_ids.find(worker_id)
+        offsets, post = self._active
+        if w is None:
+            return post[0:0]
+        return post[offsets[w]:offsets[w + 1]]
+
+    def active_tasks(
+        self, worker_id: str, overrides: Optional[dict[str, str]] = None
+    ) -> list[dict]:
+        """Return the worker's non-completed tasks, in snapshot order."""
+        tasks = [self.task_at(t) for t in self._active_task_indices(worker_id)]
+        if overrides:
+            tasks = [t for t in tasks if overrides.get(t["id"]) != "COMPLETED"]
+        return tasks
+
+    def count_active_tasks(
+        self, worker_id: str, overrides: Optional[dict[str, str]] = None
+    ) -> int:
+        indices = self._active_task_indices(worker_id)
+        if not overrides:
+            return len(indices)
+        return len(self.active_tasks(worker_id, overrides))
+
+    def lot_display(self, lot_id: str) -> str:
+        """Return 'LotName — FieldName' for display (the id if unknown)."""
+        found = self.lots_by_id.get(lot_id)
+        if found is None:
+            return lot_id
+        field, lot = found
+        return f"{lot['name']} — {field['name']}"
+
+    # ─── Snapshot dict compatibility ──────────────────────
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Top-level value; "workers"/"tasks"/"fields" decode the whole list."""
+        if key in _RECORD_KINDS:
+            return list(self.iter_records(key))
+        return self.meta.get(key, default)
+
+    def to_dict(self) -> dict:
+        snapshot = dict(self.meta)
+        for kind in _RECORD_KINDS:
+            snapshot[kind] = list(self.iter_records(kind))
+        return snapshot
+
+
+class _LotMap(Mapping):
+    """lot_id → (field, lot), decoding the owning field on access."""
+
+    def __init__(self, snap: BinarySnapshot):
+        self._snap = snap
+
+    def __getitem__(self, lot_id: str) -> tuple[dict, dict]:
+        f = self._snap._lot_ids.find(lot_id) if isinstance(lot_id, str) else None
+        if f is None:
+            raise KeyError(lot_id)
+        field = self._snap.field_at(f)
+        for lot in field.get("lots", []):
+            if lot["id"] == lot_id:
+                return field, lot
+        raise KeyError(lot_id)
+
+    def __contains__(self, lot_id: object) -> bool:
+        return isinstance(lot_id, str) and self._snap._lot_ids.find(lot_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._snap._lot_ids)
+
+    def __len__(self) -> int:
+        return len(self._snap._lot_ids)
+
+
+# ─── Per-tenant reader cache ──────────────────────────────
+
+def _file_identity(path: str) -> Optional[tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class BinarySnapshotCache:
+    """Open .snap readers by tenant, kept in step with the JSON snapshots.
+
+    The JSON file stays the source of truth (hashing, delta sync, other
+    processes). A reader is reused while neither the JSON file nor its
+    meta sidecar changed. When one did, the reader is kept only if its
+    content hash still matches the sidecar (e.g. an unchanged refresh);
+    otherwise the .snap next to it is reopened, and rebuilt from the JSON
+    first if it is missing or its hash differs from the sidecar (e.g.
+    sync_service wrote a new snapshot).
+
+    Keying on the sidecar too matters: write_snapshot_file replaces the
+    JSON before the sidecar, and a reader opened in between (new JSON, old
+    hash) is dropped as soon as the sidecar is written.
+
+    Replaced readers are not closed — handlers may still hold them; the
+    mapping is released when the last reference goes.
+    """
+
+    def __init__(self) -> None:
+        # tenant → ((JSON identity, sidecar identity), reader)
+        self._entries: dict[str, tuple[tuple, BinarySnapshot]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.opens = 0
+        self.conversions = 0
+
+    def get(self, tenant_id: str, json_path: str) -> BinarySnapshot:
+        """Return the tenant's reader. Raises FileNotFoundError without a snapshot."""
+        identity = (_file_identity(json_path), _file_identity(meta_path(json_path)))
+        if identity[0] is None:
+            raise FileNotFoundError(json_path)
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is not None and entry[0] == identity:
+                self.hits += 1
+                return entry[1]
+
+        snap_path = binary_path(json_path)
+        expected = read_meta(json_path).get("content_hash", "")
+        if entry is not None and expected and entry[1].content_hash == expected:
+            cached = entry[1]
+            st = _file_identity(snap_path)
+            if st is not None and st[:2] == cached.identity:
+                # Only the sidecar was touched (unchanged refresh): keep the reader
+                with self._lock:
+                    self.hits += 1
+                    self._entries[tenant_id] = (identity, cached)
+                return cached
+
+        snap = self._open(snap_path)
+        if snap is None or not expected or snap.content_hash != expected:
+            convert_json_file(json_path, snap_path, expected)
+            self.conversions += 1
+            snap = BinarySnapshot(snap_path)
+        with self._lock:
+            self.opens += 1
+            self._entries[tenant_id] = (identity, snap)
+        return snap
+
+    def reload(self, tenant_id: str, json_path: str) -> BinarySnapshot:
+        """Replace the tenant's reader after its .snap file was rewritten."""
+        with self._lock:
+            self._entries.pop(tenant_id, None)
+        return self.get(tenant_id, json_path)
+
+    @staticmethod
+    def _open(snap_path: str) -> Optional[BinarySnapshot]:
+        try:
+            return BinarySnapshot(snap_path)
+        except (OSError, ValueError):
+            return None
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "tenants": len(self._entries),
+                "hits": self.hits,
+                "opens": self.opens,
+                "conversions": self.conversions,
+            }
+
+
+# ─── Benchmark ────────────────────────────────────────────
+
+def _rss() -> tuple[int, int]:
+    """(anonymous, file-backed) resident bytes of this process.
+
+    Read from /proc/self/status on Linux; elsewhere peak RSS from
+    getrusage, all counted as anonymous.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            fields = dict(line.split(":", 1) for line in f if line.startswith("Rss"))
+        return tuple(int(fields[k].split()[0]) * 1024 for k in ("RssAnon", "RssFile"))
+    except (OSError, KeyError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, 0
+
+
+def _bench_load(kind: str, path: str, worker_id: str) -> dict[str, Any]:
+    """Load one snapshot and query one worker; RSS grown by both.
+
+    rss_mb is the total growth; mapped_mb is the part that is file-backed
+    (the .snap pages the kernel mapped in, shared with the page cache).
+    """
+    import gc
+    import time
+
+    from snapshot_index import SnapshotIndex
+
+    gc.collect()
+    anon_before, file_before = _rss()
+    started = time.perf_counter()
+    if kind == "json":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index: Any = SnapshotIndex(data)
+    else:
+        index = BinarySnapshot(path)
+    load_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    n = len(index.active_tasks(worker_id))
+    query_seconds = time.perf_counter() - started
+    anon_after, file_after = _rss()
+    anon, mapped = anon_after - anon_before, file_after - file_before
+    return {
+        "load_seconds": round(load_seconds, 4),
+        "worker_query_seconds": round(query_seconds, 6),
+        "rss_mb": round((anon + mapped) / 1e6, 3),
+        "mapped_mb": round(mapped / 1e6, 3),
+        "active_tasks_for_worker": n,
+    }
+
+
+def _bench(tasks: int = 100_000) -> None:
+    """Compare json.load + SnapshotIndex with the mmap'd .snap reader.
+
+    Each side runs in its own fresh process, so its RSS growth is not
+    blurred by memory the other side (or building the test data) freed.
+    """
+    import multiprocessing
+    import time
+
+    from mock_data import build_large_snapshot
+
+    snapshot = build_large_snapshot(workers=max(10, tasks // 20), tasks=tasks)
+    worker_id = snapshot["workers"][len(snapshot["workers"]) // 2]["id"]
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "snapshot.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, indent=2, ensure_ascii=False)
+        del snapshot
+        started = time.perf_counter()
+        snap_path = convert_json_file(json_path)
+        convert_seconds = time.perf_counter() - started
+
+        with multiprocessing.get_context("spawn").Pool(1, maxtasksperchild=1) as pool:
+            j = pool.apply(_bench_load, ("json", json_path, worker_id))
+            b = pool.apply(_bench_load, ("binary", snap_path, worker_id))
+        assert j["active_tasks_for_worker"] == b["active_tasks_for_worker"]
+        result = {
+            "tasks": tasks,
+            "json_bytes": os.path.getsize(json_path),
+            "snap_bytes": os.path.getsize(snap_path),
+            "convert_seconds": round(convert_seconds, 3),
+            "json": j,
+            "binary": b,
+        }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        n = 100_000
+        if "--tasks" in sys.argv:
+            n = int(sys.argv[sys.argv.index("--tasks") + 1])
+        _bench(n)
+    elif len(sys.argv) >= 3 and sys.argv[1] == "convert":
+        print(convert_json_file(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None))
+    else:
+        print(__doc__)
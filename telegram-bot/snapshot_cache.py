@@ -0,0 +1,221 @@
+"""
+snapshot_cache.py — In-process cache of parsed tenant snapshots
+===============================================================
+Handlers read the same snapshot_<tenant>.json many times per minute.
+This cache keeps the parsed dicts in memory, keyed by tenant, and only
+re-parses when the file on disk changes (inode / size / mtime) or when a
+caller asks for a different snapshot version.
+
+Least-recently-used tenants are evicted once the total size exceeds the
+byte budget. Sizes are the serialized JSON sizes on disk, which is a
+stable (if conservative) proxy for the parsed footprint.
+
+Each cached dict also carries its lazily built SnapshotIndex (see
+index_for), for as long as the dict lives — also after it is evicted
+while a handler still holds it.
+With compact=True entries are SnapshotModel objects (snapshot_model.py:
+slotted records, several times smaller than the dicts) that serve as
+their own index; handlers read them the same way.
+
+Cached snapshots are shared between callers: treat them as read-only.
+
+Usage:
+    cache = SnapshotCache(max_bytes=256 * 1024 * 1024)
+    snapshot = cache.get(tenant_id, path)       # parse once, then hit
+    cache.put(tenant_id, path, snapshot, size)  # after writing the file
+"""
+
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Union
+
+from logger import get_logger
+from snapshot_index import SnapshotIndex
+from snapshot_model import SnapshotModel
+
+log = get_logger("snapshot_cache")
+
+# (st_ino, st_size, st_mtime_ns) — changes whenever the file is replaced
+FileIdentity = tuple[int, int, int]
+
+# A cached snapshot: the parsed dict, or its compact model
+CachedSnapshot = Union[dict, SnapshotModel]
+
+
+def tenant_snapshot_path(data_dir: str, tenant_id: str) -> str:
+    """Return the snapshot file of a tenant (shared by bot.py and sync_service.py)."""
+    safe = re.sub(r"[^a-zA-Z0-9_-]", "_", tenant_id)
+    return os.path.join(data_dir, f"snapshot_{safe}.json")
+
+
+def snapshot_version(snapshot: CachedSnapshot) -> str:
+    """Return the version marker of a snapshot ('' if it has none)."""
+    return str(snapshot.get("version") or snapshot.get("generated_at") or "")
+
+
+def _identity(st: os.stat_result) -> FileIdentity:
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class _IndexedSnapshot(dict):
+    """A cached snapshot dict with a slot for its SnapshotIndex."""
+
+    __slots__ = ("index",)
+
+
+class _Entry:
+    __slots__ = ("snapshot", "identity", "version", "size")
+
+    def __init__(self, snapshot: CachedSnapshot, identity: FileIdentity, size: int):
+        self.snapshot = snapshot
+        self.identity = identity
+        self.version = snapshot_version(snapshot)
+        self.size = size
+
+
+class SnapshotCache:
+    """Tenant-keyed LRU cache of parsed snapshots with a byte budget.
+
+    Thread-safe: snapshots are also written from worker threads.
+    """
+
+    def __init__(self, max_bytes: int, compact: bool = False):
+        self._max_bytes = max_bytes
+        self._compact = compact
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # ─── Reads ────────────────────────────────────────────
+
+    def get(self, tenant_id: str, path: str, version: Optional[str] = None) -> CachedSnapshot:
+        """Return the parsed snapshot at `path`, re-parsing only when it changed.
+
+        Args:
+            tenant_id: Cache key
+            path: Snapshot file path
+            version: If given, a cached entry with a different version is
+                treated as stale even if the file identity matches.
+
+        Raises FileNotFoundError if the file does not exist.
+        """
+        st = os.stat(path)
+        identity = _identity(st)
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            if entry is not None:
+                if entry.identity == identity and (
+                    version is None or entry.version == version
+                ):
+                    self._entries.move_to_end(tenant_id)
+                    self.hits += 1
+                    return entry.snapshot
+                self.invalidations += 1
+            self.misses += 1
+
+        # Parse outside the lock. fstat the open file so the identity we
+        # record is exactly the one we parsed, even if it is replaced meanwhile.
+        with open(path, "r", encoding="utf-8") as f:
+            identity = _identity(os.fstat(f.fileno()))
+            snapshot = json.load(f)
+        snapshot = self._convert(snapshot)
+        self._store(tenant_id, _Entry(snapshot, identity, identity[1]))
+        return snapshot
+
+    def _convert(self, snapshot: dict) -> CachedSnapshot:
+        if self._compact:
+            return SnapshotModel.from_dict(snapshot)
+        return _IndexedSnapshot(snapshot)
+
+    def peek(self, tenant_id: str) -> Optional[CachedSnapshot]:
+        """Return the cached snapshot without touching the file or LRU order."""
+        with self._lock:
+            entry = self._entries.get(tenant_id)
+            return entry.snapshot if entry else None
+
+    def index_for(self, snapshot: CachedSnapshot) -> Union[SnapshotIndex, SnapshotModel]:
+        """Return the SnapshotIndex for a snapshot returned by this cache.
+
+        Built on first use and stored on the snapshot itself, so it is kept
+        even after the snapshot is evicted. Dicts that did not come from the
+        cache get a fresh index on every call. A SnapshotModel is its own
+        index.
+        """
+        if isinstance(snapshot, SnapshotModel):
+            return snapshot
+        index = getattr(snapshot, "index", None)
+        if index is None:
+            # Two threads may both build it on first use; either result is fine
+            index = SnapshotIndex(snapshot)
+            if isinstance(snapshot, _IndexedSnapshot):
+                snapshot.index = index
+        return index
+
+    # ─── Writes ───────────────────────────────────────────
+
+    def put(self, tenant_id: str, path: str, snapshot: dict, size: int) -> None:
+        """Cache a snapshot that was just written to `path` (no re-parse).
+
+        The cache keeps its own copy of the top level (or, in compact mode,
+        a SnapshotModel); the caller's dict is not kept.
+
+        Args:
+            size: Serialized size in bytes (as written to disk)
+        """
+        try:
+            identity = _identity(os.stat(path))
+        except OSError:
+            self.invalidate(tenant_id)
+            return
+        self._store(tenant_id, _Entry(self._convert(snapshot), identity, size))
+
+    def invalidate(self, tenant_id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(tenant_id, None)
+            if entry is not None:
+                self._bytes -= entry.size
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _store(self, tenant_id: str, entry: _Entry) -> None:
+        with self._lock:
+            old = self._entries.pop(tenant_id, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[tenant_id] = entry
+            self._bytes += entry.size
+            # Always keep the newest entry, even if it alone exceeds the budget.
+            while self._bytes > self._max_bytes and len(self._entries) > 1:
+                evicted_id, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+                log.debug(
+                    "Snapshot evicted from cache",
+                    tenant_id=evicted_id,
+                    size_bytes=evicted.size,
+                )
+
+    # ─── Monitoring ───────────────────────────────────────
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "tenants": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,102 @@
+"""
+snapshot_index.py — Lookup indexes over a tenant snapshot
+=========================================================
+Built once per loaded snapshot (snapshot_cache keeps it next to the
+parsed dict), so handlers resolve workers, tasks and lots in O(1)/O(k)
+instead of scanning the snapshot lists on every tap.
+
+Usage:
+    index = SnapshotIndex(snapshot)
+    index.workers_by_id["w1"]
+    index.find_workers_by_phone("+54 9 381 600-1003")
+    index.active_tasks("w1", overrides={"t1": "COMPLETED"})
+"""
+
+from typing import Optional
+
+
+def normalize_phone(raw: str) -> str:
+    """Normalize phone numbers for comparison.
+    Strips spaces, dashes, ensures a leading '+',
+    and removes the Argentine mobile '9' prefix (+54 9 → +54).
+    """
+    cleaned = raw.replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
+    if not cleaned.startswith("+"):
+        cleaned = "+" + cleaned
+    if cleaned.startswith("+549") and len(cleaned) > 6:
+        cleaned = "+54" + cleaned[4:]
+    return cleaned
+
+
+class SnapshotIndex:
+    """Precomputed lookups for one snapshot. Read-only once built.
+
+    Active task ids exclude tasks already COMPLETED in the snapshot;
+    local overrides (optimistic completions) are applied at query time
+    so the index never has to be rebuilt for them.
+    """
+
+    __slots__ = (
+        "workers_by_id",
+        "workers_by_phone",
+        "tasks_by_id",
+        "active_task_ids_by_worker",
+        "lots_by_id",
+    )
+
+    def __init__(self, snapshot: dict):
+        self.workers_by_id: dict[str, dict] = {}
+        self.workers_by_phone: dict[str, list[dict]] = {}
+        self.tasks_by_id: dict[str, dict] = {}
+        self.active_task_ids_by_worker: dict[str, list[str]] = {}
+        self.lots_by_id: dict[str, tuple[dict, dict]] = {}  # lot_id → (field, lot)
+
+        for worker in snapshot.get("workers", []):
+            self.workers_by_id[worker["id"]] = worker
+            phone = worker.get("phone")
+            if phone:
+                self.workers_by_phone.setdefault(normalize_phone(phone), []).append(worker)
+
+        for task in snapshot.get("tasks", []):
+            task_id = task["id"]
+            self.tasks_by_id[task_id] = task
+            if task.get("status") == "COMPLETED":
+                continue
+            # dict.fromkeys: a worker listed twice still gets the task once
+            for worker_id in dict.fromkeys(task.get("assigned_worker_ids", [])):
+                self.active_task_ids_by_worker.setdefault(worker_id, []).append(task_id)
+
+        for field in snapshot.get("fields", []):
+            for lot in field.get("lots", []):
+                self.lots_by_id[lot["id"]] = (field, lot)
+
+    def find_workers_by_phone(self, phone: str) -> list[dict]:
+        """Return all workers whose phone normalizes to the same number."""
+        return self.workers_by_phone.get(normalize_phone(phone), [])
+
+    def active_tasks(
+        self, worker_id: str, overrides: Optional[dict[str, str]] = None
+    ) -> list[dict]:
+        """Return the worker's non-completed tasks, in snapshot order."""
+        task_ids = self.active_task_ids_by_worker.get(worker_id, [])
+        if overrides:
+            task_ids = [
+                tid for tid in task_ids if overrides.get(tid) != "COMPLETED"
+            ]
+        return [self.tasks_by_id[tid] for tid in task_ids]
+
+    def count_active_tasks(
+        self, worker_id: str, overrides: Optional[dict[str, str]] = None
+    ) -> int:
+        task_ids = self.active_task_ids_by_worker.get(worker_id, [])
+        if not overrides:
+            return len(task_ids)
+        return sum(1 for tid in task_ids if overrides.get(tid) != "COMPLETED")
+
+    def lot_display(self, lot_id: str) -> str:
+        """Return 'LotName — FieldName' for display (the id if unknown)."""
+        found = self.lots_by_id.get(lot_id)
+        if found is None:
+            return lot_id
+        field, lot = found
+        return f"{lot['name']} — {field['name']}"
@@ -0,0 +1,411 @@
+"""
+snapshot_model.py — Compact in-memory model of a tenant snapshot
+================================================================
+A parsed snapshot is a tree of dicts: every task repeats its key strings,
+carries its own status/type/date strings and two small lists of ids. With
+100k-task tenants that is hundreds of MB per tenant in snapshot_cache.
+
+SnapshotModel holds the same data in slotted records:
+
+  - Worker, Task, Field and Lot are __slots__ classes (no per-record dict);
+  - task status is a TaskStatus (StrEnum, compares equal to the API
+    strings); task_type, dates, names and other repeated strings are
+    interned in one table per snapshot, so each distinct value is stored
+    once;
+  - assigned_worker_ids / lot_ids live in tenant-wide array("I") columns
+    (offsets + indices into the worker and lot id lists), not in
+    per-task lists;
+  - the lookup indexes of SnapshotIndex are built in as arrays as well.
+
+Records are read-only Mappings, so the handlers' read patterns keep
+working unchanged: task["status"], task.get("lot_ids", []), worker["id"],
+lot["name"]. Keys the API sends that the record does not know are kept
+per record. The model itself offers get() for top-level keys and the
+SnapshotIndex interface (workers_by_id, tasks_by_id, lots_by_id,
+find_workers_by_phone, active_tasks, count_active_tasks, lot_display);
+to_dict() converts back to the API schema.
+
+Usage:
+    model = SnapshotModel.from_dict(snapshot)
+    model.active_tasks(worker_id, overrides)
+    model.to_dict() == snapshot
+
+    python snapshot_model.py --bench [--tasks 100000]   # memory vs dicts
+"""
+
+import sys
+from array import array
+from collections.abc import Mapping
+from enum import StrEnum
+from typing import Any, Callable, Iterator, Optional
+
+from snapshot_index import normalize_phone
+
+
+class TaskStatus(StrEnum):
+    PENDING = "PENDING"
+    IN_PROGRESS = "IN_PROGRESS"
+    LATE = "LATE"
+    COMPLETED = "COMPLETED"
+
+
+_STATUSES = {status.value: status for status in TaskStatus}
+
+# Top-level keys held as records; everything else is kept as is
+_RECORD_KINDS = ("workers", "tasks", "fields")
+
+
+class _Strings:
+    """Per-snapshot string table: one object per distinct value."""
+
+    __slots__ = ("_table",)
+
+    def __init__(self) -> None:
+        self._table: dict[str, str] = {}
+
+    def __call__(self, value: Any) -> Any:
+        if value.__class__ is str:
+            return self._table.setdefault(value, value)
+        return value
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+
+# ─── Records ──────────────────────────────────────────────
+
+class _Record(Mapping):
+    """Read-only Mapping over slots. Keys absent in the source stay absent."""
+
+    __slots__ = ("_extra",)
+
+    _KEYS: frozenset = frozenset()      # keys stored in slots of the same name
+    _ORDER: tuple[str, ...] = ()        # the same, in iteration order
+    _INTERNED: frozenset = frozenset()  # of those, the ones run through the string table
+
+    def _load(self, data: dict, strings: _Strings) -> None:
+        extra = None
+        keys, interned = self._KEYS, self._INTERNED
+        for key, value in data.items():
+            if key in keys:
+                setattr(self, key, strings(value) if key in interned else value)
+            elif not self._computed(key):
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self._extra = extra
+
+    @staticmethod
+    def _computed(key: str) -> bool:
+        return False
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._KEYS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self._ORDER:
+            if hasattr(self, key):
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def to_dict(self) -> dict:
+        return {key: self[key] for key in self}
+
+
+class Worker(_Record):
+    __slots__ = ("id", "first_name", "last_name", "phone", "function_type", "active")
+    _KEYS = frozenset(__slots__)
+    _ORDER = __slots__
+    _INTERNED = frozenset({"first_name", "last_name", "function_type"})
+
+
+class Lot(_Record):
+    __slots__ = ("id", "name", "area_hectares", "production_type")
+    _KEYS = frozenset(__slots__)
+    _ORDER = __slots__
+    _INTERNED = frozenset({"name", "production_type"})
+
+
+class Field(_Record):
+    __slots__ = ("id", "name", "location", "lots")
+    _KEYS = frozenset(__slots__)
+    _ORDER = __slots__
+    _INTERNED = frozenset({"name", "location"})
+
+
+class Task(_Record):
+    """A task; its id lists are read from the model's array columns."""
+
+    __slots__ = (
+        "id", "description", "task_type", "status", "start_date", "due_date",
+        "_model", "_i", "_lists",  # _lists: bit n set = _LISTS[n] was in the source
+    )
+    _ORDER = ("id", "description", "task_type", "status", "start_date", "due_date")
+    _KEYS = frozenset(_ORDER)
+    _INTERNED = frozenset({"description", "task_type", "start_date", "due_date"})
+    _LISTS = ("assigned_worker_ids", "lot_ids")
+
+    @staticmethod
+    def _computed(key: str) -> bool:
+        return key in Task._LISTS
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "assigned_worker_ids" and self._lists & 1:
+            return self._model._ids(self._model._assigned, self._i, self._model._worker_ids)
+        if key == "lot_ids" and self._lists & 2:
+            return self._model._ids(self._model._lots, self._i, self._model._lot_ids)
+        return super().__getitem__(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from super().__iter__()
+        for bit, key in enumerate(self._LISTS):
+            if self._lists & (1 << bit):
+                yield key
+
+    def to_dict(self) -> dict:
+        data = super().to_dict()
+        if isinstance(data.get("status"), TaskStatus):
+            data["status"] = data["status"].value  # plain str, as the API sends it
+        return data
+
+
+def _make(cls: type, data: dict, strings: _Strings) -> Any:
+    record = cls.__new__(cls)
+    record._load(data, strings)
+    return record
+
+
+# ─── Model ────────────────────────────────────────────────
+
+class _Column:
+    """Variable-length lists of u32 indices: offsets + one flat array."""
+
+    __slots__ = ("offsets", "items")
+
+    def __init__(self) -> None:
+        self.offsets = array("I", [0])
+        self.items = array("I")
+
+    def append(self, values: list[int]) -> None:
+        self.items.extend(values)
+        self.offsets.append(len(self.items))
+
+    def get(self, i: int) -> array:
+        return self.items[self.offsets[i]:self.offsets[i + 1]]
+
+
+class SnapshotModel:
+    """Slotted-record snapshot with the SnapshotIndex interface. Read-only."""
+
+    def __init__(self) -> None:
+        self.meta: dict[str, Any] = {}
+        self.workers: list[Worker] = []
+        self.tasks: list[Task] = []
+        self.fields: list[Field] = []
+        self.workers_by_id: dict[str, Worker] = {}
+        self.tasks_by_id: dict[str, Task] = {}
+        self.lots_by_id: dict[str, tuple[Field, Lot]] = {}
+        self.workers_by_phone: dict[str, list[Worker]] = {}
+        self._worker_ids: list[str] = []
+        self._worker_index: dict[str, int] = {}  # id → position of its (last) record
+        self._lot_ids: list[str] = []
+        # Per task: indices into _worker_ids / _lot_ids (unknown ids kept in _unknown_ids)
+        self._assigned = _Column()
+        self._lots = _Column()
+        self._unknown_ids: list[str] = []
+        # Per worker: indices of its non-completed tasks, in snapshot order
+        self._active = _Column()
+        self.strings = _Strings()
+
+    @classmethod
+    def from_dict(cls, snapshot: dict) -> "SnapshotModel":
+        model = cls()
+        strings = model.strings
+        model.meta = {k: v for k, v in snapshot.items() if k not in _RECORD_KINDS}
+
+        worker_index = model._worker_index
+        for data in snapshot.get("workers", []):
+            worker = _make(Worker, data, strings)
+            worker_index[worker["id"]] = len(model.workers)
+            model.workers.append(worker)
+            model._worker_ids.append(worker["id"])
+            model.workers_by_id[worker["id"]] = worker
+            phone = worker.get("phone")
+            if phone:
+                model.workers_by_phone.setdefault(normalize_phone(phone), []).append(worker)
+
+        lot_index: dict[str, int] = {}
+        for data in snapshot.get("fields", []):
+            field = _make(Field, data, strings)
+            lots = tuple(_make(Lot, lot, strings) for lot in data.get("lots", []))
+            if "lots" in data:
+                field.lots = lots
+            model.fields.append(field)
+            for lot in lots:
+                lot_index[lot["id"]] = len(model._lot_ids)
+                model._lot_ids.append(lot["id"])
+                model.lots_by_id[lot["id"]] = (field, lot)
+
+        active: list[list[int]] = [[] for _ in model.workers]
+        for i, data in enumerate(snapshot.get("tasks", [])):
+            task = _make(Task, data, strings)
+            if "status" in data:
+                task.status = _STATUSES.get(data["status"]) or strings(data["status"])
+            task._model = model
+            task._i = i
+            task._lists = ("assigned_worker_ids" in data) | ("lot_ids" in data) << 1
+            assigned = data.get("assigned_worker_ids", [])
+            model._assigned.append(model._encode_ids(assigned, worker_index))
+            model._lots.append(model._encode_ids(data.get("lot_ids", []), lot_index))
+            model.tasks.append(task)
+            model.tasks_by_id[task["id"]] = task
+            if data.get("status") == TaskStatus.COMPLETED:
+                continue
+            # dict.fromkeys: a worker listed twice still gets the task once
+            for worker_id in dict.fromkeys(assigned):
+                w = worker_index.get(worker_id)
+                if w is not None:
+                    active[w].append(i)
+        for task_indices in active:
+            model._active.append(task_indices)
+        return model
+
+    # Ids are stored as indices into the id list; ids that are not in the
+    # snapshot (a lot since deleted, …) go to _unknown_ids, tagged by the high bit.
+    _UNKNOWN = 1 << 31
+
+    def _encode_ids(self, ids: list[str], index: dict[str, int]) -> list[int]:
+        encoded = []
+        for value in ids:
+            i = index.get(value)
+            if i is None:
+                i = self._UNKNOWN | len(self._unknown_ids)
+                self._unknown_ids.append(value)
+            encoded.append(i)
+        return encoded
+
+    def _ids(self, column: _Column, i: int, ids: list[str]) -> list[str]:
+        return [
+            self._unknown_ids[n & ~self._UNKNOWN] if n & self._UNKNOWN else ids[n]
+            for n in column.get(i)
+        ]
+
+    # ─── SnapshotIndex interface ──────────────────────────
+
+    def find_workers_by_phone(self, phone: str) -> list[Worker]:
+        return self.workers_by_phone.get(normalize_phone(phone), [])
+
+    def _active_task_indices(self, worker_id: str) -> array:
+        w = self._worker_index.get(worker_id)
+        if w is None:
+            return array("I")
+        return self._active.get(w)
+
+    def active_tasks(
+        self, worker_id: str, overrides: Optional[dict[str, str]] = None
+    ) -> list[Task]:
+        """Return the worker's non-completed tasks, in snapshot order."""
+        tasks = [self.tasks[i] for i in self._active_task_indices(worker_id)]
+        if overrides:
+            tasks = [t for t in tasks if overrides.get(t["id"]) != "COMPLETED"]
+        return tasks
+
+    def count_active_tasks(
+        self, worker_id: str, overrides: Optional[dict[str, str]] = None
+    ) -> int:
+        indices = self._active_task_indices(worker_id)
+        if not overrides:
+            return len(indices)
+        return len(self.active_tasks(worker_id, overrides))
+
+    def lot_display(self, lot_id: str) -> str:
+        """Return 'LotName — FieldName' for display (the id if unknown)."""
+        found = self.lots_by_id.get(lot_id)
+        if found is None:
+            return lot_id
+        field, lot = found
+        return f"{lot['name']} — {field['name']}"
+
+    # ─── Snapshot dict compatibility ──────────────────────
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Top-level value; "workers"/"tasks"/"fields" return the record lists."""
+        if key in _RECORD_KINDS:
+            return getattr(self, key)
+        return self.meta.get(key, default)
+
+    def to_dict(self) -> dict:
+        snapshot = dict(self.meta)
+        snapshot["workers"] = [w.to_dict() for w in self.workers]
+        snapshot["tasks"] = [t.to_dict() for t in self.tasks]
+        snapshot["fields"] = [
+            {**f.to_dict(), "lots": [lot.to_dict() for lot in f["lots"]]} if "lots" in f else f.to_dict()
+            for f in self.fields
+        ]
+        return snapshot
+
+
+# ─── Benchmark ────────────────────────────────────────────
+
+def _bench(tasks: int = 100_000) -> None:
+    """Resident memory of dicts + SnapshotIndex vs SnapshotModel."""
+    import gc
+    import json
+    import time
+    import tracemalloc
+
+    from mock_data import build_large_snapshot
+    from snapshot_index import SnapshotIndex
+
+    encoded = json.dumps(build_large_snapshot(workers=max(10, tasks // 20), tasks=tasks))
+
+    def measure(build: Callable[[dict], Any]) -> tuple[float, float, Any]:
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        snapshot = json.loads(encoded)
+        obj = build(snapshot)
+        seconds = time.perf_counter() - started
+        del snapshot
+        gc.collect()
+        resident, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return seconds, resident, obj
+
+    d_seconds, d_resident, d_obj = measure(lambda s: (s, SnapshotIndex(s)))
+    worker_id = d_obj[0]["workers"][len(d_obj[0]["workers"]) // 2]["id"]
+    expected = d_obj[1].active_tasks(worker_id)
+    del d_obj
+    m_seconds, m_resident, model = measure(SnapshotModel.from_dict)
+    assert [t.to_dict() for t in model.active_tasks(worker_id)] == expected
+    print(json.dumps({
+        "tasks": tasks,
+        "dict": {"build_seconds": round(d_seconds, 3), "resident_mb": round(d_resident / 1e6, 1)},
+        "model": {"build_seconds": round(m_seconds, 3), "resident_mb": round(m_resident / 1e6, 1)},
+        "interned_strings": len(model.strings),
+        "ratio": round(d_resident / m_resident, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        n = 100_000
+        if "--tasks" in sys.argv:
+            n = int(sys.argv[sys.argv.index("--tasks") + 1])
+        _bench(n)
+    else:
+        print(__doc__)
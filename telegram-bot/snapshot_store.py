@@ -0,0 +1,141 @@
+"""
+snapshot_store.py — Snapshot file writes with content hashes and revisions
+==========================================================================
+Writing snapshot_<tenant>.json on every successful fetch re-serializes
+and replaces the file even when nothing changed, which changes its
+identity (inode/mtime) and invalidates every cache keyed on it.
+
+write_snapshot_file() hashes the snapshot content (SHA-256 of its
+canonical JSON, without the volatile "generated_at"/"revision" keys) and
+only replaces the file when the hash differs. Each real change stamps the
+next per-tenant revision — a counter that only goes up — into the file
+("revision") and into a small sidecar, snapshot_<tenant>.meta.json:
+
+    {"revision": 7, "content_hash": "…", "size": 123456,
+     "written_at": 1760000000.0, "checked_at": 1760000060.0,
+     "unchanged_cycles": 1}
+
+The sidecar is rewritten on every refresh, changed or not, so its mtime
+(last_refreshed()) is when the tenant was last known to be up to date;
+readers check "revision" there to detect changes without parsing the
+snapshot. A missing sidecar falls back to the snapshot's own mtime and
+embedded revision.
+
+Usage:
+    written, meta = write_snapshot_file(path, snapshot)   # False if identical
+    meta = mark_checked(path)                              # 304 / unchanged
+    refreshed_at = last_refreshed(path)
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Optional
+
+# Keys that change on every fetch without the data changing
+VOLATILE_KEYS = ("generated_at", "revision")
+
+
+def meta_path(path: str) -> str:
+    """snapshot_<tenant>.json → snapshot_<tenant>.meta.json"""
+    base, _ = os.path.splitext(str(path))
+    return f"{base}.meta.json"
+
+
+def content_hash(snapshot: dict) -> str:
+    """SHA-256 of the snapshot's canonical JSON, volatile keys excluded."""
+    body = {k: v for k, v in snapshot.items() if k not in VOLATILE_KEYS}
+    encoded = json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def read_meta(path: str) -> dict[str, Any]:
+    """The sidecar of a snapshot ({} if missing or unreadable)."""
+    try:
+        with open(meta_path(path), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return meta if isinstance(meta, dict) else {}
+
+
+def last_refreshed(path: str) -> Optional[float]:
+    """When the snapshot was last written or confirmed unchanged (None if missing)."""
+    for candidate in (meta_path(path), str(path)):
+        try:
+            return os.path.getmtime(candidate)
+        except OSError:
+            continue
+    return None
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    directory = os.path.dirname(str(path)) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, str(path))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _write_meta(path: str, meta: dict[str, Any]) -> None:
+    _atomic_write(meta_path(path), json.dumps(meta).encode("utf-8"))
+
+
+def _current_revision(path: str, meta: dict[str, Any]) -> int:
+    if "revision" in meta:
+        return int(meta["revision"])
+    # No sidecar yet (older file): take the revision stamped in the snapshot
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(json.load(f).get("revision") or 0)
+    except (OSError, ValueError, TypeError, AttributeError):
+        return 0
+
+
+def write_snapshot_file(path: str, snapshot: dict) -> tuple[bool, dict[str, Any], dict]:
+    """Write the snapshot unless its content is unchanged.
+
+    Returns (written, meta, stamped snapshot). When nothing changed the
+    file is left alone (only the sidecar is updated) and the stamped
+    snapshot carries the current revision.
+    """
+    digest = content_hash(snapshot)
+    meta = read_meta(path)
+    now = time.time()
+    if meta.get("content_hash") == digest and os.path.exists(path):
+        meta["checked_at"] = now
+        meta["unchanged_cycles"] = int(meta.get("unchanged_cycles", 0)) + 1
+        _write_meta(path, meta)
+        return False, meta, {**snapshot, "revision": meta.get("revision", 0)}
+
+    revision = _current_revision(path, meta) + 1
+    stamped = {**snapshot, "revision": revision}
+    data = json.dumps(stamped, indent=2, ensure_ascii=False).encode("utf-8")
+    _atomic_write(path, data)
+    meta = {
+        "revision": revision,
+        "content_hash": digest,
+        "size": len(data),
+        "written_at": now,
+        "checked_at": now,
+        "unchanged_cycles": 0,
+    }
+    _write_meta(path, meta)
+    return True, meta, stamped
+
+
+def mark_checked(path: str) -> dict[str, Any]:
+    """Record that the snapshot was confirmed up to date (e.g. a 304)."""
+    meta = read_meta(path)
+    meta["checked_at"] = time.time()
+    meta["unchanged_cycles"] = int(meta.get("unchanged_cycles", 0)) + 1
+    _write_meta(path, meta)
+    return meta
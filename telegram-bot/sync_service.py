@@ -1,27 +1,43 @@
 """
 sync_service.py — Snapshot Generator for the Seedor Telegram Bot
 ================================================================
-Fetches data from the Seedor API and writes a read-only snapshot
-to data/snapshot.json. Also pushes pending updates back to the API.
+Fetches data from the Seedor API and writes read-only per-tenant
+snapshots (data/snapshot_<tenant>.json, the files bot.py reads). Also
+pushes pending updates (data/updates_journal/, see event_journal.py) back
+to the API.
+
+In --daemon mode it runs as an asyncio sidecar next to the bot: the
+tenants to keep fresh are the ones selected in data/sessions.json (re-read
+whenever the bot rewrites it), refreshed concurrently on the adaptive
+per-tenant schedule of refresh_scheduler.py, while the updates journal is
+drained every SEEDOR_PUSH_INTERVAL_MINUTES. With the sidecar running, the
+bot's handlers find fresh snapshots on disk instead of calling the API.
 
 Phase 0 improvements:
   - Structured JSON logging
-  - Retry with exponential backoff
+  - Retry with exponential backoff (transient errors only, full jitter)
   - Dead-letter queue for failed events
 
+Snapshots are synced incrementally (conditional GET + deltas, see
+delta_sync.py) unless SEEDOR_DELTA_SYNC=0. All API calls share one pooled
+keep-alive client (api_client.py).
+
 Usage:
     python sync_service.py --tenant <id>              # one-shot sync
-    python sync_service.py --tenant <id> --daemon     # periodic sync every 60s
+    python sync_service.py --daemon                   # sidecar: all tenants in sessions.json
+    python sync_service.py --tenant <id> --daemon     # sidecar for a single tenant
     python sync_service.py --push                     # push pending updates only
     python sync_service.py --dlq                      # show dead-letter queue stats
+    python sync_service.py --dlq-replay [--type T] [--error PATTERN] [--limit N]
+                                                      # re-submit dead letters
 """
 
+import asyncio
 import json
 import os
+import signal
 import sys
-import tempfile
-import urllib.request
-import urllib.error
+import time
 from pathlib import Path
 from typing import Optional
 
@@ -44,15 +60,33 @@ _load_dotenv(str(BASE_DIR / ".env"))
 
 # ─── Structured logging ──────────────────────────────────
 from logger import get_logger
-from retry import retry_with_backoff, DeadLetterQueue
+from metrics import metrics
+from retry import RetryPolicy, classify_error
+from dead_letter import DeadLetterQueue
+from delta_sync import DeltaSyncClient
+from api_client import SeedorApiClient
+from circuit_breaker import CircuitOpenError
+from event_journal import EventJournal, JournalBusyError, JournalConsumer
+from bot_registry import BotRegistry
+from notification_queue import FileWatcher
+from refresh_scheduler import RefreshScheduler, SYNC_INTERVAL_SECONDS
+from refresh_lease import RefreshLeases
+from snapshot_cache import tenant_snapshot_path
+from snapshot_store import last_refreshed, mark_checked, write_snapshot_file
+from snapshot_binary import binary_path, write_binary_snapshot
 
 log = get_logger("sync")
 
 # ─── Config ────────────────────────────────────────────────
 DATA_DIR = BASE_DIR / "data"
-SNAPSHOT_PATH = DATA_DIR / "snapshot.json"
-UPDATES_PATH = DATA_DIR / "updates_queue.json"
-DLQ_PATH = DATA_DIR / "dead_letter.json"
+SNAPSHOT_PATH = DATA_DIR / "snapshot.json"  # legacy single-tenant file, read for migration only
+SESSIONS_PATH = DATA_DIR / "sessions.json"
+LEASES_DIR = DATA_DIR / "leases"
+UPDATES_PATH = DATA_DIR / "updates_queue.json"  # legacy, migrated to the journal
+UPDATES_JOURNAL_DIR = DATA_DIR / "updates_journal"
+JOURNAL_CONSUMER = "sync_service"
+DLQ_PATH = DATA_DIR / "dead_letter.db"
+LEGACY_DLQ_PATH = DATA_DIR / "dead_letter.json"  # migrated on first use
 
 API_URL = os.environ.get("SEEDOR_API_URL", "http://localhost:3000")
 
@@ -67,68 +101,105 @@ def _resolve_api_key() -> tuple[str, str]:
 
 
 API_KEY, API_KEY_SOURCE = _resolve_api_key()
+DELTA_SYNC_ENABLED = os.environ.get("SEEDOR_DELTA_SYNC", "1") != "0"
+# "binary": also write the .snap file the bot reads (see snapshot_binary.py)
+SNAPSHOT_FORMAT = os.environ.get("SEEDOR_SNAPSHOT_FORMAT", "json").lower()
+UPDATES_API_PATH = "/api/telegram/updates"
+# Event push: events per POST and POSTs in flight
+PUSH_BATCH_SIZE = max(1, int(os.environ.get("SEEDOR_PUSH_BATCH_SIZE", "100")))
+PUSH_CONCURRENCY = max(1, int(os.environ.get("SEEDOR_PUSH_CONCURRENCY", "4")))
+PUSH_READ_LIMIT = 5000  # journal events read per drain round
+# --dlq-replay: events per POST and max events per second
+DLQ_REPLAY_BATCH_SIZE = max(1, int(os.environ.get("SEEDOR_DLQ_REPLAY_BATCH_SIZE", "50")))
+DLQ_REPLAY_RATE = float(os.environ.get("SEEDOR_DLQ_REPLAY_RATE", "20"))
 # SEEDOR_TENANT_ID removed — sync_service now works with tenant IDs from active sessions
 # For manual CLI usage, pass --tenant <id>
 
 # ─── Dead-letter queue ────────────────────────────────────
-dlq = DeadLetterQueue(DLQ_PATH)
+dlq = DeadLetterQueue(DLQ_PATH, legacy_json=LEGACY_DLQ_PATH)
+updates_journal = EventJournal(UPDATES_JOURNAL_DIR)
+delta_sync = DeltaSyncClient()
+api = SeedorApiClient(API_URL, API_KEY, timeout=30)
+api_retry = RetryPolicy(max_retries=3, base_delay=2.0, max_delay=30.0)
+# Shared with bot.py: one process fetches a tenant at a time
+refresh_leases = RefreshLeases(LEASES_DIR)
 
 
-@retry_with_backoff(max_retries=3, base_delay=2.0, max_delay=30.0)
-def _api_request(method: str, path: str, body: Optional[dict] = None) -> dict:
+@api_retry
+async def _api_request(method: str, path: str, body: Optional[dict] = None) -> dict:
     """Make an authenticated request to the Seedor API with retry + backoff."""
-    url = f"{API_URL.rstrip('/')}{path}"
-    data = json.dumps(body).encode("utf-8") if body else None
-
-    req = urllib.request.Request(
-        url,
-        data=data,
-        method=method,
-        headers={
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json",
-        },
-    )
+    resp = await api.request(method, path, json_body=body)
+    return resp.json()
+
+
+@api_retry
+async def _api_get_raw(
+    path: str,
+    params: Optional[dict[str, str]] = None,
+    headers: Optional[dict[str, str]] = None,
+) -> tuple[int, dict[str, str], bytes]:
+    """Authenticated GET returning (status, headers, body). 304 is not an error."""
+    resp = await api.request("GET", path, params=params, headers=headers)
+    return resp.status, resp.headers, resp.body
 
+
+def snapshot_path(tenant_id: str) -> Path:
+    """Return the tenant's snapshot file (bot.py's naming scheme)."""
+    return Path(tenant_snapshot_path(str(DATA_DIR), tenant_id))
+
+
+def _load_local_snapshot(tenant_id: str) -> Optional[dict]:
+    """Return the on-disk snapshot of tenant_id (or the legacy file if it is that tenant's)."""
     try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode("utf-8", errors="replace")
-        log.error(
-            "API HTTP error",
-            method=method,
-            path=path,
-            status_code=e.code,
-            response=error_body[:500],
-        )
-        raise
+        with open(snapshot_path(tenant_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        pass
+    try:
+        with open(SNAPSHOT_PATH, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if snapshot.get("tenant", {}).get("id") != tenant_id:
+        return None
+    return snapshot
 
 
-def fetch_snapshot(tenant_id: str = "") -> dict:
+async def sync_snapshot(tenant_id: str, local: Optional[dict]) -> tuple[dict, bool]:
+    """Incrementally sync a tenant snapshot. Returns (snapshot, changed)."""
+    if not tenant_id:
+        raise ValueError("tenant_id is required — pass --tenant <id> or provide it programmatically")
+    return await delta_sync.sync_async(
+        tenant_id,
+        local,
+        lambda params, headers: _api_get_raw("/api/telegram/snapshot", params, headers),
+    )
+
+
+async def fetch_snapshot(tenant_id: str = "") -> dict:
     """Fetch the snapshot from the Seedor API for a specific tenant."""
     if not tenant_id:
         raise ValueError("tenant_id is required — pass --tenant <id> or provide it programmatically")
-    return _api_request("GET", f"/api/telegram/snapshot?tenantId={tenant_id}")
+    return await _api_request("GET", f"/api/telegram/snapshot?tenantId={tenant_id}")
 
 
-def write_snapshot(snapshot: dict) -> None:
-    """Atomically write the snapshot to disk."""
-    DATA_DIR.mkdir(parents=True, exist_ok=True)
+def write_snapshot(snapshot: dict, tenant_id: str) -> tuple[bool, dict]:
+    """Atomically write the tenant's snapshot to disk, unless its content is unchanged.
+
+    Returns (written, meta sidecar) — see snapshot_store.py.
+    """
+    path = str(snapshot_path(tenant_id))
+    written, meta, stamped = write_snapshot_file(path, snapshot)
+    if SNAPSHOT_FORMAT == "binary" and (written or not os.path.exists(binary_path(path))):
+        write_binary_snapshot(stamped, binary_path(path), meta.get("content_hash", ""))
+    return written, meta
 
-    fd, tmp_path = tempfile.mkstemp(dir=str(DATA_DIR), suffix=".tmp")
-    try:
-        with os.fdopen(fd, "w", encoding="utf-8") as f:
-            json.dump(snapshot, f, indent=2, ensure_ascii=False)
-        os.replace(tmp_path, str(SNAPSHOT_PATH))
-    except Exception:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
-        raise
 
+async def sync_once(tenant_id: str = "") -> bool:
+    """Run a single sync cycle: fetch a tenant snapshot and write it to its file.
 
-def sync_once(tenant_id: str = "") -> None:
-    """Run a single sync cycle: fetch snapshot from API and write to file."""
+    Returns True if the snapshot changed.
+    """
     if not API_KEY:
         log.critical(
             "Required API key env var not set",
@@ -139,8 +210,28 @@ def sync_once(tenant_id: str = "") -> None:
         log.critical("tenant_id required — pass --tenant <id>")
         raise SystemExit(1)
 
-    snapshot = fetch_snapshot(tenant_id)
-    write_snapshot(snapshot)
+    path = snapshot_path(tenant_id)
+    if DELTA_SYNC_ENABLED:
+        local = await asyncio.to_thread(_load_local_snapshot, tenant_id)
+        snapshot, changed = await sync_snapshot(tenant_id, local)
+    else:
+        snapshot, changed = await fetch_snapshot(tenant_id), True
+
+    if changed or not path.exists():
+        # A full fetch may still return identical content: the write is skipped then
+        changed, meta = await asyncio.to_thread(write_snapshot, snapshot, tenant_id)
+    else:
+        meta = await asyncio.to_thread(mark_checked, str(path))
+    if not changed:
+        metrics.incr("snapshot_writes", outcome="unchanged")
+        log.info(
+            "Snapshot unchanged",
+            tenant_id=tenant_id,
+            revision=meta.get("revision"),
+            unchanged_cycles=meta.get("unchanged_cycles", 0),
+        )
+        return False
+    metrics.incr("snapshot_writes", outcome="written")
 
     w = len(snapshot.get("workers", []))
     f = len(snapshot.get("fields", []))
@@ -148,86 +239,208 @@ def sync_once(tenant_id: str = "") -> None:
 
     log.info(
         "Snapshot synced",
+        tenant_id=tenant_id,
         generated_at=snapshot.get("generated_at", "?"),
+        revision=meta.get("revision"),
         workers=w,
         fields=f,
         tasks=t,
-        path=str(SNAPSHOT_PATH),
+        path=str(path),
     )
+    return True
+
+
+# Per-event outcome from the updates API: (ok, error, retryable)
+EventOutcome = tuple[bool, str, bool]
+
 
+async def _post_events(events: list[dict]) -> Optional[list[EventOutcome]]:
+    """POST a batch of events; return one outcome per event, in order.
 
-def push_updates() -> None:
-    """Push pending updates from updates_queue.json to the Seedor API.
-    Events that fail after retries are moved to the dead-letter queue.
+    Uses the per-event `results` of the updates API. Returns None when the
+    API does not send them and the batch partially failed (callers then
+    resend events one by one to find out which).
     """
-    if not UPDATES_PATH.exists():
-        log.info("No updates file found")
-        return
+    result = await _api_request("POST", UPDATES_API_PATH, {"events": events})
+    results = result.get("results")
+    if isinstance(results, list) and len(results) == len(events):
+        outcomes: list[EventOutcome] = [(False, "No result for event", True)] * len(events)
+        for r in results:
+            index = r.get("index")
+            if isinstance(index, int) and 0 <= index < len(events):
+                outcomes[index] = (bool(r.get("ok")), r.get("error") or "", bool(r.get("retryable")))
+        return outcomes
+
+    processed = result.get("processed", 0)
+    if not isinstance(processed, int) or isinstance(processed, bool):
+        processed = 0
+    if processed >= len(events):
+        return [(True, "", False)] * len(events)
+    if len(events) == 1:
+        return [(False, f"API returned 0 processed: {result.get('errors', [])}", False)]
+    return None
+
 
-    with open(UPDATES_PATH, "r", encoding="utf-8") as f:
+# (status, error, retryable): status is "ok" | "failed" | "deferred"
+_PushStatus = tuple[str, str, bool]
+
+
+def _api_status(outcome: EventOutcome) -> _PushStatus:
+    ok, error, retryable = outcome
+    return ("ok", "", False) if ok else ("failed", error, retryable)
+
+
+def _raised_status(e: Exception, size: int) -> _PushStatus:
+    """Status of the events of a request that raised instead of answering."""
+    if isinstance(e, CircuitOpenError):
+        return ("deferred", "circuit open", False)
+    log.error("Batch push failed after retries", size=size, error=str(e))
+    # API unreachable / erroring: keep the events journaled, don't dead-letter
+    return ("deferred" if classify_error(e)[0] else "failed", str(e), False)
+
+
+async def _push_batch(batch: list[dict]) -> list[tuple[str, str]]:
+    """Push one batch. Returns ("ok" | "failed" | "deferred", error) per event.
+
+    A request that raises only decides the status of the events it carried:
+    outcomes the API already reported for other events are kept.
+    """
+    try:
+        outcomes = await _post_events(batch)
+    except Exception as e:
+        return [_raised_status(e, len(batch))[:2]] * len(batch)
+
+    if outcomes is None:
+        log.info("No per-event results from API, resending batch individually", size=len(batch))
+        statuses: list[_PushStatus] = []
+        for n, event in enumerate(batch):
+            try:
+                single = await _post_events([event])
+            except CircuitOpenError as e:
+                # The rest would be refused as well: leave them journaled
+                statuses.extend([_raised_status(e, 1)] * (len(batch) - n))
+                break
+            except Exception as e:
+                statuses.append(_raised_status(e, 1))
+                continue
+            statuses.append(_api_status(single[0] if single else (False, "No result for event", False)))
+    else:
+        statuses = [_api_status(outcome) for outcome in outcomes]
+
+    # Unexpected server-side errors (e.g. DB hiccup) get one more try
+    retry_idx = [i for i, (status, _, retryable) in enumerate(statuses) if status == "failed" and retryable]
+    if retry_idx:
         try:
-            queue = json.load(f)
-        except json.JSONDecodeError:
-            log.warning("updates_queue.json is malformed, skipping")
-            return
+            again = await _post_events([batch[i] for i in retry_idx])
+        except Exception as e:
+            raised = _raised_status(e, len(retry_idx))
+            for i in retry_idx:
+                statuses[i] = raised
+        else:
+            if again is not None:
+                for i, outcome in zip(retry_idx, again):
+                    statuses[i] = _api_status(outcome)
 
-    events = queue.get("events", [])
-    if not events:
-        log.info("No events in queue")
-        return
+    return [(status, error) for status, error, _ in statuses]
+
+
+async def push_updates() -> None:
+    """Push queued events from the updates journal to the Seedor API.
+
+    Events are sent in batches of SEEDOR_PUSH_BATCH_SIZE, with up to
+    SEEDOR_PUSH_CONCURRENCY batches in flight. Only the events the API
+    reports as failed are moved to the dead-letter queue; if the circuit
+    opens mid-run, the rest stay in the journal for the next cycle.
+    """
+    await asyncio.to_thread(updates_journal.migrate_legacy, UPDATES_PATH)
+    try:
+        with updates_journal.consumer(JOURNAL_CONSUMER) as consumer:
+            await _drain_journal(consumer)
+    except JournalBusyError:
+        log.info("Updates journal is being drained by another process, skipping")
 
-    log.info("Pushing events to API", count=len(events))
 
-    # Process events individually so failures don't block the whole batch
+async def _drain_journal(consumer: JournalConsumer) -> None:
+    started = time.monotonic()
     succeeded = 0
     failed = 0
-
-    for event in events:
-        try:
-            result = _api_request("POST", "/api/telegram/updates", {"events": [event]})
-            processed = result.get("processed", 0)
-            if processed > 0:
+    deferred = 0
+    semaphore = asyncio.Semaphore(PUSH_CONCURRENCY)
+
+    async def _run(batch: list[dict]) -> list[tuple[str, str]]:
+        async with semaphore:
+            return await _push_batch(batch)
+
+    while True:
+        records = consumer.read(max_events=PUSH_READ_LIMIT)
+        if not records:
+            break
+        events = [record.event for record in records]
+        batches = [events[i:i + PUSH_BATCH_SIZE] for i in range(0, len(events), PUSH_BATCH_SIZE)]
+        log.info(
+            "Pushing events to API",
+            count=len(events),
+            batches=len(batches),
+            batch_size=PUSH_BATCH_SIZE,
+            concurrency=PUSH_CONCURRENCY,
+        )
+        per_batch = await asyncio.gather(*(_run(batch) for batch in batches))
+        outcomes = [outcome for batch_outcomes in per_batch for outcome in batch_outcomes]
+
+        # Ack the prefix up to the first deferred event; everything after it
+        # is read again next cycle (resending successes is idempotent).
+        acked = len(records)
+        dead: list[tuple[dict, str]] = []
+        for i, (event, (status, error)) in enumerate(zip(events, outcomes)):
+            if status == "deferred":
+                acked = i
+                break
+            if status == "ok":
                 succeeded += 1
-                log.info(
-                    "Event pushed successfully",
-                    event_type=event.get("type"),
-                )
             else:
-                errors = result.get("errors", [])
-                log.warning(
-                    "Event push returned 0 processed",
-                    event_type=event.get("type"),
-                    errors=errors,
-                )
-                dlq.add(event, error=f"API returned 0 processed: {errors}")
-                failed += 1
-        except Exception as e:
-            log.error(
-                "Event push failed after retries",
-                event_type=event.get("type"),
-                error=str(e),
-            )
-            dlq.add(event, error=str(e), retry_count=3)
-            failed += 1
-
-    # Clear the queue (failed events are now in DLQ)
-    with open(UPDATES_PATH, "w", encoding="utf-8") as f:
-        json.dump({"events": []}, f, indent=2, ensure_ascii=False)
+                log.warning("Event push failed", event_type=event.get("type"), error=error)
+                dead.append((event, error))
+        failed += dlq.add_many(dead, retry_count=3)
+        if acked:
+            consumer.ack(records[acked - 1].position)
+        if acked < len(records):
+            deferred = len(records) - acked
+            break
+
+    if succeeded + failed + deferred == 0:
+        log.info("No events in queue")
+        return
 
+    elapsed = time.monotonic() - started
+    metrics.incr("events_pushed", succeeded, outcome="ok")
+    metrics.incr("events_pushed", failed, outcome="failed")
+    metrics.incr("events_pushed", deferred, outcome="deferred")
+    metrics.observe("push_drain_seconds", elapsed)
     log.info(
         "Push complete",
         succeeded=succeeded,
         failed=failed,
+        deferred=deferred,
         dlq_size=dlq.size(),
+        drain_seconds=round(elapsed, 3),
+        events_per_second=round((succeeded + failed) / elapsed, 1) if elapsed > 0 else None,
     )
 
 
 def show_dlq_stats() -> None:
     """Display dead-letter queue statistics."""
     size = dlq.size()
-    log.info("Dead-letter queue stats", total_events=size)
+    log.info(
+        "Dead-letter queue stats",
+        total_events=size,
+        replayed=dlq.size("replayed"),
+        by_type=dlq.counts_by_type(),
+    )
 
     if size > 0:
+        for error, count in dlq.top_errors(limit=5):
+            log.info("DLQ top error", error=error, count=count)
+
         events = dlq.peek(limit=5)
         for i, entry in enumerate(events):
             log.info(
@@ -236,75 +449,264 @@ def show_dlq_stats() -> None:
                 error=entry.get("error"),
                 failed_at=entry.get("failed_at"),
                 retry_count=entry.get("retry_count"),
+                replay_attempts=entry.get("replay_attempts"),
             )
 
         if size > 5:
             log.info(f"... and {size - 5} more events")
 
 
+async def replay_dlq(event_type: str = "", error_like: str = "", limit: int = 0) -> None:
+    """Re-submit pending dead letters in rate-limited batches.
+
+    Each entry's outcome is recorded: replayed entries leave the pending
+    set, rejected ones keep their last replay error. Stops early (leaving
+    the rest pending) when the API is unreachable or the circuit opens.
+
+    Args:
+        event_type: Only replay this event type
+        error_like: Only replay entries whose error matches (SQL LIKE)
+        limit: Max entries to replay (0 = all)
+    """
+    started = time.monotonic()
+    replayed = 0
+    rejected = 0
+    stopped = False
+    after_id = 0
+    min_batch_seconds = DLQ_REPLAY_BATCH_SIZE / DLQ_REPLAY_RATE if DLQ_REPLAY_RATE > 0 else 0.0
+
+    log.info(
+        "DLQ replay starting",
+        pending=dlq.size(),
+        event_type=event_type or None,
+        error_like=error_like or None,
+        batch_size=DLQ_REPLAY_BATCH_SIZE,
+        rate_per_second=DLQ_REPLAY_RATE,
+    )
+
+    while not stopped:
+        batch_size = DLQ_REPLAY_BATCH_SIZE
+        if limit:
+            batch_size = min(batch_size, limit - replayed - rejected)
+            if batch_size <= 0:
+                break
+        entries = dlq.query(
+            event_type=event_type or None,
+            error_like=error_like or None,
+            after_id=after_id,
+            limit=batch_size,
+        )
+        if not entries:
+            break
+        after_id = entries[-1]["id"]
+
+        batch_started = time.monotonic()
+        outcomes = await _push_batch([entry["original_event"] for entry in entries])
+
+        ok_ids: list[int] = []
+        failures: list[tuple[int, str]] = []
+        for entry, (status, error) in zip(entries, outcomes):
+            if status == "ok":
+                ok_ids.append(entry["id"])
+            elif status == "failed":
+                failures.append((entry["id"], error))
+                log.warning("DLQ replay rejected", dlq_id=entry["id"], error=error)
+            else:
+                stopped = True  # API down: leave the rest pending
+        dlq.mark_replayed(ok_ids)
+        dlq.mark_replay_failed(failures)
+        replayed += len(ok_ids)
+        rejected += len(failures)
+
+        # Rate limit: at most DLQ_REPLAY_RATE events per second
+        wait = min_batch_seconds - (time.monotonic() - batch_started)
+        if wait > 0 and not stopped:
+            await asyncio.sleep(wait)
+
+    elapsed = time.monotonic() - started
+    log.info(
+        "DLQ replay complete" if not stopped else "DLQ replay stopped: API unavailable",
+        replayed=replayed,
+        rejected=rejected,
+        remaining=dlq.size(),
+        seconds=round(elapsed, 3),
+    )
+
+
+def _read_session_tenants() -> dict[str, int]:
+    """Return tenant_id → session count from the bot's sessions.json."""
+    return BotRegistry(str(SESSIONS_PATH)).tenant_session_counts()
+
+
+def _snapshot_mtime(tenant_id: str) -> Optional[float]:
+    return last_refreshed(str(snapshot_path(tenant_id)))
+
+
+def _snapshot_age(tenant_id: str) -> Optional[float]:
+    mtime = _snapshot_mtime(tenant_id)
+    return None if mtime is None else time.time() - mtime
+
+
 def run_daemon(tenant_id: str = "") -> None:
-    """Run sync_once every 60 seconds using schedule."""
-    import schedule
-    import time
+    """Run the sync sidecar until interrupted (see module docstring).
 
-    if not tenant_id:
-        log.critical("tenant_id required — pass --tenant <id>")
+    With a tenant_id only that tenant is synced; otherwise the tenants come
+    from sessions.json. Everything runs on one long-lived event loop so the
+    pooled API session (and its keep-alive connections) is reused.
+    """
+    try:
+        asyncio.run(_daemon(tenant_id))
+    except KeyboardInterrupt:
+        log.info("Daemon stopped by user")
+
+
+async def _daemon(tenant_id: str = "") -> None:
+    if not API_KEY:
+        log.critical(
+            "Required API key env var not set",
+            expected_envs="SEEDOR_API_KEY or TELEGRAM_SYNC_API_KEY",
+        )
         raise SystemExit(1)
 
-    SYNC_INTERVAL = int(os.environ.get("SEEDOR_SYNC_INTERVAL_SECONDS", "60"))
     PUSH_INTERVAL = int(os.environ.get("SEEDOR_PUSH_INTERVAL_MINUTES", "5"))
 
     log.info(
         "Daemon starting",
-        tenant_id=tenant_id,
-        sync_interval_seconds=SYNC_INTERVAL,
+        tenant_id=tenant_id or "(from sessions.json)",
+        sync_interval_seconds=SYNC_INTERVAL_SECONDS,
         push_interval_minutes=PUSH_INTERVAL,
     )
 
-    sync_once(tenant_id)
-    schedule.every(SYNC_INTERVAL).seconds.do(lambda: _safe_sync(tenant_id))
-    schedule.every(PUSH_INTERVAL).minutes.do(_safe_push)
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    # Mutated in place: the scheduler reads it on every round
+    active: set[str] = set()
+
+    async def _sync_tenant(tid: str) -> bool:
+        async def _fetch() -> bool:
+            try:
+                changed = await sync_once(tid)
+            except Exception as e:
+                log.error("Sync cycle failed", tenant_id=tid, error=str(e))
+                return False
+            scheduler.record_change(tid, changed)
+            return True
+
+        # Under the tenant's lease: a bot process may be fetching it right now
+        return await refresh_leases.run(tid, snapshot_path(tid), _fetch)
+
+    scheduler = RefreshScheduler(
+        refresh=_sync_tenant,
+        tenants=lambda: active,
+        # The sidecar sees no user activity: intervals follow the change rate only
+        activity_aware=False,
+        last_refreshed=_snapshot_mtime,
+    )
 
-    try:
+    async def _reload_tenants() -> None:
+        if tenant_id:
+            counts = {tenant_id: 1}
+        else:
+            counts = await asyncio.to_thread(_read_session_tenants)
+        added = [tid for tid in sorted(counts, key=lambda t: -counts[t]) if tid not in active]
+        removed = active - set(counts)
+        active.clear()
+        active.update(counts)
+        # New tenants with a missing or old snapshot go first, busiest first
+        for tid in added:
+            age = _snapshot_age(tid)
+            if age is None or age >= SYNC_INTERVAL_SECONDS:
+                scheduler.schedule_now(tid)
+        if added or removed:
+            log.info("Tenants updated", active=len(active), added=len(added), removed=len(removed))
+
+    sessions_changed = asyncio.Event()
+
+    async def _watch_sessions() -> None:
         while True:
-            schedule.run_pending()
-            time.sleep(1)
-    except KeyboardInterrupt:
-        log.info("Daemon stopped by user")
-
+            await sessions_changed.wait()
+            sessions_changed.clear()
+            try:
+                await _reload_tenants()
+            except Exception as e:
+                log.error("Could not reload tenants from sessions", error=str(e))
+
+    async def _push_loop() -> None:
+        while True:
+            await _safe_push()
+            await asyncio.sleep(PUSH_INTERVAL * 60)
 
-def _safe_sync(tenant_id: str = "") -> None:
-    """Wrapper for sync_once that catches and logs errors."""
+    await _reload_tenants()
+    watcher = None
+    if not tenant_id:
+        watcher = FileWatcher(SESSIONS_PATH, sessions_changed.set)
+        watcher.start()
+    tasks = [
+        asyncio.create_task(scheduler.run()),
+        asyncio.create_task(_watch_sessions()),
+        asyncio.create_task(_push_loop()),
+    ]
     try:
-        sync_once(tenant_id)
-    except Exception as e:
-        log.error("Sync cycle failed", error=str(e))
-
-
-def _safe_push() -> None:
+        await stop.wait()
+        log.info("Daemon stopping")
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await api.close()
+
+
+async def _safe_push() -> None:
     """Wrapper for push_updates that catches and logs errors."""
     try:
-        push_updates()
+        await push_updates()
     except Exception as e:
         log.error("Push cycle failed", error=str(e))
 
 
+async def _run_once(coro) -> None:
+    """Run a one-shot CLI coroutine and close the API session afterwards."""
+    try:
+        await coro
+    finally:
+        await api.close()
+
+
 # ─── CLI ───────────────────────────────────────────────────
-def _get_cli_tenant_id() -> str:
-    """Extract --tenant <id> from CLI args."""
-    if "--tenant" in sys.argv:
-        idx = sys.argv.index("--tenant")
+def _get_cli_arg(flag: str) -> str:
+    """Extract the value after `flag` from CLI args."""
+    if flag in sys.argv:
+        idx = sys.argv.index(flag)
         if idx + 1 < len(sys.argv):
             return sys.argv[idx + 1]
     return ""
 
 
+def _get_cli_tenant_id() -> str:
+    """Extract --tenant <id> from CLI args."""
+    return _get_cli_arg("--tenant")
+
+
 if __name__ == "__main__":
-    if "--dlq" in sys.argv:
+    if "--dlq-replay" in sys.argv:
+        asyncio.run(_run_once(replay_dlq(
+            event_type=_get_cli_arg("--type"),
+            error_like=_get_cli_arg("--error"),
+            limit=int(_get_cli_arg("--limit") or 0),
+        )))
+    elif "--dlq" in sys.argv:
         show_dlq_stats()
     elif "--push" in sys.argv:
-        push_updates()
+        asyncio.run(_run_once(push_updates()))
     elif "--daemon" in sys.argv:
         run_daemon(_get_cli_tenant_id())
     else:
-        sync_once(_get_cli_tenant_id())
+        asyncio.run(_run_once(sync_once(_get_cli_tenant_id())))
@@ -0,0 +1,210 @@
+"""
+update_processor.py — Concurrent, per-chat ordered, tenant-fair update processing
+=================================================================================
+By default python-telegram-bot handles one update at a time, so a single
+slow snapshot refresh or API call inside a handler stalls every user.
+FairUpdateProcessor (a PTB BaseUpdateProcessor) runs updates concurrently
+with three rules:
+
+  - per-chat ordering: updates of one chat run one after another, in
+    arrival order, so ConversationHandler state and the session registry
+    see a consistent sequence per user;
+  - a global cap of SEEDOR_UPDATE_CONCURRENCY updates running at once;
+  - weighted fair queuing across tenants (start-time fair queuing): when
+    updates wait for a slot, each tenant gets slots in proportion to its
+    weight (SEEDOR_TENANT_WEIGHTS, e.g. "tenantA=2,tenantB=1"; default 1),
+    so one farm's burst cannot starve the others. Chats without a
+    selected tenant share the "-" queue.
+
+PTB's own semaphore (BaseUpdateProcessor.process_update) would admit
+updates in plain FIFO order before we can reorder them, so it is sized
+far above the real cap and the cap is enforced here.
+
+Metrics: update_queue_wait_seconds{tenant} (time from arrival until the
+update starts running) and stats() (running, queued per tenant, chats
+with a backlog), registered as a collector.
+
+Usage:
+    processor = FairUpdateProcessor(tenant_of=lambda chat_id: registry.get_tenant_id(chat_id))
+    app = Application.builder().token(token).concurrent_updates(processor).build()
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from logger import get_logger
+from metrics import metrics
+
+log = get_logger("update_processor")
+
+UPDATE_CONCURRENCY = int(os.environ.get("SEEDOR_UPDATE_CONCURRENCY", "32"))
+
+NO_TENANT = "-"
+
+# Admission is done by FairUpdateProcessor itself (see module docstring)
+_PTB_SEMAPHORE_SIZE = 1_000_000
+
+_WAITING, _READY, _RUNNING, _CANCELLED = "waiting", "ready", "running", "cancelled"
+
+
+def parse_tenant_weights(raw: str) -> dict[str, float]:
+    """Parse "tenantA=2,tenantB=0.5" (invalid entries are ignored)."""
+    weights: dict[str, float] = {}
+    for item in raw.split(","):
+        tenant, _, value = item.partition("=")
+        try:
+            weight = float(value)
+        except ValueError:
+            continue
+        if tenant.strip() and weight > 0:
+            weights[tenant.strip()] = weight
+    return weights
+
+
+class _Ticket:
+    __slots__ = ("chat_id", "tenant", "future", "arrived", "state")
+
+    def __init__(self, chat_id: Optional[int], tenant: str, future: asyncio.Future):
+        self.chat_id = chat_id
+        self.tenant = tenant
+        self.future = future
+        self.arrived = time.monotonic()
+        self.state = _WAITING
+
+
+class FairUpdateProcessor(BaseUpdateProcessor):
+    """Concurrent update processor with per-chat ordering and tenant fairness."""
+
+    def __init__(
+        self,
+        tenant_of: Callable[[int], Optional[str]],
+        max_concurrency: int = UPDATE_CONCURRENCY,
+        weights: Optional[dict[str, float]] = None,
+    ):
+        super().__init__(_PTB_SEMAPHORE_SIZE)
+        self._tenant_of = tenant_of
+        self._max_concurrency = max_concurrency
+        self._weights = (
+            weights if weights is not None
+            else parse_tenant_weights(os.environ.get("SEEDOR_TENANT_WEIGHTS", ""))
+        )
+        self._running = 0
+        # chat_id → updates waiting behind the one currently queued/running
+        self._chats: dict[int, deque[_Ticket]] = {}
+        # (start tag, seq, ticket) — served in tag order
+        self._ready: list[tuple[float, int, _Ticket]] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: dict[str, float] = {}
+        self._queued: dict[str, int] = {}
+        self.processed = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    # ─── Processing ───────────────────────────────────────
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat_id = None
+        if isinstance(update, Update) and update.effective_chat is not None:
+            chat_id = update.effective_chat.id
+        tenant = (self._tenant_of(chat_id) if chat_id is not None else None) or NO_TENANT
+        ticket = _Ticket(chat_id, tenant, asyncio.get_running_loop().create_future())
+        self._queued[tenant] = self._queued.get(tenant, 0) + 1
+
+        backlog = self._chats.get(chat_id) if chat_id is not None else None
+        if backlog is not None:
+            backlog.append(ticket)  # runs after the chat's earlier updates
+        else:
+            if chat_id is not None:
+                self._chats[chat_id] = deque()
+            self._make_ready(ticket)
+
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            self._cancel(ticket)
+            coroutine.close()
+            raise
+        metrics.observe("update_queue_wait_seconds", time.monotonic() - ticket.arrived, tenant=tenant)
+
+        try:
+            await coroutine
+        finally:
+            self._running -= 1
+            self.processed += 1
+            self._advance_chat(ticket.chat_id)
+            self._dispatch()
+
+    # ─── Scheduling ───────────────────────────────────────
+
+    def _make_ready(self, ticket: _Ticket) -> None:
+        """Give the ticket a fair-queuing tag and try to start it."""
+        weight = self._weights.get(ticket.tenant, 1.0)
+        start = max(self._virtual_time, self._last_finish.get(ticket.tenant, 0.0))
+        self._last_finish[ticket.tenant] = start + 1.0 / weight
+        ticket.state = _READY
+        heapq.heappush(self._ready, (start, next(self._seq), ticket))
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._running < self._max_concurrency and self._ready:
+            start, _, ticket = heapq.heappop(self._ready)
+            if ticket.state == _CANCELLED:
+                continue
+            self._virtual_time = start
+            self._running += 1
+            self._queued[ticket.tenant] -= 1
+            ticket.state = _RUNNING
+            ticket.future.set_result(None)
+        if not self._ready:
+            # Idle: forget old tags so a tenant's past usage isn't held against it
+            if self._running == 0:
+                self._virtual_time = 0.0
+                self._last_finish.clear()
+
+    def _advance_chat(self, chat_id: Optional[int]) -> None:
+        """Let the chat's next update (if any) compete for a slot."""
+        if chat_id is None:
+            return
+        backlog = self._chats.get(chat_id)
+        if backlog is None:
+            return
+        if backlog:
+            self._make_ready(backlog.popleft())
+        else:
+            del self._chats[chat_id]
+
+    def _cancel(self, ticket: _Ticket) -> None:
+        if ticket.state == _RUNNING:
+            # Granted just as we were cancelled: give the slot back
+            self._running -= 1
+            self._advance_chat(ticket.chat_id)
+            self._dispatch()
+            return
+        self._queued[ticket.tenant] -= 1
+        if ticket.state == _WAITING:
+            self._chats[ticket.chat_id].remove(ticket)
+        else:  # ready: it was the chat's head, so the chat moves on
+            self._advance_chat(ticket.chat_id)
+        ticket.state = _CANCELLED
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "running": self._running,
+            "max_concurrency": self._max_concurrency,
+            "queued": {tenant: n for tenant, n in self._queued.items() if n},
+            "chats_with_backlog": sum(1 for backlog in self._chats.values() if backlog),
+            "processed": self.processed,
+        }
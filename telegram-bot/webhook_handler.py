@@ -2,7 +2,8 @@
 webhook_handler.py — Webhook server for Seedor Telegram Bot
 ============================================================
 Used when deploying to Railway (production).
-Receives Telegram updates via POST /webhook.
+Receives Telegram updates via POST /webhook and task notifications from
+the Seedor app via POST /internal/notifications.
 
 A.2: In production (Railway), WEBHOOK_URL and WEBHOOK_SECRET are mandatory.
      Process must exit(1) if either is missing.
@@ -13,12 +14,15 @@ Usage:
 """
 
 import asyncio
+import hmac
 import os
 import sys
+import time
 
 from aiohttp import web
 
 from logger import get_logger
+from metrics import metrics
 
 log = get_logger("webhook")
 
@@ -26,19 +30,64 @@ log = get_logger("webhook")
 PORT = int(os.environ.get("PORT", "8443"))
 WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
 WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+# Shared with the Seedor app (TELEGRAM_NOTIFY_SECRET there)
+NOTIFY_SECRET = os.environ.get("SEEDOR_NOTIFY_SECRET", "") or WEBHOOK_SECRET
+
+# Set once the application is started and the webhook registered
+_startup = {"ready": False}
 
 
 async def health_handler(request: web.Request) -> web.Response:
     """GET /health — healthcheck for Railway."""
-    return web.json_response({"status": "ok", "mode": "webhook"})
+    return web.json_response({"status": "ok", "mode": "webhook", "ready": _startup["ready"]})
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """GET /metrics — in-process counters (requires Bearer WEBHOOK_SECRET)."""
+    auth = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(auth.encode(), f"Bearer {WEBHOOK_SECRET}".encode()):
+        return web.Response(status=403, text="Forbidden")
+    return web.json_response(metrics.snapshot())
+
+
+def make_notifications_handler(notifications):
+    """POST /internal/notifications — enqueue notification events.
 
+    Body: {"events": [{"id", "type", "message", "workers", ...}, ...]}
+    (a single event object is accepted too). Requires Bearer
+    SEEDOR_NOTIFY_SECRET (defaults to WEBHOOK_SECRET). Events are spooled to
+    disk before 202 is returned; delivery happens right after.
+    """
+
+    async def notifications_handler(request: web.Request) -> web.Response:
+        auth = request.headers.get("Authorization", "")
+        if not NOTIFY_SECRET or not hmac.compare_digest(auth.encode(), f"Bearer {NOTIFY_SECRET}".encode()):
+            return web.Response(status=403, text="Forbidden")
+        try:
+            body = await request.json()
+        except ValueError:
+            return web.json_response({"error": "Invalid JSON"}, status=400)
+        events = body.get("events") if isinstance(body, dict) and "events" in body else [body]
+        if not isinstance(events, list) or not all(
+            isinstance(e, dict) and isinstance(e.get("type"), str) for e in events
+        ):
+            return web.json_response({"error": "Expected {events: [{type, ...}]}"}, status=400)
+        accepted = notifications.put(events)
+        return web.json_response({"accepted": accepted, "total": len(events)}, status=202)
 
-async def run_webhook(app) -> None:
+    return notifications_handler
+
+
+async def run_webhook(app, notifications=None) -> None:
     """Start the webhook server with the given telegram Application.
 
     A.2: Strict validation — both WEBHOOK_URL and WEBHOOK_SECRET must be set.
     Updates are pushed to app.update_queue for processing by PTB's internal loop.
-    Full PTB lifecycle: initialize → start → (run) → stop → shutdown.
+    The port is bound before the application initializes, so updates are
+    accepted (and queued) from the first second of a deploy. With
+    `notifications` (a NotificationQueue), POST /internal/notifications
+    feeds it. Full PTB lifecycle: initialize → start → post_init → (run) →
+    stop → shutdown → post_shutdown.
     """
     from telegram import Update
 
@@ -81,33 +130,66 @@ async def run_webhook(app) -> None:
 
     webapp.router.add_post("/webhook", webhook_handler)
     webapp.router.add_get("/health", health_handler)
+    webapp.router.add_get("/metrics", metrics_handler)
+    if notifications is not None:
+        webapp.router.add_post("/internal/notifications", make_notifications_handler(notifications))
     webapp.router.add_get("/", health_handler)
 
-    # A.2: Full PTB lifecycle — initialize + start
-    await app.initialize()
+    # Bind first: Railway's healthcheck and Telegram's retries hit the port
+    # while the bot is still initializing. Updates received meanwhile wait
+    # in app.update_queue and are handled once the application starts.
+    started = time.monotonic()
+    phase_started = started
 
-    # Set the webhook on Telegram's side
-    await app.bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
-    log.info("Webhook set", url=WEBHOOK_URL)
-
-    # Start PTB background tasks (post_init, notification poller, snapshot loop)
-    await app.start()
+    def _phase_done(phase: str) -> None:
+        nonlocal phase_started
+        now = time.monotonic()
+        log.info("Startup phase done", phase=phase, seconds=round(now - phase_started, 3))
+        metrics.set_gauge("startup_phase_seconds", round(now - phase_started, 3), phase=phase)
+        phase_started = now
 
     runner = web.AppRunner(webapp)
     await runner.setup()
     site = web.TCPSite(runner, "0.0.0.0", PORT)
     await site.start()
     log.info("Webhook server started", port=PORT)
+    _phase_done("bind")
 
-    # Keep running until interrupted
     try:
+        # A.2: Full PTB lifecycle — initialize + start
+        await app.initialize()
+        _phase_done("initialize")
+
+        # Start PTB's update processing (drains the updates spooled above)
+        await app.start()
+        _phase_done("start")
+
+        # PTB only runs post_init from run_polling/run_webhook: call it here
+        # (notification dispatcher, tenant warmup, snapshot loop)
+        if app.post_init:
+            await app.post_init(app)
+        _phase_done("post_init")
+
+        # Set the webhook on Telegram's side
+        await app.bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET)
+        log.info("Webhook set", url=WEBHOOK_URL)
+        _phase_done("set_webhook")
+
+        _startup["ready"] = True
+        log.info("Bot ready", seconds=round(time.monotonic() - started, 3))
+
+        # Keep running until interrupted
         await asyncio.Event().wait()
     except (KeyboardInterrupt, SystemExit):
         pass
     finally:
         log.info("Shutting down webhook server")
-        await app.bot.delete_webhook()
+        if _startup["ready"]:
+            await app.bot.delete_webhook()
         # A.2: Full PTB shutdown lifecycle — stop + shutdown
-        await app.stop()
+        if app.running:
+            await app.stop()
         await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
         await runner.cleanup()